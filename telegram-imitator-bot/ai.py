@@ -1,18 +1,24 @@
 import json
-import aiohttp
 import logging
 import random
-from typing import Dict, Any, List
-from collections import Counter
-from style_analysis import analyze_style, adjust_punctuation
+from typing import Dict, Any, List, Awaitable, Callable, Optional
+from corpus import Corpus
+from style_analysis import adjust_punctuation, StyleStats
 from html_parser import load_style_from_html 
+from llm_client import llm_client
+from llm_scheduler import llm_scheduler
+from response_cache import response_cache, make_key
+from retrieval import retrieval_indexes
+from prompt_builder import PromptTemplate, estimate_tokens
 
 logger = logging.getLogger(__name__)
 
-from config import OPENROUTER_API_KEY
+from config import OPENROUTER_API_KEY, PROMPT_HISTORY_MESSAGES, RETRIEVAL_EXAMPLES
 
 OPENROUTER_API_URL = "https://openrouter.ai/api/v1/chat/completions"
 
+PartialCallback = Callable[[str], Awaitable[None]]
+
 class StyleAdapter:
     def __init__(self, style_data: Dict[str, Any]):
         self.style_data = style_data
@@ -33,58 +39,73 @@ async def generate_response(
     target: str,
     prompt: str,
     user_states: Dict[int, Dict[str, Any]],
-    chat_memory: Dict[int, Dict[str, List[Dict[str, str]]]]
+    chat_memory: Dict[int, Dict[str, List[Dict[str, str]]]],
+    on_partial: Optional[PartialCallback] = None
 ) -> str:
     try:
+        cache_key = make_key(user_id, target, prompt, chat_memory.get(user_id, {}).get("history", [])[-PROMPT_HISTORY_MESSAGES:])
+        cached_reply = response_cache.get(cache_key)
+        if cached_reply is not None:
+            logger.debug(f"Ответ для user_id {user_id} взят из кэша.")
+            return cached_reply
+
         state = user_states.get(user_id, {})
-        style_samples = state.get("style_samples", [])
-
-        style_data = state.get("style_data", {})
-        if not style_data and len(style_samples) >= 5:
-            style_data = {
-                "keywords": [word for word, _ in Counter([
-                    w.lower() for msg in style_samples 
-                    for w in msg.split() if len(w) > 3
-                ]).most_common(5)],
-                "avg_len": sum(len(m) for m in style_samples) // len(style_samples)
-            }
-
-        system_prompt = f"""Ты точно имитируешь {target}. Правила:
-1. Отвечай КОРОТКО ({style_data.get('avg_len', 50)} символов максимум)
-2. Используй характерные слова: {', '.join(style_data.get('keywords', []))[:50]}
-3. Избегай общих фраз ("Что ты хотел?", "Повторяю")
-4. Если не понял вопрос — скажи "Че?" или "Не понял" 
-5. Никогда не повторяй фразы дословно из примеров
-
-Примеры стиля:
-{random.sample(style_samples, min(2, len(style_samples))) if style_samples else "Нет данных"}
-
-Текущий диалог:
-{chat_memory.get(user_id, {}).get("history", [])[-2:]}
-
-Задача: ответь на "{prompt}" как {target}. Только 1 предложение!"""
-
-        async with aiohttp.ClientSession() as session:
-            response = await session.post(
-                OPENROUTER_API_URL,
-                headers={"Authorization": f"Bearer {OPENROUTER_API_KEY}"},
-                json={
-                    "model": "anthropic/claude-3-haiku",
-                    "messages": [{"role": "system", "content": system_prompt},
-                                {"role": "user", "content": prompt}],
-                    "temperature": 0.3,
-                    "max_tokens": 100,
-                    "stop_sequences": ["\n"]
-                }
-            )
-
-            reply = (await response.json())["choices"][0]["message"]["content"]
-
-            adapter = StyleAdapter(style_data)
-            reply = adapter.make_coherent(reply, chat_memory.get(user_id, {}).get("history", []))
-            reply = adjust_punctuation(reply[:150])
-
-            return reply if reply.strip() else "🤷‍♂️"
+        style_samples = state.get("style_samples") or Corpus()
+        history = chat_memory.get(user_id, {}).get("history", [])
+
+        template = state.get("prompt_template")
+        if template is None or template.target != target:
+            template = state["prompt_template"] = PromptTemplate(target, state.get("style_data"), style_samples)
+
+        try:
+            examples = await retrieval_indexes.search(user_id, target, prompt, RETRIEVAL_EXAMPLES)
+        except Exception as e:
+            logger.warning(f"Не удалось подобрать примеры для user_id {user_id}: {e}")
+            examples = []
+        if not examples and style_samples:
+            examples = random.sample(style_samples, min(RETRIEVAL_EXAMPLES, len(style_samples)))
+
+        system_prompt = template.render(examples, history)
+        logger.debug(f"Системный промпт для user_id {user_id}: ~{estimate_tokens(system_prompt)} токенов.")
+
+        payload = {
+            "model": "anthropic/claude-3-haiku",
+            "messages": [{"role": "system", "content": system_prompt},
+                        {"role": "user", "content": prompt}],
+            "temperature": 0.3,
+            "max_tokens": 100,
+            "stop_sequences": ["\n"]
+        }
+        headers = {"Authorization": f"Bearer {OPENROUTER_API_KEY}"}
+
+        async def complete() -> str:
+            if on_partial is None:
+                data = await llm_client.post_json(OPENROUTER_API_URL, headers=headers, payload=payload)
+                return data["choices"][0]["message"]["content"]
+
+            # при повторе запроса планировщиком текст собирается заново
+            parts: List[str] = []
+            async for chunk in llm_client.stream_json(OPENROUTER_API_URL, headers=headers,
+                                                      payload={**payload, "stream": True}):
+                if "error" in chunk:
+                    raise RuntimeError(f"Ошибка в потоке ответа: {chunk['error']}")
+                choices = chunk.get("choices") or [{}]
+                delta = (choices[0].get("delta") or {}).get("content")
+                if delta:
+                    parts.append(delta)
+                    await on_partial("".join(parts))
+            return "".join(parts)
+
+        reply = await llm_scheduler.submit(user_id, complete)
+
+        adapter = StyleAdapter(template.style_data)
+        reply = adapter.make_coherent(reply, history)
+        reply = adjust_punctuation(reply[:150])
+
+        if not reply.strip():
+            return "🤷‍♂️"
+        response_cache.put(cache_key, reply)
+        return reply
 
     except Exception as e:
         logger.error(f"Error: {str(e)}")
@@ -92,15 +113,26 @@ async def generate_response(
 
 def update_style_data(user_id: int, new_message: str, user_states: Dict):
     if user_id not in user_states:
-        user_states[user_id] = {"style_samples": [], "style_data": {}}
+        user_states[user_id] = {"style_samples": Corpus(), "style_data": {}}
+
+    state = user_states[user_id]
+    state["style_samples"].append(new_message)
+
+    stats = state.get("style_stats")
+    if stats is None:
+        stats = state["style_stats"] = StyleStats().update(state["style_samples"])
+    else:
+        stats.add(new_message)
 
-    user_states[user_id]["style_samples"].append(new_message)
-    if len(user_states[user_id]["style_samples"]) % 10 == 0:
-        user_states[user_id]["style_data"] = analyze_style(user_states[user_id]["style_samples"])
+    if len(state["style_samples"]) % 10 == 0:
+        state["style_data"] = stats.finalize()
+        state.pop("prompt_template", None)
 
 def init_user_style(user_id: int, html_path: str, target: str, user_states: Dict):
-    style_samples = load_style_from_html(html_path, target)
+    style_samples = Corpus(load_style_from_html(html_path, target))
+    stats = StyleStats().update(style_samples)
     user_states[user_id] = {
         "style_samples": style_samples,
-        "style_data": analyze_style(style_samples)
+        "style_data": stats.finalize(),
+        "style_stats": stats
     }
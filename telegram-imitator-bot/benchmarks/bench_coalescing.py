@@ -0,0 +1,91 @@
+# Сколько запросов к LLM уходит при сериях сообщений: по запросу на сообщение
+# против склейки MessageCoalescer. "Модель" — задержка внутри LLMScheduler,
+# так что отмена устаревших генераций проходит тот же путь, что в боте.
+#
+#   python benchmarks/bench_coalescing.py [пользователей] [серий] [сообщений_в_серии]
+
+import asyncio
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from coalescer import MessageCoalescer
+from llm_scheduler import LLMScheduler
+
+LLM_LATENCY = 0.6
+WINDOW = 0.2
+
+
+class Upstream:
+    def __init__(self):
+        self.started = 0
+        self.finished = 0
+
+    async def call(self):
+        self.started += 1
+        await asyncio.sleep(LLM_LATENCY * random.uniform(0.7, 1.3))
+        self.finished += 1
+        return "ок"
+
+
+async def user_session(send, user_id: int, bursts: int, burst_size: int):
+    for _ in range(bursts):
+        for _ in range(burst_size):
+            send(user_id, f"сообщение {user_id}")
+            await asyncio.sleep(random.uniform(0.02, 0.4))
+        await asyncio.sleep(LLM_LATENCY * 3)
+
+
+async def run(users: int, bursts: int, burst_size: int, coalesce: bool):
+    upstream = Upstream()
+    scheduler = LLMScheduler(max_in_flight=64, rate_per_sec=1000, burst=1000)
+    await scheduler.start()
+    replies = []
+    tasks = set()
+
+    async def generate(user_id, batch):
+        return await scheduler.submit(user_id, upstream.call)
+
+    async def deliver(user_id, batch, result):
+        replies.append((user_id, len(batch)))
+
+    if coalesce:
+        coalescer = MessageCoalescer(generate, deliver, window=WINDOW)
+        send = lambda user_id, text: coalescer.submit(user_id, text)
+    else:
+        async def handle(user_id, text):
+            await deliver(user_id, [text], await generate(user_id, [text]))
+
+        def send(user_id, text):
+            task = asyncio.create_task(handle(user_id, text))
+            tasks.add(task)
+            task.add_done_callback(tasks.discard)
+
+    started = time.perf_counter()
+    await asyncio.gather(*(user_session(send, user_id, bursts, burst_size) for user_id in range(users)))
+    while tasks or (coalesce and coalescer._tasks):
+        await asyncio.sleep(0.05)
+    elapsed = time.perf_counter() - started
+    await scheduler.stop()
+
+    answered = sum(size for _, size in replies)
+    label = "склейка" if coalesce else "без склейки"
+    print(f"{label:12} запросов начато {upstream.started:4}, доведено {upstream.finished:4}, "
+          f"ответов {len(replies):4} на {answered} сообщений, {elapsed:.1f} с")
+
+
+def main():
+    users = int(sys.argv[1]) if len(sys.argv) > 1 else 20
+    bursts = int(sys.argv[2]) if len(sys.argv) > 2 else 3
+    burst_size = int(sys.argv[3]) if len(sys.argv) > 3 else 4
+    random.seed(1)
+    asyncio.run(run(users, bursts, burst_size, coalesce=False))
+    random.seed(1)
+    asyncio.run(run(users, bursts, burst_size, coalesce=True))
+
+
+if __name__ == "__main__":
+    main()
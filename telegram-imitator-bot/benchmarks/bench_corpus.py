@@ -0,0 +1,70 @@
+# Память и скорость: сообщения выгрузки списками строк против Corpus
+# (общий словарь + array('I')). Размер pickle — это то, что воркер импорта
+# передает боту.
+#
+#   python benchmarks/bench_corpus.py [сообщений] [авторов]
+
+import os
+import pickle
+import sys
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from bench_style import group_chat
+from corpus import Corpus, Vocabulary
+from style_analysis import analyze_authors, count_report_words
+
+
+def build_lists(by_author):
+    # копии строк, как если бы они только что пришли из парсера
+    return {name: [(" " + msg)[1:] for msg in messages] for name, messages in by_author.items()}
+
+
+def build_corpora(by_author):
+    vocabulary = Vocabulary()
+    return {name: Corpus(messages, vocabulary) for name, messages in by_author.items()}
+
+
+def traced_peak(func, *args):
+    tracemalloc.start()
+    result = func(*args)
+    current, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return result, current
+
+
+def analyze(authors):
+    stats = analyze_authors(authors)
+    return {name: (stats[name].finalize(), count_report_words(messages).most_common(5))
+            for name, messages in authors.items()}
+
+
+def timed(func, *args):
+    started = time.perf_counter()
+    result = func(*args)
+    return result, time.perf_counter() - started
+
+
+def main():
+    messages = int(sys.argv[1]) if len(sys.argv) > 1 else 50_000
+    authors = int(sys.argv[2]) if len(sys.argv) > 2 else 40
+    by_author = group_chat(messages, authors)
+
+    lists, lists_memory = traced_peak(build_lists, by_author)
+    corpora, corpora_memory = traced_peak(build_corpora, by_author)
+    _, build_time = timed(build_corpora, by_author)
+
+    print(f"{messages} сообщений, {authors} авторов")
+    print(f"память: списки {lists_memory / 2**20:.1f} МБ, корпуса {corpora_memory / 2**20:.1f} МБ (сборка {build_time:.2f} с)")
+    print(f"pickle: списки {len(pickle.dumps(lists)) / 2**20:.1f} МБ, корпуса {len(pickle.dumps(corpora)) / 2**20:.1f} МБ")
+
+    old, old_time = timed(analyze, lists)
+    new, new_time = timed(analyze, corpora)
+    print(f"анализ: списки {old_time:.2f} с, корпуса {new_time:.2f} с, стиль совпадает: "
+          f"{all(old[name][0] == new[name][0] for name in by_author)}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,93 @@
+# Скачивание экспорта и разбор: через временный файл на диске (как раньше)
+# против буфера в памяти. Вместо файлового API Telegram — локальный aiohttp,
+# данные читаются из ответа кусками, как это делает aiogram.download_file.
+#
+#   python benchmarks/bench_download.py [сообщений]
+
+import asyncio
+import io
+import os
+import sys
+import tempfile
+import time
+
+import aiohttp
+from aiohttp import web
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from bench_json_import import write_html
+from import_pipeline import ImportPipeline, analyze_export
+
+CHUNK = 64 * 1024
+
+
+def written_bytes() -> int:
+    # запись на диск процессом (Linux); без /proc сравнение только по времени
+    try:
+        with open("/proc/self/io") as f:
+            return next(int(line.split()[1]) for line in f if line.startswith("write_bytes"))
+    except (OSError, StopIteration):
+        return 0
+
+
+async def download(session: aiohttp.ClientSession, url: str, destination):
+    async with session.get(url) as response:
+        async for chunk in response.content.iter_chunked(CHUNK):
+            destination.write(chunk)
+
+
+async def via_disk(session, url, pipeline, folder):
+    path = os.path.join(folder, "export_1_x.html")
+    with open(path, "wb") as f:
+        await download(session, url, f)
+    try:
+        return await pipeline.submit(analyze_export, path, 3)
+    finally:
+        os.remove(path)
+
+
+async def via_memory(session, url, pipeline, folder):
+    buffer = io.BytesIO()
+    await download(session, url, buffer)
+    return await pipeline.submit(analyze_export, buffer.getvalue(), 3, "messages.html")
+
+
+async def run(messages: int):
+    folder = tempfile.mkdtemp()
+    source = os.path.join(folder, "messages.html")
+    write_html(source, messages)
+    data = open(source, "rb").read()
+
+    async def serve(request):
+        return web.Response(body=data, content_type="text/html")
+
+    app = web.Application()
+    app.router.add_get("/file", serve)
+    runner = web.AppRunner(app)
+    await runner.setup()
+    site = web.TCPSite(runner, "127.0.0.1", 0)
+    await site.start()
+    url = f"http://127.0.0.1:{site._server.sockets[0].getsockname()[1]}/file"
+
+    pipeline = ImportPipeline(1, 10, "process")
+    await pipeline.start()
+    print(f"экспорт: {messages} сообщений, {len(data) / 1e6:.1f} МБ")
+    async with aiohttp.ClientSession() as session:
+        for name, func in (("диск", via_disk), ("память", via_memory)):
+            before = written_bytes()
+            started = time.perf_counter()
+            export = await func(session, url, pipeline, folder)
+            elapsed = time.perf_counter() - started
+            print(f"{name:7} {elapsed:.2f} с, записано на диск {(written_bytes() - before) / 1e6:.1f} МБ, "
+                  f"сообщений {export['total_messages']}")
+    await pipeline.stop()
+    await runner.cleanup()
+
+
+def main():
+    asyncio.run(run(int(sys.argv[1]) if len(sys.argv) > 1 else 50_000))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,99 @@
+# Повторная загрузка экспорта: полный импорт против кэша импортов.
+# Сравнивает время на тот же файл еще раз и на экспорт, дописанный
+# новыми сообщениями (разбирается только хвост), с полным импортом.
+#
+#   python benchmarks/bench_import_cache.py [сообщений] [новых_сообщений] [html|json]
+
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import database
+import import_cache
+from bench_json_import import write_html, write_json
+from import_pipeline import analyze_export, analyze_export_tail
+
+MIN_SAMPLES = 3
+
+
+def full_import(user_id: int, data: bytes, fmt: str):
+    export = analyze_export(data, MIN_SAMPLES, f"export.{fmt}")
+    for participant in export["participants"]:
+        database.merge_messages(
+            user_id, participant["name"], participant["messages"], participant["messages"].message_ids,
+            participant["stats"], participant["report"], MIN_SAMPLES
+        )
+    database.save_import(user_id, None, import_cache.fingerprint(data, fmt), export["your_name"], {
+        "your_count": len(export["your_messages"]),
+        "participants": [participant["name"] for participant in export["participants"]],
+    })
+
+
+def cached_import(user_id: int, data: bytes, fmt: str) -> str:
+    fingerprint = import_cache.fingerprint(data, fmt)
+    if database.find_import(user_id, content_hash=fingerprint["content_hash"]) is not None:
+        return "тот же файл"
+
+    candidates = database.get_prefix_candidates(user_id, fmt, len(data), 4)
+    base = import_cache.match_prefix(data, candidates)
+    if base is None:
+        full_import(user_id, data, fmt)
+        return "полный импорт"
+
+    tail = analyze_export_tail(data[base["prefix_size"]:], fmt, base["last_message_id"])
+    for name, messages in tail["authors"].items():
+        stats = tail["stats"].get(name)
+        database.merge_messages(
+            user_id, name, messages, messages.message_ids,
+            stats.to_dict() if stats else None, tail["reports"][name].to_dict(), MIN_SAMPLES
+        )
+    database.save_import(user_id, None, fingerprint, base["chat_name"], base["summary"])
+    return f"хвост, {sum(len(messages) for messages in tail['authors'].values())} сообщений"
+
+
+def timed(func, *args):
+    started = time.perf_counter()
+    result = func(*args)
+    return result, time.perf_counter() - started
+
+
+def main():
+    messages = int(sys.argv[1]) if len(sys.argv) > 1 else 100_000
+    added = int(sys.argv[2]) if len(sys.argv) > 2 else 1000
+    fmt = sys.argv[3] if len(sys.argv) > 3 else "html"
+    writer = write_json if fmt == "json" else write_html
+
+    directory = tempfile.mkdtemp()
+    old_path, new_path = os.path.join(directory, f"old.{fmt}"), os.path.join(directory, f"new.{fmt}")
+    writer(old_path, messages)
+    writer(new_path, messages + added)
+    with open(old_path, "rb") as f:
+        old = f.read()
+    with open(new_path, "rb") as f:
+        new = f.read()
+    print(f"экспорт {fmt}: {messages} сообщений, {len(old) / 2**20:.1f} МБ; дописан еще {added}")
+
+    database.DB_PATH = os.path.join(directory, "bench.db")
+    database.init_db()
+
+    _, full_time = timed(full_import, 1, old, fmt)
+    print(f"первая загрузка (полный импорт): {full_time:.2f} с")
+    how, same_time = timed(cached_import, 1, old, fmt)
+    print(f"тот же файл еще раз: {same_time * 1000:.1f} мс ({how})")
+    how, tail_time = timed(cached_import, 1, new, fmt)
+    print(f"дописанный экспорт: {tail_time * 1000:.1f} мс ({how})")
+    _, grown_time = timed(full_import, 2, new, fmt)
+    print(f"дописанный экспорт полным импортом: {grown_time:.2f} с, "
+          f"быстрее в {grown_time / tail_time:.0f} раз")
+
+    counts = "SELECT target, message_count FROM profiles WHERE user_id = ? ORDER BY target"
+    same = database.conn.execute(counts, (1,)).fetchall() == database.conn.execute(counts, (2,)).fetchall()
+    print(f"профили совпадают с полным импортом: {same}")
+
+
+if __name__ == "__main__":
+    main()
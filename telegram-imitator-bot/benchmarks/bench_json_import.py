@@ -0,0 +1,113 @@
+# Разбор одного и того же чата из HTML- и JSON-экспорта: пропускная
+# способность и пиковая память. Проверяет, что результат совпадает.
+#
+#   python benchmarks/bench_json_import.py [сообщений]
+
+import html
+import json
+import os
+import random
+import sys
+import tempfile
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from html_parser import iter_html_messages, parse_html
+from json_parser import iter_json_messages, parse_json
+
+SYLLABLES = ["ка", "ро", "ми", "ле", "ту", "ва", "но", "пре", "сти", "жу", "да", "го"]
+SENDERS = ["Алиса", "Боб", "Вася"]
+
+
+def make_chat(messages: int, seed: int = 1):
+    # сообщение — список кусков: строка или (тип сущности, текст)
+    rng = random.Random(seed)
+    vocabulary = ["".join(rng.choices(SYLLABLES, k=rng.randint(1, 4))) for _ in range(5000)]
+    for i in range(messages):
+        if i % 50 == 0:
+            yield i, None, None
+            continue
+        words = rng.choices(vocabulary, k=rng.randint(1, 20))
+        parts = [" ".join(words) + rng.choice(["", " <3", " & co", "!"])]
+        if rng.random() < 0.2:
+            parts += [" ", (rng.choice(["bold", "italic", "link"]), rng.choice(vocabulary)), " ок"]
+        yield i, rng.choice(SENDERS), parts
+
+
+def write_html(path: str, messages: int):
+    tags = {"bold": "strong", "italic": "em", "link": "a"}
+    with open(path, "w", encoding="utf-8") as f:
+        f.write('<!DOCTYPE html><html><head><meta charset="utf-8"/></head><body><div class="page_wrap">'
+                '<div class="page_header"><div class="content"><div class="text bold">Алиса</div></div></div>'
+                '<div class="page_body chat_page"><div class="history">\n')
+        for i, sender, parts in make_chat(messages):
+            if sender is None:
+                f.write(f'<div class="message service" id="message{i}"><div class="body details">1 января</div></div>\n')
+                continue
+            text = "".join(
+                html.escape(part, quote=False) if isinstance(part, str)
+                else f"<{tags[part[0]]}>{html.escape(part[1])}</{tags[part[0]]}>"
+                for part in parts
+            )
+            f.write(f'<div class="message default clearfix" id="message{i}"><div class="body">'
+                    f'<div class="pull_right date details" title="01.01.2024 12:00:00">12:00</div>'
+                    f'<div class="from_name">{sender}</div><div class="text">{text}</div></div></div>\n')
+        f.write('</div></div></div></body></html>')
+
+
+def write_json(path: str, messages: int):
+    with open(path, "w", encoding="utf-8") as f:
+        f.write('{\n "name": "Алиса",\n "type": "personal_chat",\n "id": 4242,\n "messages": [')
+        for i, sender, parts in make_chat(messages):
+            if sender is None:
+                message = {"id": i, "type": "service", "date": "2024-01-01T12:00:00", "action": "pin_message"}
+            else:
+                text = parts[0] if len(parts) == 1 else [
+                    part if isinstance(part, str) else {"type": part[0], "text": part[1]} for part in parts
+                ]
+                message = {"id": i, "type": "message", "date": "2024-01-01T12:00:00",
+                           "from": sender, "from_id": f"user{SENDERS.index(sender)}", "text": text}
+            f.write(("\n  " if i == 0 else ",\n  ") + json.dumps(message, ensure_ascii=False, indent=1))
+        f.write("\n ]\n}\n")
+
+
+def timed(func, path: str):
+    started = time.perf_counter()
+    result = func(path)
+    return result, time.perf_counter() - started
+
+
+def peak_memory(records) -> float:
+    # пик памяти при чтении потоком, без накопления сообщений; tracemalloc
+    # сильно замедляет разбор, поэтому время меряется отдельно
+    tracemalloc.start()
+    for _ in records:
+        pass
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return peak
+
+
+def main():
+    messages = int(sys.argv[1]) if len(sys.argv) > 1 else 200_000
+    folder = tempfile.mkdtemp()
+    html_path, json_path = os.path.join(folder, "messages.html"), os.path.join(folder, "result.json")
+    write_html(html_path, messages)
+    write_json(json_path, messages)
+
+    results = {}
+    for name, func, path in (("HTML", parse_html, html_path), ("JSON", parse_json, json_path)):
+        result, elapsed = timed(func, path)
+        size = os.path.getsize(path) / 1e6
+        results[name] = result
+        print(f"{name}: {size:6.1f} МБ, {elapsed:.2f} с, {messages / elapsed:,.0f} сообщ/с, {size / elapsed:.1f} МБ/с")
+
+    print(f"результат совпадает: {results['HTML'] == results['JSON']}")
+    print(f"пик памяти потоком: HTML {peak_memory(iter_html_messages(html_path)) / 1e6:.2f} МБ, "
+          f"JSON {peak_memory(iter_json_messages(json_path)) / 1e6:.2f} МБ")
+
+
+if __name__ == "__main__":
+    main()
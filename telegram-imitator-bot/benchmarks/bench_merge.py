@@ -0,0 +1,83 @@
+# Повторная загрузка профиля в базу: перезапись (save_messages) против
+# слияния по ключам сообщений (merge_messages). Считает время и объем,
+# записанный в WAL, для того же экспорта и для экспорта с новыми сообщениями.
+#
+#   python benchmarks/bench_merge.py [сообщений] [новых_сообщений]
+
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import database
+from bench_json_import import write_html
+from import_pipeline import analyze_export
+
+MIN_SAMPLES = 3
+
+
+def load(path: str):
+    with open(path, "rb") as f:
+        return analyze_export(f.read(), MIN_SAMPLES, path)["participants"]
+
+
+def replace(user_id: int, participants):
+    for participant in participants:
+        database.save_messages(
+            user_id, participant["name"], participant["messages"], participant["style"],
+            participant["stats"], participant["report"], participant["messages"].message_ids
+        )
+
+
+def merge(user_id: int, participants):
+    for participant in participants:
+        database.merge_messages(
+            user_id, participant["name"], participant["messages"], participant["messages"].message_ids,
+            participant["stats"], participant["report"], MIN_SAMPLES
+        )
+
+
+def measured(func, *args):
+    # WAL без автоматических checkpoint'ов: все записанные страницы остаются в журнале
+    conn = database.conn
+    conn.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+    started = time.perf_counter()
+    func(*args)
+    elapsed = time.perf_counter() - started
+    frames = conn.execute("PRAGMA wal_checkpoint(PASSIVE)").fetchone()[1]
+    page_size = conn.execute("PRAGMA page_size").fetchone()[0]
+    return elapsed, frames * page_size / 2**20
+
+
+def main():
+    messages = int(sys.argv[1]) if len(sys.argv) > 1 else 100_000
+    added = int(sys.argv[2]) if len(sys.argv) > 2 else 1000
+
+    directory = tempfile.mkdtemp()
+    old_path, new_path = os.path.join(directory, "old.html"), os.path.join(directory, "new.html")
+    write_html(old_path, messages)
+    write_html(new_path, messages + added)
+    old, new = load(old_path), load(new_path)
+
+    database.DB_PATH = os.path.join(directory, "bench.db")
+    database.init_db()
+    database.conn.execute("PRAGMA wal_autocheckpoint = 0")
+    print(f"профили из {messages} сообщений, в новом экспорте еще {added}")
+
+    for user_id, name, func in ((1, "перезапись", replace), (2, "слияние", merge)):
+        func(user_id, old)
+        same_time, same_wal = measured(func, user_id, old)
+        grown_time, grown_wal = measured(func, user_id, new)
+        print(f"{name:>10}: тот же экспорт {same_time:.2f} с, WAL {same_wal:.2f} МБ; "
+              f"дописанный {grown_time:.2f} с, WAL {grown_wal:.2f} МБ")
+
+    rows = "SELECT p.target, d.message FROM imitation_data d JOIN profiles p ON p.id = d.profile_id WHERE p.user_id = ? ORDER BY p.target, d.id"
+    same = database.conn.execute(rows, (1,)).fetchall() == database.conn.execute(rows, (2,)).fetchall()
+    print(f"сообщения профилей совпадают: {same}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,46 @@
+# Построение индекса BM25 и задержка запроса на профиле из 100k сообщений.
+#
+#   python benchmarks/bench_retrieval.py [сообщений] [запросов]
+
+import os
+import random
+import statistics
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from bench_style import group_chat
+from corpus import Corpus
+from retrieval import BM25Index
+
+
+def main():
+    messages = int(sys.argv[1]) if len(sys.argv) > 1 else 100_000
+    queries = int(sys.argv[2]) if len(sys.argv) > 2 else 2000
+
+    texts = group_chat(messages, 1)["Участник 0"]
+    corpus = Corpus(texts)
+
+    started = time.perf_counter()
+    index = BM25Index(corpus)
+    build_time = time.perf_counter() - started
+
+    rng = random.Random(2)
+    prompts = [rng.choice(texts) for _ in range(queries)]
+    latencies = []
+    for prompt in prompts:
+        started = time.perf_counter()
+        index.search(prompt, 2)
+        latencies.append(time.perf_counter() - started)
+
+    latencies.sort()
+    p50 = statistics.median(latencies) * 1000
+    p95 = latencies[int(len(latencies) * 0.95)] * 1000
+    print(f"{messages} сообщений, {len(index.term_ids)} термов")
+    print(f"построение индекса: {build_time:.2f} с")
+    print(f"запрос top-2: p50 {p50:.3f} мс, p95 {p95:.3f} мс, макс {latencies[-1] * 1000:.3f} мс")
+
+
+if __name__ == "__main__":
+    main()
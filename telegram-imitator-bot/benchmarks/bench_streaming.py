@@ -0,0 +1,102 @@
+# Время до первого видимого текста: обычный ответ против потокового (SSE).
+# Поднимает локальную заглушку chat-completions, которая отдает ответ по
+# кусочкам с задержкой, как настоящая модель.
+#
+#   python benchmarks/bench_streaming.py [кусочков] [задержка_мс]
+
+import asyncio
+import json
+import os
+import sys
+import tempfile
+import time
+
+from aiohttp import web
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import ai
+import database
+import repository
+from corpus import Corpus
+from llm_client import llm_client
+from llm_scheduler import llm_scheduler
+from response_cache import response_cache
+from streaming import ThrottledEditor
+
+REPLY = "ну короче завтра не получится, давай лучше в пятницу вечером созвонимся"
+
+
+def make_app(chunks: int, delay: float) -> web.Application:
+    words = REPLY.split(" ")
+    size = max(1, len(words) // chunks)
+    pieces = [" ".join(words[i:i + size]) + " " for i in range(0, len(words), size)]
+
+    async def completions(request: web.Request) -> web.StreamResponse:
+        body = await request.json()
+        if not body.get("stream"):
+            await asyncio.sleep(delay * len(pieces))
+            return web.json_response({"choices": [{"message": {"content": REPLY}}]})
+
+        response = web.StreamResponse(headers={"Content-Type": "text/event-stream"})
+        await response.prepare(request)
+        await response.write(b": OPENROUTER PROCESSING\n\n")
+        for piece in pieces:
+            await asyncio.sleep(delay)
+            event = {"choices": [{"delta": {"content": piece}}]}
+            await response.write(f"data: {json.dumps(event, ensure_ascii=False)}\r\n\r\n".encode())
+        await response.write(b"data: [DONE]\n\n")
+        return response
+
+    app = web.Application()
+    app.router.add_post("/api/v1/chat/completions", completions)
+    return app
+
+
+async def run(chunks: int, delay: float):
+    runner = web.AppRunner(make_app(chunks, delay))
+    await runner.setup()
+    site = web.TCPSite(runner, "127.0.0.1", 0)
+    await site.start()
+    port = site._server.sockets[0].getsockname()[1]
+    ai.OPENROUTER_API_URL = f"http://127.0.0.1:{port}/api/v1/chat/completions"
+
+    database.DB_PATH = os.path.join(tempfile.mkdtemp(), "bench.db")
+    await repository.init()
+    await llm_client.start()
+    await llm_scheduler.start()
+
+    samples = ["давай завтра созвонимся вечером", "ну короче я не знаю", "в пятницу норм"] * 3
+    user_states = {1: {"imitating": True, "target": "Вася", "style_samples": Corpus(samples), "style_data": {}}}
+
+    started = time.perf_counter()
+    full = await ai.generate_response(1, "Вася", "когда созвонимся?", user_states, {})
+    full_time = time.perf_counter() - started
+    response_cache.invalidate(1)
+
+    shown = []
+    editor = ThrottledEditor(lambda text: asyncio.sleep(0, shown.append((time.perf_counter(), text))), interval=0.3)
+    started = time.perf_counter()
+    streamed = await ai.generate_response(1, "Вася", "когда созвонимся?", user_states, {}, on_partial=editor.update)
+    stream_time = time.perf_counter() - started
+    await editor.finish(streamed)
+
+    print(f"обычный ответ: первый текст через {full_time * 1000:.0f} мс")
+    print(f"поток: первый текст через {(shown[0][0] - started) * 1000:.0f} мс, "
+          f"весь ответ за {stream_time * 1000:.0f} мс, правок {editor.edits}")
+    print(f"итог совпадает по словам: {full.split()[:3] == streamed.split()[:3]}")
+
+    await llm_scheduler.stop()
+    await llm_client.close()
+    repository.shutdown()
+    await runner.cleanup()
+
+
+def main():
+    chunks = int(sys.argv[1]) if len(sys.argv) > 1 else 12
+    delay = float(sys.argv[2]) / 1000 if len(sys.argv) > 2 else 0.15
+    asyncio.run(run(chunks, delay))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,84 @@
+# Анализ стиля групповой выгрузки: по одному сообщению (StyleStats.add)
+# против пакетного подсчета analyze_authors / count_report_words.
+#
+#   python benchmarks/bench_style.py [сообщений] [авторов]
+
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from heavy_hitters import TopKCounter
+from style_analysis import EMOJIS, StyleStats, analyze_authors, count_report_words, report_words
+
+SYLLABLES = ["ка", "ро", "ми", "ле", "ту", "ва", "но", "пре", "сти", "жу", "да", "го"]
+
+
+def group_chat(messages: int, authors: int, seed: int = 1):
+    rng = random.Random(seed)
+    vocabulary = ["".join(rng.choices(SYLLABLES, k=rng.randint(1, 4))) for _ in range(20000)]
+    weights = [1 / (rank + 1) for rank in range(len(vocabulary))]
+    names = [f"Участник {i}" for i in range(authors)]
+
+    by_author = {name: [] for name in names}
+    for _ in range(messages):
+        words = rng.choices(vocabulary, weights=weights, k=rng.randint(1, 25))
+        text = " ".join(words) + rng.choice(["", ".", "!", "?", "...", ","])
+        if rng.random() < 0.05:
+            text += " " + rng.choice(EMOJIS)
+        by_author[rng.choice(names)].append(text)
+    return by_author
+
+
+def per_message(by_author):
+    result = {}
+    for name, messages in by_author.items():
+        stats = StyleStats()
+        for msg in messages:
+            stats.add(msg)
+        report = TopKCounter(500)
+        for msg in messages:
+            report.update(report_words(msg))
+        result[name] = (stats.finalize(), report.most_common(5))
+    return result
+
+
+def batched(by_author):
+    authors = analyze_authors(by_author)
+    return {
+        name: (authors[name].finalize(), count_report_words(messages).most_common(5))
+        for name, messages in by_author.items()
+    }
+
+
+def measure(func, by_author, repeat: int = 3):
+    best = float("inf")
+    for _ in range(repeat):
+        started = time.perf_counter()
+        result = func(by_author)
+        best = min(best, time.perf_counter() - started)
+    return result, best
+
+
+def main():
+    messages = int(sys.argv[1]) if len(sys.argv) > 1 else 50_000
+    authors = int(sys.argv[2]) if len(sys.argv) > 2 else 40
+
+    by_author = group_chat(messages, authors)
+
+    old, old_time = measure(per_message, by_author)
+    new, new_time = measure(batched, by_author)
+
+    print(f"{messages} сообщений, {authors} авторов")
+    print(f"по одному сообщению: {old_time:.2f} с ({messages / old_time:,.0f} сообщ/с)")
+    print(f"пакетно:             {new_time:.2f} с ({messages / new_time:,.0f} сообщ/с), ускорение x{old_time / new_time:.1f}")
+    # стиль совпадает точно; частоты отчета могут отличаться в пределах ошибки TopKCounter
+    same_style = all(old[name][0] == new[name][0] for name in by_author)
+    same_report = all([w for w, _ in old[name][1]] == [w for w, _ in new[name][1]] for name in by_author)
+    print(f"стиль совпадает: {same_style}, топ слов отчета совпадает: {same_report}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,65 @@
+# Сравнение TopKCounter (Misra-Gries) с collections.Counter на потоке слов
+# с распределением Ципфа: точность топа и пиковая память.
+#
+#   python benchmarks/bench_topk.py [токенов] [словарь]
+
+import itertools
+import os
+import random
+import sys
+import time
+import tracemalloc
+from collections import Counter
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from heavy_hitters import TopKCounter, capacity_for_error
+
+
+def zipf_tokens(tokens: int, vocabulary: int, seed: int = 1):
+    rng = random.Random(seed)
+    words = [f"слово{i}" for i in range(vocabulary)]
+    cum_weights = list(itertools.accumulate(1 / (rank + 1) for rank in range(vocabulary)))
+    return rng.choices(words, cum_weights=cum_weights, k=tokens)
+
+
+def measure(factory, stream):
+    started = time.perf_counter()
+    counter = factory()
+    counter.update(stream)
+    elapsed = time.perf_counter() - started
+
+    # память меряем отдельным прогоном: tracemalloc сильно замедляет подсчет
+    tracemalloc.start()
+    factory().update(stream)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return counter, elapsed, peak
+
+
+def main():
+    tokens = int(sys.argv[1]) if len(sys.argv) > 1 else 2_000_000
+    vocabulary = int(sys.argv[2]) if len(sys.argv) > 2 else 300_000
+    top = 50
+
+    stream = zipf_tokens(tokens, vocabulary)
+
+    exact, exact_time, exact_peak = measure(Counter, stream)
+    exact_top = exact.most_common(top)
+    print(f"Counter: {exact_time:.2f} с, пик {exact_peak / 2**20:.1f} МБ, ключей {len(exact)}")
+
+    for epsilon in (0.01, 0.001, 0.0005):
+        capacity = capacity_for_error(epsilon)
+        approx, approx_time, approx_peak = measure(lambda: TopKCounter(capacity), stream)
+        approx_top = approx.most_common(top)
+        recall = len({w for w, _ in exact_top} & {w for w, _ in approx_top}) / top
+        max_error = max(exact[w] - approx[w] for w, _ in exact_top)
+        print(
+            f"TopKCounter eps={epsilon} (k={capacity}): {approx_time:.2f} с, пик {approx_peak / 2**20:.1f} МБ, "
+            f"ключей {len(approx)}, совпадение топ-{top} {recall:.0%}, "
+            f"макс. ошибка {max_error} (граница {approx.error}, eps*N={int(epsilon * tokens)})"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,81 @@
+# Импорт ZIP-архива экспорта из многих messages*.html: время в зависимости
+# от числа воркеров пула (ожидается рост до числа ядер).
+#
+#   python benchmarks/bench_zip_import.py [файлов] [сообщений_в_файле]
+
+import asyncio
+import os
+import random
+import sys
+import tempfile
+import time
+import zipfile
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from import_pipeline import ImportPipeline, analyze_export_archive
+
+SYLLABLES = ["ка", "ро", "ми", "ле", "ту", "ва", "но", "пре", "сти", "жу", "да", "го"]
+SENDERS = ["Алиса", "Боб", "Вася", "Галя"]
+
+
+def export_page(rng: random.Random, vocabulary, start: int, messages: int) -> str:
+    parts = [
+        '<!DOCTYPE html><html><head><meta charset="utf-8"/></head><body><div class="page_wrap">'
+        '<div class="page_header"><div class="content"><div class="text bold">Алиса</div></div></div>'
+        '<div class="page_body chat_page"><div class="history">'
+    ]
+    for i in range(start, start + messages):
+        text = " ".join(rng.choices(vocabulary, k=rng.randint(1, 20)))
+        parts.append(
+            f'<div class="message default clearfix" id="message{i}"><div class="body">'
+            f'<div class="pull_right date details" title="01.01.2020 12:00:00">12:00</div>'
+            f'<div class="from_name">{rng.choice(SENDERS)}</div>'
+            f'<div class="text">{text}</div></div></div>'
+        )
+    parts.append('</div></div></div></body></html>')
+    return "\n".join(parts)
+
+
+def make_archive(path: str, files: int, per_file: int):
+    rng = random.Random(1)
+    vocabulary = ["".join(rng.choices(SYLLABLES, k=rng.randint(1, 4))) for _ in range(20000)]
+    with zipfile.ZipFile(path, "w", zipfile.ZIP_DEFLATED) as archive:
+        for index in range(1, files + 1):
+            name = "messages.html" if index == 1 else f"messages{index}.html"
+            archive.writestr(f"ChatExport/{name}", export_page(rng, vocabulary, index * per_file, per_file))
+
+
+async def run(path: str, workers: int) -> float:
+    pipeline = ImportPipeline(workers, 10, "process")
+    await pipeline.start()
+    # прогрев: процессы пула стартуют лениво
+    await pipeline.submit_map(len, [("",)] * workers)
+    started = time.perf_counter()
+    export = await analyze_export_archive(pipeline, path, 3)
+    elapsed = time.perf_counter() - started
+    await pipeline.stop()
+    print(f"{workers:2} воркеров: {elapsed:.2f} с, {export['total_messages']} сообщений, "
+          f"{len(export['participants'])} авторов")
+    return elapsed
+
+
+def main():
+    files = int(sys.argv[1]) if len(sys.argv) > 1 else 200
+    per_file = int(sys.argv[2]) if len(sys.argv) > 2 else 1000
+    path = os.path.join(tempfile.mkdtemp(), "export.zip")
+    make_archive(path, files, per_file)
+    print(f"архив: {files} файлов по {per_file} сообщений, {os.path.getsize(path) / 1e6:.1f} МБ")
+
+    cores = os.cpu_count() or 1
+    counts = sorted({1, 2, 4, cores} & set(range(1, cores + 1)))
+    baseline = None
+    for workers in counts:
+        elapsed = asyncio.run(run(path, workers))
+        baseline = baseline or elapsed
+        if workers > 1:
+            print(f"   ускорение x{baseline / elapsed:.2f}")
+
+
+if __name__ == "__main__":
+    main()
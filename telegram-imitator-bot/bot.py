@@ -5,9 +5,8 @@ import os
 import asyncio
 from typing import Dict, Any, List, Tuple, Optional
 import io
-import string
-from collections import Counter
 import json
+from contextlib import suppress
 
 from aiogram import Bot, Dispatcher, types, F
 from aiogram.exceptions import TelegramBadRequest
@@ -16,20 +15,34 @@ from aiogram.types import Message, InlineKeyboardMarkup, InlineKeyboardButton, B
 from aiogram.enums import ParseMode
 
 from keyboards import get_main_kb, get_targets_kb, get_exit_kb, get_back_to_main_kb
-from database import (
-    init_db, save_messages, get_messages, clear_data,
-    get_style_data_from_db, get_stats_data, sqlite3 as db_sqlite3
+from database import sqlite3 as db_sqlite3
+import repository
+from import_pipeline import (
+    ImportPipeline, ImportQueueFull, ExportArchiveError, analyze_export, analyze_export_archive, analyze_export_tail
 )
-from html_parser import parse_html
-from style_analysis import analyze_style
+import import_cache
+from import_saving import save_export, save_export_tail
 from ai import generate_response
+from prompt_builder import PromptTemplate
+from llm_client import llm_client
+from llm_scheduler import llm_scheduler
+from response_cache import response_cache
+from retrieval import retrieval_indexes
+from sessions import MIN_SAMPLES_FOR_IMITATION, chat_memory, reply_coalescer, user_states
+from streaming import ThrottledEditor
+from heavy_hitters import TopKCounter
 import profile_management
 
 
-from config import BOT_TOKEN
+from config import (
+    BOT_TOKEN, IMPORT_WORKERS, IMPORT_MAX_PENDING, IMPORT_EXECUTOR, IMPORT_PREFIX_CANDIDATES,
+    IMPORT_ZIP_MAX_MEMBER, IMPORT_ZIP_MAX_UNCOMPRESSED,
+    SESSION_SWEEP_INTERVAL,
+    LLM_STREAMING, STREAM_PLACEHOLDER
+)
 
 MIN_SAMPLES_FOR_STYLE_ANALYSIS = 3
-MIN_SAMPLES_FOR_IMITATION = 5
+EXPORTS_DIR = "user_data"
 
 
 bot = Bot(token=BOT_TOKEN, parse_mode=ParseMode.HTML)
@@ -41,16 +54,20 @@ logging.basicConfig(
 logger = logging.getLogger(__name__)
 
 
-user_states: Dict[int, Dict[str, Any]] = {}
-chat_memory: Dict[int, Dict[str, List[Dict[str, str]]]] = {}
+def remove_stale_exports():
+    # файлы экспортов, которые прежние версии скачивали на диск и не удалили из-за падения
+    if not os.path.isdir(EXPORTS_DIR):
+        return
+    for name in os.listdir(EXPORTS_DIR):
+        if name.startswith("export_"):
+            try:
+                os.remove(os.path.join(EXPORTS_DIR, name))
+                logger.info(f"Удален оставшийся файл импорта {name}.")
+            except OSError as e:
+                logger.warning(f"Не удалось удалить оставшийся файл импорта {name}: {e}")
 
 
-try:
-    conn, cursor = init_db()
-    logger.info("База данных успешно инициализирована.")
-except db_sqlite3.Error as e:
-    logger.critical(f"Критическая ошибка инициализации базы данных: {e}", exc_info=True)
-    exit(1)
+import_pipeline = ImportPipeline(IMPORT_WORKERS, IMPORT_MAX_PENDING, IMPORT_EXECUTOR)
 
 
 @dp.message(Command("start"))
@@ -105,7 +122,7 @@ async def imitate_other(callback: types.CallbackQuery):
 @dp.callback_query(F.data == "upload_other")
 async def upload_other(callback: types.CallbackQuery):
     await callback.message.edit_text(
-        "📤 Отправьте экспорт чата в HTML формате.\n"
+        "📤 Отправьте экспорт чата: HTML, result.json (формат JSON) или ZIP-архив всей папки экспорта.\n"
         "Найденные профили (ваш и других участников) будут сохранены или обновлены.",
         reply_markup=InlineKeyboardMarkup(inline_keyboard=[[
             InlineKeyboardButton(text="⬅️ Назад", callback_data="imitate_other")
@@ -114,6 +131,32 @@ async def upload_other(callback: types.CallbackQuery):
     await callback.answer()
 
 
+def owner_name(user: User) -> str:
+    your_name = user.first_name
+    if user.last_name:
+        your_name += f" {user.last_name}"
+    if not your_name.strip() and user.username:
+         your_name = user.username
+    if not your_name.strip():
+        your_name = f"User_{user.id}"
+    return your_name
+
+
+async def reply_cached_import(processing_message: Message, summary: Dict[str, Any]):
+    # файл уже загружался: профили в базе актуальны, разбирать нечего
+    participants = summary.get("participants", [])
+    response_text = (
+        "✅ Этот экспорт уже загружен, профили актуальны.\n"
+        f"Ваших сообщений: {summary.get('your_count', 0)}, профилей участников: {len(participants)}.\n"
+    )
+    if participants:
+        response_text += "👥 Выберите человека для имитации:"
+    await processing_message.edit_text(
+        response_text,
+        reply_markup=get_targets_kb(participants) if participants else get_main_kb()
+    )
+
+
 @dp.message(F.document)
 async def handle_document(message: Message):
     user: User = message.from_user
@@ -128,77 +171,146 @@ async def handle_document(message: Message):
         await message.reply(f"❌ Размер файла превышает лимит в 20MB или неизвестен.")
         logger.warning(f"Файл от user_id {user_id} слишком большой или размер неизвестен: {message.document.file_size}")
         return
-    if not message.document.file_name or not message.document.file_name.lower().endswith('.html'):
-        await message.reply("❌ Пожалуйста, отправьте HTML-экспорт из Telegram.")
+    file_name = (message.document.file_name or "").lower()
+    if not file_name.endswith(('.html', '.json', '.zip')):
+        await message.reply("❌ Пожалуйста, отправьте экспорт из Telegram: HTML, result.json или ZIP-архив папки экспорта.")
         logger.warning(f"Некорректный тип файла от user_id {user_id}: {message.document.file_name or 'No filename'}")
         return
+    is_archive = file_name.endswith('.zip')
+    extension = import_cache.export_format(file_name)
+    file_unique_id = message.document.file_unique_id
 
     processing_message = await message.reply("⏳ Обрабатываю файл...")
 
-    file_path = f"user_data/export_{user_id}_{message.document.file_unique_id}.html"
     try:
-        os.makedirs("user_data", exist_ok=True)
+        # тот же файл Telegram уже загружался — не скачиваем его снова
+        cached = await repository.find_import(user_id, file_unique_id=file_unique_id)
+        if cached is not None:
+            logger.info(f"Файл {file_unique_id} от user_id {user_id} уже импортирован, обработка пропущена.")
+            await reply_cached_import(processing_message, cached["summary"])
+            return
+
+        # скачиваем прямо в память: ответ HTTP пишется в буфер, парсер читает из него;
+        # Bot API отдает файлы не больше 20 МБ, так что на диск они не нужны
         file_info = await bot.get_file(message.document.file_id)
-        await bot.download_file(file_info.file_path, file_path)
-        logger.info(f"Файл сохранен как {file_path}.")
-
-        your_parsed_messages, other_participants_messages = parse_html(file_path)
-        logger.info(f"Парсинг завершен. Найдено сообщений владельца: {len(your_parsed_messages)}, других: {len(other_participants_messages)}.")
-
-        your_name = user.first_name
-        if user.last_name:
-            your_name += f" {user.last_name}"
-        if not your_name.strip() and user.username:
-             your_name = user.username
-        if not your_name.strip():
-            your_name = f"User_{user_id}"
+        buffer = io.BytesIO()
+        await bot.download_file(file_info.file_path, buffer)
+        source = buffer.getvalue()
+        logger.info(f"Файл от user_id {user_id} скачан в память ({len(source)} байт).")
+
+        # ключи кэша импортов: тот же файл целиком или его начало, к которому дописаны сообщения
+        base = None
+        loop = asyncio.get_running_loop()
+        fingerprint = await loop.run_in_executor(None, import_cache.fingerprint, source, extension)
+        cached = await repository.find_import(user_id, content_hash=fingerprint["content_hash"])
+        if cached is not None:
+            logger.info(f"Содержимое файла от user_id {user_id} уже импортировано, обработка пропущена.")
+            await repository.save_import(user_id, file_unique_id, fingerprint, cached["chat_name"], cached["summary"])
+            await reply_cached_import(processing_message, cached["summary"])
+            return
+        if not is_archive:
+            candidates = await repository.get_prefix_candidates(
+                user_id, extension, len(source), IMPORT_PREFIX_CANDIDATES
+            )
+            base = await loop.run_in_executor(None, import_cache.match_prefix, source, candidates)
+
+        async def report_position(position: int):
+            if position > 0:
+                await processing_message.edit_text(f"⏳ Файл в очереди на обработку, вы #{position}.")
+            else:
+                await processing_message.edit_text("⏳ Обрабатываю файл...")
+
+        try:
+            if base is not None:
+                # экспорт дописан с конца: разбираем только хвост после прежнего импорта
+                logger.info(f"Файл от user_id {user_id} продолжает импорт #{base['id']}, разбираю с байта {base['prefix_size']}.")
+                tail = await import_pipeline.submit(
+                    analyze_export_tail, source[base["prefix_size"]:], extension, base["last_message_id"],
+                    on_position=report_position
+                )
+            elif is_archive:
+                # messages.html, messages2.html, ... разбираются параллельно и склеиваются
+                export = await analyze_export_archive(
+                    import_pipeline, source, MIN_SAMPLES_FOR_STYLE_ANALYSIS,
+                    on_position=report_position,
+                    max_member_size=IMPORT_ZIP_MAX_MEMBER, max_total_size=IMPORT_ZIP_MAX_UNCOMPRESSED
+                )
+            else:
+                export = await import_pipeline.submit(
+                    analyze_export, source, MIN_SAMPLES_FOR_STYLE_ANALYSIS, file_name,
+                    on_position=report_position
+                )
+        except ImportQueueFull:
+            logger.warning(f"Очередь импорта заполнена ({import_pipeline.pending}), файл user_id {user_id} отклонен.")
+            await processing_message.edit_text("⏳ Сейчас обрабатывается слишком много файлов. Попробуйте чуть позже.", reply_markup=get_main_kb())
+            return
+        except ExportArchiveError as e:
+            logger.warning(f"Архив от user_id {user_id} не принят: {e}")
+            await processing_message.edit_text(f"❌ {e}. Отправьте ZIP папки экспорта Telegram Desktop.", reply_markup=get_main_kb())
+            return
+
+        your_name = owner_name(user)
         logger.info(f"Определено имя владельца (из TG): '{your_name}' для user_id {user_id}.")
 
-        if not other_participants_messages and not your_parsed_messages:
+        if base is not None:
+            summary, complete = await save_export_tail(
+                user_id, your_name, base, tail, file_unique_id, fingerprint, MIN_SAMPLES_FOR_STYLE_ANALYSIS
+            )
+            new_count = sum(len(messages) for messages in tail["authors"].values())
+            participants = summary["participants"]
+            if complete:
+                logger.info(f"Дописано {new_count} новых сообщений из файла user_id {user_id}.")
+                response_text = f"✅ Экспорт дополнен: добавлено {new_count} новых сообщений, прежние уже были загружены.\n"
+            else:
+                response_text = "⚠️ Часть новых сообщений сохранить не удалось. Отправьте файл еще раз.\n"
+            await processing_message.edit_text(
+                response_text + ("👥 Выберите человека для имитации:" if participants else ""),
+                reply_markup=get_targets_kb(participants) if participants else get_main_kb()
+            )
+            return
+
+        your_parsed_messages = export["your_messages"]
+        logger.info(f"Парсинг завершен. Найдено сообщений владельца: {len(your_parsed_messages)}, других: {export['total_messages']}.")
+
+        if not export["total_messages"] and not your_parsed_messages:
             await processing_message.edit_text("❌ В файле не найдено сообщений или возникла ошибка при обработке.")
-            logger.warning(f"В файле {file_path} не найдено сообщений.")
+            logger.warning(f"В файле {message.document.file_name} от user_id {user_id} не найдено сообщений.")
             return
 
-        style_data_me = None
         if your_parsed_messages:
-            if len(your_parsed_messages) >= MIN_SAMPLES_FOR_STYLE_ANALYSIS:
-                try:
-                    style_data_me = analyze_style(your_parsed_messages)
-                    logger.info(f"Стиль для '{your_name}' (user_id {user_id}) проанализирован.")
-                except Exception as e:
-                    logger.error(f"Ошибка анализа стиля для '{your_name}' (user_id {user_id}): {e}", exc_info=True)
-                    await message.answer(f"⚠️ Не удалось проанализировать ваш стиль ('{your_name}'), сообщения будут сохранены без стиля.")
+            if export["your"]["error"]:
+                logger.error(f"Ошибка анализа стиля для '{your_name}' (user_id {user_id}): {export['your']['error']}")
+                await message.answer(f"⚠️ Не удалось проанализировать ваш стиль ('{your_name}'), сообщения будут сохранены без стиля.")
+            elif export["your"]["style"]:
+                logger.info(f"Стиль для '{your_name}' (user_id {user_id}) проанализирован.")
             else:
                 logger.info(f"Недостаточно сообщений ({len(your_parsed_messages)}) для анализа вашего стиля ('{your_name}'), сохраняю без стиля.")
 
-            save_messages(user_id, your_name, your_parsed_messages, style_data_me)
-            logger.info(f"Сохранено {len(your_parsed_messages)} сообщений для target '{your_name}' (user_id {user_id}).")
-
-        participants_to_choose = sorted(list({name for name, _ in other_participants_messages if name != "Unknown" and name}))
-        saved_count_others = 0
+        participants_to_choose = [participant["name"] for participant in export["participants"]]
         processed_others = 0
-        for target_other in participants_to_choose:
-             messages_other = [text for name, text in other_participants_messages if name == target_other]
+        for participant in export["participants"]:
+             target_other = participant["name"]
              processed_others += 1
-             if messages_other:
-                  style_data_other = None
-                  if len(messages_other) >= MIN_SAMPLES_FOR_STYLE_ANALYSIS:
-                      try:
-                          style_data_other = analyze_style(messages_other)
-                          logger.info(f"Стиль для '{target_other}' (user_id {user_id}) проанализирован.")
-                      except Exception as e:
-                          logger.error(f"Ошибка анализа стиля для '{target_other}' (user_id {user_id}): {e}", exc_info=True)
-                          await message.answer(f"⚠️ Не удалось проанализировать стиль для '{target_other}', сообщения будут сохранены без стиля.")
+             if participant["messages"]:
+                  if participant["error"]:
+                      logger.error(f"Ошибка анализа стиля для '{target_other}' (user_id {user_id}): {participant['error']}")
+                      await message.answer(f"⚠️ Не удалось проанализировать стиль для '{target_other}', сообщения будут сохранены без стиля.")
+                  elif participant["style"]:
+                      logger.info(f"Стиль для '{target_other}' (user_id {user_id}) проанализирован.")
                   else:
-                      logger.info(f"Недостаточно сообщений ({len(messages_other)}) для анализа стиля '{target_other}' (user_id {user_id}), сохраняю без стиля.")
+                      logger.info(f"Недостаточно сообщений ({len(participant['messages'])}) для анализа стиля '{target_other}' (user_id {user_id}), сохраняю без стиля.")
 
-                  save_messages(user_id, target_other, messages_other, style_data_other)
-                  logger.info(f"Сохранено {len(messages_other)} сообщений для target '{target_other}' (user_id {user_id}).")
-                  saved_count_others += 1
+        # в профили добавляются только сообщения, которых в них еще нет
+        saved = await save_export(
+            user_id, your_name, export, file_unique_id, fingerprint, MIN_SAMPLES_FOR_STYLE_ANALYSIS
+        )
+        your_added, saved_count_others, complete = saved["your_added"], saved["saved_others"], saved["complete"]
 
         response_text = ""
-        if your_parsed_messages:
-            response_text += f"✅ Загружено и сохранено {len(your_parsed_messages)} ваших сообщений'.\n"
+        if your_parsed_messages and your_added < 0:
+            response_text += f"❌ Не удалось сохранить ваши сообщения ({len(your_parsed_messages)}).\n"
+        elif your_parsed_messages:
+            response_text += f"✅ Загружено {len(your_parsed_messages)} ваших сообщений, из них новых: {your_added}.\n"
         else:
              response_text += "✅ Файл обработан. Ваши сообщения не найдены/сохранены.\n"
 
@@ -215,16 +327,14 @@ async def handle_document(message: Message):
             response_text += "🤷‍♂️ Других участников в этом чате не найдено."
             reply_markup_final = get_main_kb()
             logger.info(f"Других участников не найдено в файле для user_id {user_id}.")
-
+        if not complete:
+            response_text += "\n⚠️ Часть данных обработать или сохранить не удалось. Отправьте файл еще раз, чтобы догрузить."
 
         await processing_message.edit_text(
             response_text,
             reply_markup=reply_markup_final
         )
 
-    except FileNotFoundError:
-        logger.error(f"Файл не найден '{file_path}' при обработке user_id {user_id}.", exc_info=True)
-        await processing_message.edit_text("❌ Ошибка: Файл не найден после загрузки.", reply_markup=get_main_kb())
     except Exception as e:
         logger.error(f"Критическая ошибка обработки файла user_id {user_id}: {str(e)}", exc_info=True)
         try:
@@ -232,13 +342,6 @@ async def handle_document(message: Message):
         except TelegramBadRequest:
              logger.error("Ошибка редактирования сообщения об ошибке обработки файла.", exc_info=True)
              await message.reply("❌ Произошла ошибка при обработке файла.", reply_markup=get_main_kb())
-    finally:
-        if os.path.exists(file_path):
-            try:
-                os.remove(file_path)
-                logger.info(f"Временный файл {file_path} удален.")
-            except OSError as remove_error:
-                logger.error(f"Не удалось удалить временный файл {file_path}: {remove_error}")
 
 
 @dp.callback_query(F.data == "stats")
@@ -246,9 +349,9 @@ async def stats(callback: types.CallbackQuery):
     user: User = callback.from_user
     user_id = user.id
     logger.info(f"Запрошена статистика для user_id {user_id} (@{user.username or 'no_username'}).")
-    stats_data = get_stats_data(user_id)
+    profiles = await repository.get_profile_stats(user_id)
 
-    if not stats_data:
+    if not profiles:
         logger.info(f"Нет данных для статистики user_id {user_id}.")
         await callback.message.edit_text("📊 Нет сохраненных данных для статистики.", reply_markup=get_main_kb())
         await callback.answer()
@@ -261,36 +364,20 @@ async def stats(callback: types.CallbackQuery):
     output.write(f"📊 Статистика для пользователя @{user_identifier}\n")
     output.write("====================================\n\n")
 
-    total_profiles = len(stats_data)
+    total_profiles = len(profiles)
     total_messages_all = 0
     output.write(f"Общее количество сохраненных профилей: {total_profiles}\n\n")
 
-    translator = str.maketrans('', '', string.punctuation + '—«»”“`‘’')
-    common_words_to_exclude = {
-        'в', 'на', 'с', 'и', 'не', 'я', 'ты', 'он', 'она', 'оно', 'мы', 'вы', 'они',
-        'что', 'как', 'а', 'ну', 'же', 'то', 'это', 'вот', 'бы', 'но', 'или', 'да',
-        'блять', 'сука', 'пиздец', 'хуй', 'ебать', 'бля', 'хули', 'мда', 'пон', 'окей', 'ок', 'нахуй', 'нихуя', 'ебаный', 'епта',
-        'че', 'мне', 'тебе', 'его', 'ее', 'нас', 'вас', 'их', 'мой', 'твой', 'свой', 'себе', 'меня', 'тебя',
-        'за', 'по', 'у', 'из', 'до', 'от', 'к', 'про', 'для', 'со', 'под', 'над', 'без',
-        'если', 'когда', 'тоже', 'так', 'нет', 'да', 'еще', 'уже', 'там', 'тут', 'все', 'всё', 'вообще', 'просто', 'типо',
-        'этот', 'эта', 'эти', 'тот', 'та', 'те', 'где', 'кто', 'какой', 'какая', 'какое', 'какие', 'который', 'которая',
-        'о', 'ж', 'бы', 'ль', 'ли', 'же', 'разве', 'спс', 'пж', 'хз', 'лол'
-    }
-
-    for target, messages in stats_data.items():
-        message_count = len(messages)
+    for profile in profiles:
+        target = profile["target"]
+        message_count = profile["message_count"]
         total_messages_all += message_count
 
         if message_count > 0:
-            total_len = sum(len(str(msg)) for msg in messages)
-            avg_len = round(total_len / message_count) if message_count > 0 else 0
-
-            all_text = ' '.join(str(msg) for msg in messages).lower()
-            cleaned_text = all_text.translate(translator)
-            words = [word for word in cleaned_text.split() if len(word) > 1]
-            word_counts = Counter(words)
-            filtered_word_counts = Counter({word: count for word, count in word_counts.items() if word not in common_words_to_exclude})
-            top_5_words = filtered_word_counts.most_common(5)
+            avg_len = round(profile["avg_len"])
+
+            report_stats = profile["report_stats"]
+            top_5_words = TopKCounter.from_dict(report_stats).most_common(5) if report_stats else []
             top_words_str = ", ".join([f'"{word}" ({count})' for word, count in top_5_words]) if top_5_words else "Нет данных (после фильтрации)"
         else:
             avg_len = 0
@@ -341,12 +428,13 @@ async def clear(callback: types.CallbackQuery):
 async def clear_confirm(callback: types.CallbackQuery):
     user_id = callback.from_user.id
     logger.info(f"Пользователь {user_id} подтвердил очистку ВСЕХ данных.")
-    if clear_data(user_id):
+    if await repository.clear_data(user_id):
         text = "🧹 Все ваши данные и профили удалены."
-        if user_id in user_states:
-            del user_states[user_id]
-        if user_id in chat_memory:
-            del chat_memory[user_id]
+        user_states.discard(user_id)
+        chat_memory.discard(user_id)
+        reply_coalescer.discard(user_id)
+        response_cache.invalidate(user_id)
+        retrieval_indexes.invalidate(user_id)
         logger.info(f"Данные успешно очищены для user_id {user_id}.")
     else:
         text = "❌ Ошибка очистки данных в базе."
@@ -372,8 +460,8 @@ async def select_target(callback: types.CallbackQuery):
 
     logger.info(f"Пользователь {user_id} выбрал цель для имитации: {target_name}")
 
-    target_messages = get_messages(user_id, target_name)
-    style_data = get_style_data_from_db(user_id, target_name)
+    target_messages = await repository.get_messages(user_id, target_name)
+    style_data = await repository.get_style_data(user_id, target_name)
 
     if not target_messages:
         logger.warning(f"Не найдены сообщения для user_id={user_id}, target={target_name} при выборе цели.")
@@ -393,10 +481,10 @@ async def select_target(callback: types.CallbackQuery):
         "target": target_name,
         "style_samples": target_messages,
         "style_data": style_data,
-        "response_cache": {}
+        "prompt_template": PromptTemplate(target_name, style_data, target_messages)
     }
-    if user_id in chat_memory:
-        del chat_memory[user_id]
+    chat_memory.discard(user_id)
+    reply_coalescer.discard(user_id)
     logger.info(f"Включен режим имитации для user_id={user_id}, target={target_name}.")
 
     try:
@@ -426,10 +514,12 @@ async def exit_imitation_mode(callback: types.CallbackQuery):
     if user_id in user_states:
         user_states[user_id]["imitating"] = False
         logger.info(f"Режим имитации выключен для user_id {user_id} в user_states.")
+    else:
+        user_states.discard(user_id)
 
-    if user_id in chat_memory:
-        del chat_memory[user_id]
-        logger.info(f"Очищена память чата для user_id {user_id}.")
+    chat_memory.discard(user_id)
+    reply_coalescer.discard(user_id)
+    logger.info(f"Очищена память чата для user_id {user_id}.")
 
     try:
        await callback.message.edit_text("Режим имитации выключен.", reply_markup=None)
@@ -441,11 +531,70 @@ async def exit_imitation_mode(callback: types.CallbackQuery):
     await callback.answer("Вы вышли из режима имитации.")
 
 
+async def generate_reply(user_id: int, messages: List[Message]) -> Optional[Tuple[str, Optional[ThrottledEditor]]]:
+    user_state = await user_states.load(user_id) or {}
+    target = user_state.get("target")
+    if not user_state.get("imitating") or not target:
+        logger.info(f"Режим имитации для user_id {user_id} выключен, пока сообщения ждали ответа.")
+        return None
+
+    last = messages[-1]
+    prompt = "\n".join(m.text for m in messages)
+    if len(messages) > 1:
+        logger.info(f"Для user_id {user_id} склеено {len(messages)} сообщений в один запрос.")
+    placeholder = None
+    try:
+        await chat_memory.load(user_id)
+        if not LLM_STREAMING:
+            return await generate_response(user_id, target, prompt, user_states, chat_memory), None
+
+        # ответ появляется по мере генерации в сообщении-заглушке
+        placeholder = await last.reply(STREAM_PLACEHOLDER, reply_markup=get_exit_kb())
+        editor = ThrottledEditor(lambda text: placeholder.edit_text(text, reply_markup=get_exit_kb()))
+        response = await generate_response(
+            user_id, target, prompt, user_states, chat_memory, on_partial=editor.update
+        )
+        return response, editor
+    except asyncio.CancelledError:
+        # пришло новое сообщение: устаревший черновик ответа убираем
+        if placeholder is not None:
+            with suppress(TelegramBadRequest):
+                await placeholder.delete()
+        raise
+    except Exception as e:
+        logger.error(f"Ошибка генерации ответа для user_id {user_id}, target '{target}': {str(e)}", exc_info=True)
+        if placeholder is not None:
+            with suppress(TelegramBadRequest):
+                await placeholder.delete()
+        await last.reply("⚠️ Произошла ошибка при генерации ответа.", reply_markup=get_exit_kb())
+        return None
+
+
+async def deliver_reply(user_id: int, messages: List[Message], result: Optional[Tuple[str, Optional[ThrottledEditor]]]):
+    if result is None:
+        return
+    response, editor = result
+
+    # история обновляется здесь, по одному ответу пользователя за раз
+    if user_id not in chat_memory:
+        chat_memory[user_id] = {"history": []}
+    chat_memory[user_id]["history"].append({"role": "user", "content": "\n".join(m.text for m in messages)})
+    chat_memory[user_id]["history"].append({"role": "assistant", "content": response})
+    chat_memory[user_id]["history"] = chat_memory[user_id]["history"][-20:]
+    logger.debug(f"История чата для user_id {user_id} обновлена. Длина: {len(chat_memory[user_id]['history'])}")
+
+    if editor is None or not await editor.finish(response):
+        await messages[-1].reply(response, reply_markup=get_exit_kb())
+
+
+reply_coalescer.bind(generate_reply, deliver_reply)
+
+
 @dp.message(F.text)
 async def text(message: Message):
     user: User = message.from_user
     user_id = user.id
-    user_state = user_states.get(user_id, {})
+    user_state = await user_states.load(user_id) or {}
 
     if user_state.get("imitating"):
         target = user_state.get("target")
@@ -457,27 +606,14 @@ async def text(message: Message):
             if len(style_samples) < MIN_SAMPLES_FOR_IMITATION:
                 logger.error(f"State inconsistency: Imitating mode active but samples < {MIN_SAMPLES_FOR_IMITATION} for user_id {user_id}, target '{target}'.")
                 user_states[user_id]["imitating"] = False
-                if user_id in chat_memory: del chat_memory[user_id]
+                chat_memory.discard(user_id)
                 await message.reply(
                      f"⚠️ Ошибка состояния: Недостаточно данных для имитации {target}. Режим выключен.",
                      reply_markup=get_main_kb()
                  )
                 return
 
-            try:
-                response = await generate_response(user_id, target, message.text, user_states, chat_memory)
-                await message.reply(response, reply_markup=get_exit_kb())
-
-                if user_id not in chat_memory:
-                    chat_memory[user_id] = {"history": []}
-                chat_memory[user_id]["history"].append({"role": "user", "content": message.text})
-                chat_memory[user_id]["history"].append({"role": "assistant", "content": response})
-                chat_memory[user_id]["history"] = chat_memory[user_id]["history"][-20:]
-                logger.debug(f"История чата для user_id {user_id} обновлена. Длина: {len(chat_memory[user_id]['history'])}")
-
-            except Exception as e:
-                logger.error(f"Ошибка генерации ответа для user_id {user_id}, target '{target}': {str(e)}", exc_info=True)
-                await message.reply("⚠️ Произошла ошибка при генерации ответа.", reply_markup=get_exit_kb())
+            reply_coalescer.submit(user_id, message)
         else:
              logger.error(f"Неконсистентное состояние для user_id {user_id}: imitating=True, но нет target или style_samples в user_states.")
              user_states[user_id]["imitating"] = False
@@ -489,13 +625,38 @@ async def text(message: Message):
 
 
 async def main():
+    try:
+        await repository.init()
+        logger.info("База данных успешно инициализирована.")
+    except db_sqlite3.Error as e:
+        logger.critical(f"Критическая ошибка инициализации базы данных: {e}", exc_info=True)
+        exit(1)
+
     dp.include_router(profile_management.profile_router)
     logger.info("Роутер управления профилями зарегистрирован.")
 
+    remove_stale_exports()
+
+    await import_pipeline.start()
+    await llm_client.start()
+    await llm_scheduler.start()
+    user_states.start(SESSION_SWEEP_INTERVAL)
+    chat_memory.start(SESSION_SWEEP_INTERVAL)
     logger.info("Запуск бота...")
-    await dp.start_polling(bot)
+    try:
+        await dp.start_polling(bot)
+    finally:
+        await reply_coalescer.stop()
+        await llm_scheduler.stop()
+        await llm_client.close()
+        logger.info(f"Кэш ответов: {response_cache.metrics()}")
+        logger.info(f"Индексы примеров: {retrieval_indexes.metrics()}")
+        await import_pipeline.stop()
+        await user_states.stop()
+        await chat_memory.stop()
+        repository.shutdown()
 
 
 if __name__ == "__main__":
-    os.makedirs("user_data", exist_ok=True)
+    os.makedirs(EXPORTS_DIR, exist_ok=True)
     asyncio.run(main())
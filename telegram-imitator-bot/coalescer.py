@@ -0,0 +1,110 @@
+import asyncio
+import logging
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Set
+
+from config import COALESCE_WINDOW
+
+logger = logging.getLogger(__name__)
+
+GenerateFunc = Callable[[int, List[Any]], Awaitable[Any]]
+DeliverFunc = Callable[[int, List[Any], Any], Awaitable[None]]
+
+
+class MessageCoalescer:
+    """Склеивает серию сообщений пользователя в одну генерацию.
+
+    Сообщения, пришедшие с паузой меньше window секунд, отвечаются одним
+    запросом. Новое сообщение отменяет еще не готовую генерацию: ее
+    сообщения возвращаются в очередь и уходят вместе с новым. Отправка
+    ответа не отменяется, и у одного пользователя в работе всегда не больше
+    одной задачи, поэтому ответы и история идут по порядку.
+    Генерацию и отправку можно передать позже через bind(): объект создается
+    в sessions, а обработчики живут в bot.
+    """
+
+    def __init__(self, generate: Optional[GenerateFunc] = None, deliver: Optional[DeliverFunc] = None,
+                 window: float = COALESCE_WINDOW):
+        self._generate = generate
+        self._deliver = deliver
+        self.window = window
+        self._pending: Dict[int, List[Any]] = {}
+        self._tasks: Dict[int, asyncio.Task] = {}
+        # сообщения, для которых сейчас идет генерация
+        self._inflight: Dict[int, List[Any]] = {}
+        self._delivering: Set[int] = set()
+
+        self.messages = 0
+        self.generations = 0
+        self.cancelled = 0
+
+    def bind(self, generate: GenerateFunc, deliver: DeliverFunc):
+        self._generate = generate
+        self._deliver = deliver
+
+    def submit(self, user_id: int, item: Any):
+        if self._generate is None or self._deliver is None:
+            raise RuntimeError("MessageCoalescer не привязан к генерации ответов")
+        self._pending.setdefault(user_id, []).append(item)
+        self.messages += 1
+        previous = self._tasks.get(user_id)
+        if previous is not None and not previous.done():
+            if user_id in self._delivering:
+                # ответ уже отправляется: задача сама возьмет новое сообщение после него
+                return
+            previous.cancel()
+            stale = self._inflight.pop(user_id, None)
+            if stale is not None:
+                self.cancelled += 1
+                self._pending[user_id] = stale + self._pending[user_id]
+        self._tasks[user_id] = asyncio.create_task(self._run(user_id, previous))
+
+    async def _run(self, user_id: int, previous: Optional[asyncio.Task] = None):
+        try:
+            if previous is not None:
+                # прежняя генерация должна завершиться до новой
+                await asyncio.wait([previous])
+            while self._pending.get(user_id):
+                await asyncio.sleep(self.window)
+                batch = self._inflight[user_id] = self._pending.pop(user_id)
+                self.generations += 1
+                try:
+                    result = await self._generate(user_id, batch)
+                except Exception as e:
+                    logger.error(f"Ошибка генерации ответа для user_id {user_id}: {e}", exc_info=True)
+                    continue
+                finally:
+                    if self._inflight.get(user_id) is batch:
+                        del self._inflight[user_id]
+
+                self._delivering.add(user_id)
+                try:
+                    await self._deliver(user_id, batch, result)
+                except Exception as e:
+                    logger.error(f"Ошибка отправки ответа для user_id {user_id}: {e}", exc_info=True)
+                finally:
+                    self._delivering.discard(user_id)
+        finally:
+            if self._tasks.get(user_id) is asyncio.current_task():
+                del self._tasks[user_id]
+
+    def pending(self, user_id: int) -> int:
+        return len(self._pending.get(user_id, ()))
+
+    def discard(self, user_id: int):
+        # выход из режима имитации: несделанные ответы больше не нужны
+        self._pending.pop(user_id, None)
+        self._inflight.pop(user_id, None)
+        task = self._tasks.get(user_id)
+        if task is not None and user_id not in self._delivering:
+            task.cancel()
+
+    async def stop(self):
+        tasks = list(self._tasks.values())
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        self._pending.clear()
+        logger.info(f"Склейка сообщений остановлена. Метрики: {self.metrics()}")
+
+    def metrics(self) -> Dict[str, Any]:
+        return {"messages": self.messages, "generations": self.generations, "cancelled": self.cancelled}
@@ -1,2 +1,55 @@
+import os
+
 BOT_TOKEN = "your_telegram_bot_token_here"
 OPENROUTER_API_KEY = "your_openrouter_api_key_here"
+
+# файлы из ZIP-архива экспорта разбираются параллельно, по процессу на ядро
+IMPORT_WORKERS = os.cpu_count() or 2
+IMPORT_MAX_PENDING = 20
+IMPORT_EXECUTOR = "process"
+# сколько может занимать после распаковки один файл переписки из ZIP и все они вместе
+IMPORT_ZIP_MAX_MEMBER = 16 * 1024 * 1024
+IMPORT_ZIP_MAX_UNCOMPRESSED = 512 * 1024 * 1024
+# сколько прежних импортов проверять как начало дописанного экспорта
+IMPORT_PREFIX_CANDIDATES = 4
+
+LLM_CONNECT_TIMEOUT = 5
+LLM_READ_TIMEOUT = 30
+LLM_TOTAL_TIMEOUT = 40
+LLM_CONNECTIONS_PER_HOST = 20
+LLM_KEEPALIVE_TIMEOUT = 60
+
+LLM_MAX_IN_FLIGHT = 8
+LLM_RATE_PER_SEC = 3
+LLM_RATE_BURST = 6
+LLM_MAX_RETRIES = 3
+LLM_RETRY_BASE_DELAY = 0.5
+LLM_RETRY_MAX_DELAY = 8
+
+RESPONSE_CACHE_SIZE = 5000
+RESPONSE_CACHE_TTL = 6 * 60 * 60
+RESPONSE_CACHE_VARIANTS = 3
+
+SESSION_IDLE_TTL = 24 * 60 * 60
+SESSION_MAX_COUNT = 10000
+SESSION_MEMORY_BUDGET = 256 * 1024 * 1024
+SESSION_BACKEND = "memory"
+SESSION_SWEEP_INTERVAL = 60
+
+RETRIEVAL_CACHE_SIZE = 32
+RETRIEVAL_MAX_MESSAGES = 200_000
+RETRIEVAL_MAX_POSTINGS = 200
+RETRIEVAL_MAX_QUERY_TERMS = 8
+RETRIEVAL_EXAMPLES = 2
+
+PROMPT_TOKEN_BUDGET = 400
+PROMPT_HISTORY_MESSAGES = 2
+PROMPT_EXAMPLE_CHARS = 200
+
+LLM_STREAMING = True
+# Telegram ограничивает частоту правок, чаще раза в секунду сообщение не обновляем
+STREAM_EDIT_INTERVAL = 1.0
+STREAM_PLACEHOLDER = "✍️"
+
+# сообщения, пришедшие с меньшей паузой, отвечаются одной генерацией
+COALESCE_WINDOW = 0.8
@@ -0,0 +1,134 @@
+import sys
+from array import array
+from collections import Counter
+from itertools import islice
+from typing import Dict, Iterable, Iterator, List, Optional, Sequence, Union
+
+# id сообщения в экспорте неизвестен (сообщения из базы, старые форматы)
+NO_MESSAGE_ID = -1
+
+class Vocabulary:
+    """Словарь интернированных токенов: строка <-> числовой id.
+
+    Один словарь можно разделить между несколькими корпусами, например
+    между всеми авторами одной выгрузки.
+    """
+
+    def __init__(self):
+        self.tokens: List[str] = []
+        self.ids: Dict[str, int] = {}
+
+    def __len__(self) -> int:
+        return len(self.tokens)
+
+    def intern(self, token: str) -> int:
+        token_id = self.ids.get(token)
+        if token_id is None:
+            token_id = self.ids[token] = len(self.tokens)
+            self.tokens.append(token)
+        return token_id
+
+    def translate(self, other: 'Vocabulary') -> array:
+        # таблица id другого словаря -> id этого, для склейки корпусов
+        return array('I', map(self.intern, other.tokens))
+
+    def __sizeof__(self) -> int:
+        return (sys.getsizeof(self.tokens) + sys.getsizeof(self.ids)
+                + sum(sys.getsizeof(token) for token in self.tokens))
+
+
+class Corpus(Sequence):
+    """Сообщения профиля в компактном виде.
+
+    Слова хранятся id из Vocabulary в одном array('I'), границы сообщений —
+    смещениями. Текст сообщения собирается обратно через пробел; сообщения,
+    где пробелы были другими (переносы строк, двойные пробелы), хранятся
+    как есть. Снаружи это последовательность строк, как прежний список.
+    Для сообщений из экспорта рядом хранится их id (message_ids).
+    """
+
+    def __init__(self, messages: Iterable[str] = (), vocabulary: Optional[Vocabulary] = None):
+        self.vocabulary = vocabulary if vocabulary is not None else Vocabulary()
+        self.tokens = array('I')
+        self.offsets = array('I', [0])
+        self.lengths = array('I')
+        self.irregular: Dict[int, str] = {}
+        self.message_ids = array('q')
+        self.extend(messages)
+
+    def append(self, text: str, message_id: int = NO_MESSAGE_ID):
+        words = text.split()
+        intern = self.vocabulary.intern
+        self.tokens.extend([intern(word) for word in words])
+        if ' '.join(words) != text:
+            self.irregular[len(self.lengths)] = text
+        self.offsets.append(len(self.tokens))
+        self.lengths.append(len(text))
+        self.message_ids.append(message_id)
+
+    def extend(self, messages: Iterable[str]):
+        if isinstance(messages, Corpus):
+            self.extend_corpus(messages)
+            return
+        for text in messages:
+            self.append(text)
+
+    def extend_corpus(self, other: 'Corpus', mapping: Optional[array] = None):
+        # дописывает другой корпус без разбора текста: id переводятся таблицей,
+        # которую для общего словаря нескольких корпусов можно посчитать один раз
+        if other.vocabulary is self.vocabulary:
+            tokens = other.tokens
+        else:
+            if mapping is None:
+                mapping = self.vocabulary.translate(other.vocabulary)
+            tokens = array('I', map(mapping.__getitem__, other.tokens))
+        base = len(self.lengths)
+        shift = len(self.tokens)
+        self.tokens.extend(tokens)
+        self.offsets.extend(offset + shift for offset in islice(other.offsets, 1, None))
+        self.lengths.extend(other.lengths)
+        self.message_ids.extend(other.message_ids)
+        self.irregular.update((base + index, text) for index, text in other.irregular.items())
+
+    def __len__(self) -> int:
+        return len(self.lengths)
+
+    def __getitem__(self, index: Union[int, slice]) -> Union[str, List[str]]:
+        if isinstance(index, slice):
+            return [self[i] for i in range(*index.indices(len(self)))]
+        if index < 0:
+            index += len(self)
+        if not 0 <= index < len(self):
+            raise IndexError("Corpus index out of range")
+        text = self.irregular.get(index)
+        if text is None:
+            text = ' '.join(self.words(index))
+        return text
+
+    def __iter__(self) -> Iterator[str]:
+        for index in range(len(self)):
+            yield self[index]
+
+    def word_ids(self, index: int) -> array:
+        return self.tokens[self.offsets[index]:self.offsets[index + 1]]
+
+    def words(self, index: int) -> List[str]:
+        vocabulary = self.vocabulary.tokens
+        return [vocabulary[token_id] for token_id in self.word_ids(index)]
+
+    def word_count(self, index: int) -> int:
+        return self.offsets[index + 1] - self.offsets[index]
+
+    def iter_words(self) -> Iterator[str]:
+        return map(self.vocabulary.tokens.__getitem__, self.tokens)
+
+    def token_counts(self) -> Counter:
+        # частоты id по всему корпусу, без повторной токенизации
+        return Counter(self.tokens)
+
+    def __sizeof__(self) -> int:
+        # словарь может быть общим, но для оценки памяти профиля считаем его целиком
+        return (object.__sizeof__(self) + self.tokens.__sizeof__() + self.offsets.__sizeof__()
+                + self.lengths.__sizeof__() + self.message_ids.__sizeof__() + sys.getsizeof(self.irregular)
+                + sum(sys.getsizeof(text) for text in self.irregular.values())
+                + sys.getsizeof(self.vocabulary))
@@ -1,63 +1,523 @@
 import sqlite3
+import hashlib
 import logging
+import re
+import time
+from collections import Counter
 from datetime import datetime
-from typing import List, Optional, Dict, Any
+from typing import Iterator, List, Optional, Dict, Any, Sequence
 import json
 
+from corpus import NO_MESSAGE_ID
+from heavy_hitters import TopKCounter
+from style_analysis import StyleStats, count_report_words, REPORT_STOP_WORDS
+
 logger = logging.getLogger(__name__)
 
-def init_db():
-    conn = sqlite3.connect("user_data.db", check_same_thread=False)
-    cursor = conn.cursor()
+DB_PATH = "user_data.db"
+FTS_MAX_QUERY_TERMS = 16
+
+
+def _migrate_v1(cursor: sqlite3.Cursor):
+    # style_data выносится из каждой строки сообщений в отдельную таблицу profiles
+    cursor.execute("""
+    CREATE TABLE profiles (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        user_id INTEGER NOT NULL,
+        target TEXT NOT NULL,
+        style_data TEXT,
+        message_count INTEGER NOT NULL DEFAULT 0,
+        avg_len REAL NOT NULL DEFAULT 0,
+        updated_at DATETIME DEFAULT CURRENT_TIMESTAMP,
+        UNIQUE (user_id, target)
+    )
+    """)
 
     cursor.execute("""
-    CREATE TABLE IF NOT EXISTS imitation_data (
+    CREATE TABLE imitation_data_v1 (
         id INTEGER PRIMARY KEY AUTOINCREMENT,
-        user_id INTEGER,
-        target TEXT,
+        profile_id INTEGER NOT NULL REFERENCES profiles (id) ON DELETE CASCADE,
         message TEXT,
-        timestamp DATETIME DEFAULT CURRENT_TIMESTAMP,
-        style_data TEXT
+        timestamp DATETIME DEFAULT CURRENT_TIMESTAMP
     )
     """)
 
+    cursor.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'imitation_data'")
+    if cursor.fetchone():
+        cursor.execute("""
+        INSERT INTO profiles (user_id, target, style_data, message_count, avg_len, updated_at)
+        SELECT user_id, target, MAX(style_data), COUNT(*), AVG(LENGTH(message)), MAX(timestamp)
+        FROM imitation_data
+        WHERE user_id IS NOT NULL AND target IS NOT NULL
+        GROUP BY user_id, target
+        """)
+        cursor.execute("""
+        INSERT INTO imitation_data_v1 (id, profile_id, message, timestamp)
+        SELECT d.id, p.id, d.message, d.timestamp
+        FROM imitation_data d
+        JOIN profiles p ON p.user_id = d.user_id AND p.target = d.target
+        """)
+        cursor.execute("DROP TABLE imitation_data")
+
+    cursor.execute("ALTER TABLE imitation_data_v1 RENAME TO imitation_data")
     cursor.execute("""
-    CREATE INDEX IF NOT EXISTS idx_user_target
-    ON imitation_data (user_id, target)
+    CREATE INDEX idx_profile_timestamp
+    ON imitation_data (profile_id, timestamp)
     """)
 
-    conn.commit()
-    return conn, cursor
 
-conn, cursor = init_db()
+def _migrate_v2(cursor: sqlite3.Cursor):
+    # снимки вытесненных из памяти сессий бота
+    cursor.execute("""
+    CREATE TABLE sessions (
+        kind TEXT NOT NULL,
+        user_id INTEGER NOT NULL,
+        data TEXT NOT NULL,
+        updated_at DATETIME DEFAULT CURRENT_TIMESTAMP,
+        PRIMARY KEY (kind, user_id)
+    )
+    """)
+
+
+def _migrate_v3(cursor: sqlite3.Cursor):
+    # накопленная StyleStats профиля для инкрементального обновления стиля
+    cursor.execute("ALTER TABLE profiles ADD COLUMN style_stats TEXT")
+
+
+def _migrate_v4(cursor: sqlite3.Cursor):
+    # частые слова для отчета статистики считаются при импорте, а не на каждый запрос
+    cursor.execute("ALTER TABLE profiles ADD COLUMN report_stats TEXT")
+
+    profiles = cursor.execute("SELECT id FROM profiles").fetchall()
+    for (profile_id,) in profiles:
+        messages = cursor.execute(
+            "SELECT message FROM imitation_data WHERE profile_id = ?",
+            (profile_id,)
+        )
+        report_stats = count_report_words(row[0] for row in messages).to_dict()
+        cursor.execute(
+            "UPDATE profiles SET report_stats = ? WHERE id = ?",
+            (json.dumps(report_stats, ensure_ascii=False), profile_id)
+        )
+
+
+def _migrate_v5(cursor: sqlite3.Cursor):
+    # полнотекстовый индекс по сообщениям; обновляется пачками в save_messages,
+    # delete_target и clear_data (построчные триггеры в разы замедляли импорт)
+    cursor.execute("""
+    CREATE VIRTUAL TABLE imitation_fts USING fts5(
+        message,
+        content = 'imitation_data',
+        content_rowid = 'id'
+    )
+    """)
+    cursor.execute("INSERT INTO imitation_fts (imitation_fts) VALUES ('rebuild')")
+
+
+def _migrate_v6(cursor: sqlite3.Cursor):
+    # загруженные файлы экспорта: повторная загрузка того же файла не разбирается
+    # заново, а дописанный экспорт разбирается только с prefix_size
+    cursor.execute("""
+    CREATE TABLE imports (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        user_id INTEGER NOT NULL,
+        file_unique_id TEXT,
+        content_hash TEXT,
+        format TEXT NOT NULL,
+        size INTEGER NOT NULL,
+        prefix_size INTEGER,
+        prefix_hash TEXT,
+        last_message_id INTEGER,
+        chat_name TEXT,
+        summary TEXT NOT NULL,
+        created_at DATETIME DEFAULT CURRENT_TIMESTAMP
+    )
+    """)
+    cursor.execute("CREATE INDEX idx_imports_hash ON imports (user_id, content_hash)")
+    cursor.execute("CREATE INDEX idx_imports_file ON imports (user_id, file_unique_id)")
+
+
+def _migrate_v7(cursor: sqlite3.Cursor):
+    # ключ сообщения для слияния импортов без удаления истории (merge_messages);
+    # строкам из прежних версий ключи присваиваются при первом слиянии в их профиль
+    cursor.execute("ALTER TABLE imitation_data ADD COLUMN message_key TEXT")
+    cursor.execute("CREATE UNIQUE INDEX idx_profile_message_key ON imitation_data (profile_id, message_key)")
+
+
+def _migrate_v8(cursor: sqlite3.Cursor):
+    # индекс с колонкой profile (токен p<id>): поиск сужается до профиля в самом
+    # MATCH, а не фильтрует совпадения по всей базе после него
+    cursor.execute("DROP TABLE imitation_fts")
+    cursor.execute("ALTER TABLE imitation_data ADD COLUMN profile TEXT GENERATED ALWAYS AS ('p' || profile_id) VIRTUAL")
+    cursor.execute("""
+    CREATE VIRTUAL TABLE imitation_fts USING fts5(
+        message,
+        profile,
+        content = 'imitation_data',
+        content_rowid = 'id'
+    )
+    """)
+    cursor.execute("INSERT INTO imitation_fts (imitation_fts) VALUES ('rebuild')")
+
+
+def _unindex_profiles(cursor: sqlite3.Cursor, profile_ids_sql: str, params: tuple):
+    # external content FTS5 удаляет строку только по ее прежнему тексту,
+    # поэтому делать это нужно до удаления самих сообщений
+    cursor.execute(
+        f"""INSERT INTO imitation_fts (imitation_fts, rowid, message, profile)
+        SELECT 'delete', id, message, profile FROM imitation_data
+        WHERE profile_id IN ({profile_ids_sql})""",
+        params
+    )
+
+
+MIGRATIONS = [
+    _migrate_v1,
+    _migrate_v2,
+    _migrate_v3,
+    _migrate_v4,
+    _migrate_v5,
+    _migrate_v6,
+    _migrate_v7,
+    _migrate_v8,
+]
 
-def save_messages(user_id: int, target: str, messages: List[str], style_data: Optional[Dict[str, Any]] = None):
+
+def _apply_migrations(conn: sqlite3.Connection, cursor: sqlite3.Cursor):
+    version = cursor.execute("PRAGMA user_version").fetchone()[0]
+    if version >= len(MIGRATIONS):
+        return
+
+    for number, migration in enumerate(MIGRATIONS[version:], start=version + 1):
+        try:
+            cursor.execute("BEGIN")
+            migration(cursor)
+            cursor.execute(f"PRAGMA user_version = {number}")
+            conn.commit()
+            logger.info(f"Схема базы данных обновлена до версии {number}.")
+        except sqlite3.Error:
+            conn.rollback()
+            raise
+
+    if version < 1:
+        # старые строки с копиями style_data удалены, возвращаем место на диске
+        cursor.execute("VACUUM")
+        cursor.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+
+
+conn: Optional[sqlite3.Connection] = None
+
+
+def init_db() -> sqlite3.Connection:
+    global conn
+    if conn is not None:
+        return conn
+
+    # соединение создается здесь, но дальше используется только из потока repository
+    conn = sqlite3.connect(DB_PATH, check_same_thread=False)
+    cursor = conn.cursor()
+
+    cursor.execute("PRAGMA journal_mode=WAL")
+    cursor.execute("PRAGMA synchronous=NORMAL")
+    cursor.execute("PRAGMA cache_size=-20000")
+    cursor.execute("PRAGMA temp_store=MEMORY")
+    cursor.execute("PRAGMA foreign_keys=ON")
+
+    _apply_migrations(conn, cursor)
+    cursor.close()
+    return conn
+
+def _text_digest(text: str) -> str:
+    return hashlib.blake2b(text.encode('utf-8'), digest_size=8).hexdigest()
+
+def message_keys(messages: Sequence[str], message_ids: Optional[Sequence[int]] = None) -> Iterator[str]:
+    # id из экспорта уникален в пределах чата, хэш текста различает чаты с совпавшими id;
+    # без id ключ — хэш текста и номер его повтора в пачке
+    repeats: Counter = Counter()
+    for index, text in enumerate(messages):
+        digest = _text_digest(text)
+        message_id = message_ids[index] if message_ids is not None else NO_MESSAGE_ID
+        if message_id != NO_MESSAGE_ID:
+            yield f"m{message_id}:{digest}"
+        else:
+            repeats[digest] += 1
+            yield f"h{digest}:{repeats[digest]}"
+
+def save_messages(user_id: int, target: str, messages: List[str], style_data: Optional[Dict[str, Any]] = None,
+                  style_stats: Optional[Dict[str, Any]] = None, report_stats: Optional[Dict[str, Any]] = None,
+                  message_ids: Optional[Sequence[int]] = None) -> bool:
+    # заменяет все сообщения профиля; дополнить профиль без потери истории — merge_messages
+    cursor = conn.cursor()
     try:
+        started = time.perf_counter()
+        style_data_json = json.dumps(style_data) if style_data else None
+        style_stats_json = json.dumps(style_stats, ensure_ascii=False) if style_stats else None
+        if report_stats is None:
+            report_stats = count_report_words(messages).to_dict()
+        report_stats_json = json.dumps(report_stats, ensure_ascii=False)
+        # тот же формат, что дает стандартный адаптер sqlite3 для datetime
+        timestamp = datetime.now().isoformat(" ")
+        avg_len = sum(len(msg) for msg in messages) / len(messages) if messages else 0
+
+        if not conn.in_transaction:
+            cursor.execute("BEGIN")
         cursor.execute(
-            "DELETE FROM imitation_data WHERE user_id = ? AND target = ?",
+            """INSERT INTO profiles (user_id, target, style_data, style_stats, report_stats, message_count, avg_len, updated_at)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+            ON CONFLICT (user_id, target) DO UPDATE SET
+                style_data = excluded.style_data,
+                style_stats = excluded.style_stats,
+                report_stats = excluded.report_stats,
+                message_count = excluded.message_count,
+                avg_len = excluded.avg_len,
+                updated_at = excluded.updated_at""",
+            (user_id, target, style_data_json, style_stats_json, report_stats_json, len(messages), avg_len, timestamp)
+        )
+        cursor.execute(
+            "SELECT id FROM profiles WHERE user_id = ? AND target = ?",
             (user_id, target)
         )
+        profile_id = cursor.fetchone()[0]
 
-        style_data_json = json.dumps(style_data) if style_data else None
+        _unindex_profiles(cursor, "?", (profile_id,))
+        cursor.execute(
+            "DELETE FROM imitation_data WHERE profile_id = ?",
+            (profile_id,)
+        )
+        cursor.executemany(
+            """INSERT INTO imitation_data
+            (profile_id, message, timestamp, message_key)
+            VALUES (?, ?, ?, ?)
+            ON CONFLICT (profile_id, message_key) DO NOTHING""",
+            ((profile_id, msg, timestamp, key) for msg, key in zip(messages, message_keys(messages, message_ids)))
+        )
+        cursor.execute(
+            """INSERT INTO imitation_fts (rowid, message, profile)
+            SELECT id, message, profile FROM imitation_data WHERE profile_id = ?""",
+            (profile_id,)
+        )
+        conn.commit()
+
+        elapsed = time.perf_counter() - started
+        rows_per_sec = len(messages) / elapsed if elapsed > 0 else 0
+        logger.info(f"Сохранено {len(messages)} строк для target '{target}' за {elapsed:.3f} с ({rows_per_sec:.0f} строк/с).")
+        return True
+    except sqlite3.Error as e:
+        logger.error(f"Ошибка базы данных при сохранении сообщений: {e}")
+        conn.rollback()
+        return False
+
+def _key_legacy_rows(cursor: sqlite3.Cursor, profile_id: int, messages: Sequence[str], keys: List[str]) -> int:
+    # строки из версий до v7 без ключа не удаляются: строка берет ключ сообщения пачки
+    # с тем же текстом (и оно не добавится второй раз), остальные — свой ключ по id строки
+    rows = cursor.execute(
+        "SELECT id, message FROM imitation_data WHERE profile_id = ? AND message_key IS NULL ORDER BY id",
+        (profile_id,)
+    ).fetchall()
+    if not rows:
+        return 0
+    free: Dict[str, List[str]] = {}
+    for msg, key in zip(reversed(messages), reversed(keys)):
+        free.setdefault(_text_digest(msg), []).append(key)
+    updates = []
+    for row_id, msg in rows:
+        matching = free.get(_text_digest(msg))
+        updates.append((matching.pop() if matching else f"l{row_id}", row_id))
+    cursor.executemany("UPDATE imitation_data SET message_key = ? WHERE id = ?", updates)
+    logger.info(f"Присвоены ключи {len(updates)} сообщениям профиля {profile_id} из прежней версии базы.")
+    return len(updates)
+
+def merge_messages(user_id: int, target: str, messages: Sequence[str], message_ids: Optional[Sequence[int]] = None,
+                   style_stats: Optional[Dict[str, Any]] = None, report_stats: Optional[Dict[str, Any]] = None,
+                   min_samples: int = 0) -> int:
+    """Добавляет к профилю только сообщения, которых в нем еще нет.
 
-        for msg in messages:
-            cursor.execute(
-                """INSERT INTO imitation_data
-                (user_id, target, message, timestamp, style_data)
-                VALUES (?, ?, ?, ?, ?)""",
-                (user_id, target, msg, datetime.now(), style_data_json)
+    Сообщения с уже известным message_key пропускает INSERT ... ON CONFLICT
+    DO NOTHING. Сводки стиля и частых слов профиля дополняются только
+    добавленными строками, в полнотекстовый индекс попадают только они.
+    Возвращает число добавленных сообщений, -1 при ошибке.
+    """
+    cursor = conn.cursor()
+    try:
+        started = time.perf_counter()
+        row = cursor.execute(
+            """SELECT id, style_stats, report_stats, message_count, avg_len FROM profiles
+            WHERE user_id = ? AND target = ?""",
+            (user_id, target)
+        ).fetchone()
+        if row is None:
+            # профиля еще нет; порог стиля — как в analyze_authors, по числу сообщений
+            stats = None
+            if len(messages) >= min_samples:
+                stats = StyleStats.from_dict(style_stats) if style_stats else StyleStats().update(messages)
+            saved = save_messages(
+                user_id, target, messages, stats.finalize() if stats else None,
+                stats.to_dict() if stats else None, report_stats, message_ids
+            )
+            return len(messages) if saved else -1
+        profile_id, stored_style, stored_report, message_count, avg_len = row
+        timestamp = datetime.now().isoformat(" ")
+        keys = list(message_keys(messages, message_ids))
+
+        if not conn.in_transaction:
+            cursor.execute("BEGIN")
+        legacy = _key_legacy_rows(cursor, profile_id, messages, keys)
+        last_id = cursor.execute("SELECT COALESCE(MAX(id), 0) FROM imitation_data").fetchone()[0]
+        cursor.executemany(
+            """INSERT INTO imitation_data
+            (profile_id, message, timestamp, message_key)
+            VALUES (?, ?, ?, ?)
+            ON CONFLICT (profile_id, message_key) DO NOTHING""",
+            ((profile_id, msg, timestamp, key) for msg, key in zip(messages, keys))
+        )
+        added = [msg for (msg,) in cursor.execute(
+            "SELECT message FROM imitation_data WHERE id > ? AND profile_id = ? ORDER BY id",
+            (last_id, profile_id)
+        )]
+        if not added:
+            # все сообщения уже были: ни профиль, ни индекс не переписываются
+            if legacy:
+                conn.commit()
+            else:
+                conn.rollback()
+            logger.info(f"Новых сообщений для target '{target}' нет, профиль не изменен ({time.perf_counter() - started:.3f} с).")
+            return 0
+
+        # готовые сводки пачки годятся, только если добавлена вся пачка
+        if len(added) == len(messages) and style_stats:
+            added_style = StyleStats.from_dict(style_stats)
+        else:
+            added_style = StyleStats().update(added)
+        if len(added) == len(messages) and report_stats:
+            added_report = TopKCounter.from_dict(report_stats)
+        else:
+            added_report = count_report_words(added)
+
+        def all_messages():
+            return (msg for (msg,) in conn.execute(
+                "SELECT message FROM imitation_data WHERE profile_id = ? ORDER BY id", (profile_id,)
+            ))
+
+        # у маленького профиля сводки стиля не было: считаем ее по всем сообщениям
+        if stored_style:
+            merged_style = StyleStats.from_dict(json.loads(stored_style)).merge(added_style)
+        else:
+            merged_style = StyleStats().update(all_messages())
+        if stored_report:
+            merged_report = TopKCounter.from_dict(json.loads(stored_report)).merge(added_report)
+        else:
+            merged_report = count_report_words(all_messages())
+
+        total = message_count + len(added)
+        avg_len = (avg_len * message_count + sum(len(msg) for msg in added)) / total
+        has_style = total >= min_samples
+        cursor.execute(
+            """UPDATE profiles SET style_data = ?, style_stats = ?, report_stats = ?,
+                message_count = ?, avg_len = ?, updated_at = ?
+            WHERE id = ?""",
+            (
+                json.dumps(merged_style.finalize()) if has_style else None,
+                json.dumps(merged_style.to_dict(), ensure_ascii=False) if has_style else None,
+                json.dumps(merged_report.to_dict(), ensure_ascii=False),
+                total, avg_len, timestamp, profile_id
             )
+        )
+        cursor.execute(
+            """INSERT INTO imitation_fts (rowid, message, profile)
+            SELECT id, message, profile FROM imitation_data WHERE id > ? AND profile_id = ?""",
+            (last_id, profile_id)
+        )
         conn.commit()
+        logger.info(f"Добавлено {len(added)} из {len(messages)} строк к target '{target}' за {time.perf_counter() - started:.3f} с.")
+        return len(added)
     except sqlite3.Error as e:
-        logger.error(f"Ошибка базы данных при сохранении сообщений: {e}")
+        logger.error(f"Ошибка базы данных при слиянии сообщений: {e}")
         conn.rollback()
+        return -1
+
+_IMPORT_COLUMNS = ("id", "file_unique_id", "content_hash", "format", "size", "prefix_size",
+                   "prefix_hash", "last_message_id", "chat_name", "summary")
+
+def _import_row(row: Optional[tuple]) -> Optional[Dict[str, Any]]:
+    if row is None:
+        return None
+    result = dict(zip(_IMPORT_COLUMNS, row))
+    result["summary"] = json.loads(result["summary"])
+    return result
 
-def get_messages(user_id: int, target: str, limit: int = 50) -> List[str]:
+def find_import(user_id: int, file_unique_id: Optional[str] = None,
+                content_hash: Optional[str] = None) -> Optional[Dict[str, Any]]:
+    # тот же файл Telegram или файл с тем же содержимым, загруженный раньше
+    cursor = conn.cursor()
     try:
         cursor.execute(
-            """SELECT message FROM imitation_data
-            WHERE user_id = ? AND target = ?
-            ORDER BY timestamp DESC LIMIT ?""",
+            f"""SELECT {', '.join(_IMPORT_COLUMNS)} FROM imports
+            WHERE user_id = ? AND (file_unique_id = ? OR content_hash = ?)
+            ORDER BY id DESC LIMIT 1""",
+            (user_id, file_unique_id, content_hash)
+        )
+        return _import_row(cursor.fetchone())
+    except sqlite3.Error as e:
+        logger.error(f"Ошибка базы данных при поиске импорта user_id {user_id}: {e}")
+        return None
+
+def get_prefix_candidates(user_id: int, fmt: str, size: int, limit: int) -> List[Dict[str, Any]]:
+    # импорты, которые могут быть началом файла размера size: сначала самые длинные
+    cursor = conn.cursor()
+    try:
+        cursor.execute(
+            f"""SELECT {', '.join(_IMPORT_COLUMNS)} FROM imports
+            WHERE user_id = ? AND format = ? AND prefix_size < ?
+            ORDER BY prefix_size DESC, id DESC LIMIT ?""",
+            (user_id, fmt, size, limit)
+        )
+        return [_import_row(row) for row in cursor.fetchall()]
+    except sqlite3.Error as e:
+        logger.error(f"Ошибка базы данных при поиске прежних импортов user_id {user_id}: {e}")
+        return []
+
+def save_import(user_id: int, file_unique_id: Optional[str], fingerprint: Dict[str, Any],
+                chat_name: Optional[str], summary: Dict[str, Any]):
+    cursor = conn.cursor()
+    try:
+        cursor.execute(
+            """INSERT INTO imports (user_id, file_unique_id, content_hash, format, size, prefix_size,
+                prefix_hash, last_message_id, chat_name, summary)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)""",
+            (
+                user_id, file_unique_id, fingerprint.get("content_hash"), fingerprint["format"],
+                fingerprint["size"], fingerprint.get("prefix_size"), fingerprint.get("prefix_hash"),
+                fingerprint.get("last_message_id"), chat_name, json.dumps(summary, ensure_ascii=False)
+            )
+        )
+        conn.commit()
+    except sqlite3.Error as e:
+        logger.error(f"Ошибка базы данных при сохранении импорта user_id {user_id}: {e}")
+        conn.rollback()
+
+def _fts_query(text: str) -> Optional[str]:
+    # слова запроса в кавычках через OR, чтобы спецсимволы FTS5 не ломали разбор
+    terms = []
+    for word in re.findall(r"\w+", text.lower()):
+        if len(word) > 1 and word not in REPORT_STOP_WORDS and word not in terms:
+            terms.append(word)
+    if not terms:
+        return None
+    return " OR ".join(f'"{term}"' for term in terms[:FTS_MAX_QUERY_TERMS])
+
+
+def get_messages(user_id: int, target: str, limit: int = 50, query: Optional[str] = None) -> List[str]:
+    # с query — самые релевантные по FTS5 сообщения, без загрузки всего профиля
+    if query is not None:
+        return _search_messages(user_id, target, query, limit)
+
+    cursor = conn.cursor()
+    try:
+        cursor.execute(
+            """SELECT d.message FROM imitation_data d
+            JOIN profiles p ON p.id = d.profile_id
+            WHERE p.user_id = ? AND p.target = ?
+            ORDER BY d.timestamp DESC LIMIT ?""",
             (user_id, target, limit)
         )
         return [msg[0] for msg in cursor.fetchall()]
@@ -65,24 +525,85 @@ def get_messages(user_id: int, target: str, limit: int = 50) -> List[str]:
         logger.error(f"Ошибка базы данных при получении сообщений: {e}")
         return []
 
+def _search_messages(user_id: int, target: str, query: str, limit: int) -> List[str]:
+    fts_query = _fts_query(query)
+    if fts_query is None:
+        return []
+    cursor = conn.cursor()
+    try:
+        cursor.execute("SELECT id FROM profiles WHERE user_id = ? AND target = ?", (user_id, target))
+        row = cursor.fetchone()
+        if row is None:
+            return []
+        # слова ищутся только в message, профиль — отдельным токеном в profile
+        cursor.execute(
+            """SELECT d.message FROM imitation_fts f
+            JOIN imitation_data d ON d.id = f.rowid
+            WHERE imitation_fts MATCH ?
+            ORDER BY f.rank LIMIT ?""",
+            (f"profile:p{row[0]} AND message:({fts_query})", limit)
+        )
+        return [msg[0] for msg in cursor.fetchall()]
+    except sqlite3.Error as e:
+        logger.error(f"Ошибка базы данных при поиске сообщений: {e}")
+        return []
+
 def clear_data(user_id: int) -> bool:
+    cursor = conn.cursor()
     try:
+        _unindex_profiles(cursor, "SELECT id FROM profiles WHERE user_id = ?", (user_id,))
         cursor.execute(
-            "DELETE FROM imitation_data WHERE user_id = ?",
+            "DELETE FROM profiles WHERE user_id = ?",
             (user_id,)
         )
+        cursor.execute("DELETE FROM imports WHERE user_id = ?", (user_id,))
         conn.commit()
         return True
     except sqlite3.Error as e:
         logger.error(f"Ошибка базы данных при очистке данных: {e}")
+        conn.rollback()
+        return False
+
+def get_saved_targets(user_id: int) -> List[str]:
+    cursor = conn.cursor()
+    try:
+        cursor.execute(
+            "SELECT target FROM profiles WHERE user_id = ? ORDER BY target",
+            (user_id,)
+        )
+        return [row[0] for row in cursor.fetchall() if row and row[0]]
+    except sqlite3.Error as e:
+        logger.error(f"Ошибка базы данных при получении профилей user_id {user_id}: {e}")
+        return []
+
+def delete_target(user_id: int, target: str) -> bool:
+    cursor = conn.cursor()
+    try:
+        _unindex_profiles(cursor, "SELECT id FROM profiles WHERE user_id = ? AND target = ?", (user_id, target))
+        cursor.execute(
+            "DELETE FROM profiles WHERE user_id = ? AND target = ?",
+            (user_id, target)
+        )
+        deleted = cursor.rowcount
+        # без профиля прежние импорты уже не отражают базу: следующая загрузка — полная
+        cursor.execute("DELETE FROM imports WHERE user_id = ?", (user_id,))
+        conn.commit()
+        if deleted > 0:
+            logger.info(f"Удален профиль и его сообщения для user_id {user_id}, target '{target}'.")
+        else:
+            logger.warning(f"Не найдены записи для удаления (user_id {user_id}, target '{target}').")
+        return True
+    except sqlite3.Error as e:
+        logger.error(f"Ошибка БД при удалении профиля '{target}' для user_id {user_id}: {e}")
+        conn.rollback()
         return False
 
 def get_style_data_from_db(user_id: int, target: str) -> Optional[Dict[str, Any]]:
+    cursor = conn.cursor()
     try:
         cursor.execute(
-            """SELECT style_data FROM imitation_data
-            WHERE user_id = ? AND target = ?
-            LIMIT 1""",
+            """SELECT style_data FROM profiles
+            WHERE user_id = ? AND target = ?""",
             (user_id, target)
         )
         result = cursor.fetchone()
@@ -93,24 +614,65 @@ def get_style_data_from_db(user_id: int, target: str) -> Optional[Dict[str, Any]
         logger.error(f"Ошибка базы данных при получении style_data: {e}")
         return None
 
-def get_stats_data(user_id: int) -> Dict[str, List[str]]:
-    stats_dict: Dict[str, List[str]] = {}
+def get_profile_stats(user_id: int) -> List[Dict[str, Any]]:
+    cursor = conn.cursor()
     try:
         cursor.execute("""
-            SELECT target, message
-            FROM imitation_data
+            SELECT target, message_count, avg_len, report_stats
+            FROM profiles
             WHERE user_id = ?
-            ORDER BY target, timestamp
+            ORDER BY target
         """, (user_id,))
-        rows = cursor.fetchall()
+        return [
+            {
+                "target": target,
+                "message_count": message_count,
+                "avg_len": avg_len,
+                "report_stats": json.loads(report_stats) if report_stats else None,
+            }
+            for target, message_count, avg_len, report_stats in cursor.fetchall()
+        ]
+    except sqlite3.Error as e:
+        logger.error(f"Database error in get_profile_stats for user {user_id}: {e}")
+        return []
 
-        for target, message in rows:
-            if target not in stats_dict:
-                stats_dict[target] = []
-            stats_dict[target].append(message)
+def save_session(kind: str, user_id: int, data: str):
+    cursor = conn.cursor()
+    try:
+        cursor.execute(
+            """INSERT INTO sessions (kind, user_id, data, updated_at)
+            VALUES (?, ?, ?, CURRENT_TIMESTAMP)
+            ON CONFLICT (kind, user_id) DO UPDATE SET
+                data = excluded.data,
+                updated_at = excluded.updated_at""",
+            (kind, user_id, data)
+        )
+        conn.commit()
+    except sqlite3.Error as e:
+        logger.error(f"Ошибка базы данных при сохранении сессии {kind} user_id {user_id}: {e}")
+        conn.rollback()
+
+def load_session(kind: str, user_id: int) -> Optional[str]:
+    cursor = conn.cursor()
+    try:
+        cursor.execute(
+            "SELECT data FROM sessions WHERE kind = ? AND user_id = ?",
+            (kind, user_id)
+        )
+        row = cursor.fetchone()
+        return row[0] if row else None
+    except sqlite3.Error as e:
+        logger.error(f"Ошибка базы данных при загрузке сессии {kind} user_id {user_id}: {e}")
+        return None
 
-        return stats_dict
+def delete_session(kind: str, user_id: int):
+    cursor = conn.cursor()
+    try:
+        cursor.execute(
+            "DELETE FROM sessions WHERE kind = ? AND user_id = ?",
+            (kind, user_id)
+        )
+        conn.commit()
     except sqlite3.Error as e:
-        print(f"Database error in get_stats_data: {e}")
-        logger.error(f"Database error in get_stats_data for user {user_id}: {e}")
-        return {}
+        logger.error(f"Ошибка базы данных при удалении сессии {kind} user_id {user_id}: {e}")
+        conn.rollback()
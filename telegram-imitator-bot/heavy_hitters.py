@@ -0,0 +1,100 @@
+import heapq
+import math
+from typing import Any, Dict, Hashable, Iterable, List, Mapping, Optional, Tuple, Union
+
+
+def capacity_for_error(epsilon: float) -> int:
+    # оценка частоты занижена не больше чем на epsilon * N
+    return max(1, math.ceil(1 / epsilon))
+
+
+class TopKCounter:
+    """Счетчик частых элементов с ограниченной памятью (Misra-Gries).
+
+    Хранит не больше 2 * capacity ключей. Пока различных ключей меньше этого
+    предела, счет точный; дальше каждая оценка занижена не более чем на
+    error <= N / capacity. capacity=None — точный режим, как у Counter.
+    """
+
+    def __init__(self, capacity: Optional[int] = None):
+        self.capacity = capacity
+        self.counts: Dict[Hashable, int] = {}
+        self.total = 0
+        self.error = 0
+
+    def __len__(self) -> int:
+        return len(self.counts)
+
+    def __getitem__(self, item: Hashable) -> int:
+        return self.counts.get(item, 0)
+
+    @property
+    def exact(self) -> bool:
+        return self.error == 0
+
+    def update(self, items: Union[Iterable[Hashable], Mapping[Hashable, int]]):
+        if isinstance(items, Mapping):
+            # готовые частоты (пачка) уже в памяти: складываем и сжимаем один раз,
+            # как при слиянии двух сводок
+            counts = self.counts
+            if counts:
+                for item, count in items.items():
+                    counts[item] = counts.get(item, 0) + count
+            else:
+                counts.update(items)
+            self.total += sum(items.values())
+            self._maybe_compact()
+            return
+
+        limit = 2 * self.capacity if self.capacity is not None else None
+        counts = self.counts
+        total = 0
+        for item in items:
+            counts[item] = counts.get(item, 0) + 1
+            total += 1
+            if limit is not None and len(counts) > limit:
+                self._compact()
+                counts = self.counts
+        self.total += total
+
+    def add(self, item: Hashable, count: int = 1):
+        self.counts[item] = self.counts.get(item, 0) + count
+        self.total += count
+        self._maybe_compact()
+
+    def _maybe_compact(self):
+        if self.capacity is not None and len(self.counts) > 2 * self.capacity:
+            self._compact()
+
+    def _compact(self):
+        # вычитаем (capacity+1)-ю по величине частоту из всех и выкидываем неположительные
+        threshold = heapq.nlargest(self.capacity + 1, self.counts.values())[-1]
+        self.counts = {item: count - threshold for item, count in self.counts.items() if count > threshold}
+        self.error += threshold
+
+    def merge(self, *others: 'TopKCounter') -> 'TopKCounter':
+        # несколько сводок складываем целиком и сжимаем один раз
+        counts = self.counts
+        for other in others:
+            for item, count in other.counts.items():
+                counts[item] = counts.get(item, 0) + count
+            self.total += other.total
+            self.error += other.error
+        self._maybe_compact()
+        return self
+
+    def most_common(self, n: Optional[int] = None) -> List[Tuple[Hashable, int]]:
+        if n is None:
+            return sorted(self.counts.items(), key=lambda kv: kv[1], reverse=True)
+        return heapq.nlargest(n, self.counts.items(), key=lambda kv: kv[1])
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {'k': self.capacity, 'n': self.total, 'e': self.error, 'c': self.counts}
+
+    @classmethod
+    def from_dict(cls, data: Dict[str, Any]) -> 'TopKCounter':
+        counter = cls(data.get('k'))
+        counter.counts = dict(data.get('c', {}))
+        counter.total = data.get('n', sum(counter.counts.values()))
+        counter.error = data.get('e', 0)
+        return counter
@@ -1,42 +1,200 @@
-from bs4 import BeautifulSoup
+from html.parser import HTMLParser
 import html
+import io
 import logging
-from typing import Tuple, List
+import posixpath
+import re
+import zipfile
+from collections import deque
+from typing import Tuple, List, Dict, Iterator, Optional, Deque, TextIO, Union
+
+from corpus import NO_MESSAGE_ID, Corpus, Vocabulary
 
 logger = logging.getLogger(__name__)
 
-def parse_html(file_path: str) -> Tuple[List[str], List[Tuple[str, str]]]:
-    try:
-        with open(file_path, 'r', encoding='utf-8') as f:
-            soup = BeautifulSoup(f.read(), 'html.parser')
+CHUNK_SIZE = 64 * 1024
 
-        header = soup.find('div', class_='page_header')
-        your_name = header.find('div', class_='text').text.strip() if header else None
+# длинные чаты Telegram Desktop делит на messages.html, messages2.html, ...
+EXPORT_MEMBER_RE = re.compile(r'(?:^|/)messages(\d*)\.html$')
 
-        participants = set()
-        your_messages = []
-        all_messages = []
+# путь к файлу или содержимое, скачанное в память
+ExportSource = Union[str, bytes]
+
+# теги без закрывающей пары, их нельзя класть в стек
+VOID_TAGS = frozenset({
+    'area', 'base', 'br', 'col', 'embed', 'hr', 'img', 'input',
+    'link', 'meta', 'param', 'source', 'track', 'wbr'
+})
+
+
+def message_id(element_id: Optional[str]) -> Optional[int]:
+    # id="message123" у сообщений; у разделителей дат id отрицательные
+    if element_id and element_id.startswith('message'):
+        try:
+            return int(element_id[7:])
+        except ValueError:
+            return None
+    return None
+
+
+class ExportStreamParser(HTMLParser):
+    """Инкрементальный парсер HTML-экспорта Telegram.
+
+    Данные подаются кусками через feed(), готовые записи (sender, text, id)
+    забираются через pop_records(). В памяти держится только текущее сообщение.
+    Сообщения с id не больше min_message_id (уже импортированные) пропускаются.
+    """
+
+    def __init__(self, min_message_id: Optional[int] = None):
+        super().__init__(convert_charrefs=True)
+        self.your_name: Optional[str] = None
+        self.min_message_id = min_message_id
+        self.last_message_id: Optional[int] = None
+        self._records: Deque[Tuple[str, str, int]] = deque()
+        self._stack: List[Tuple[str, Optional[str]]] = []
+
+        self._header_depth: Optional[int] = None
+        self._header_text: Optional[List[str]] = None
+
+        self._msg_depth: Optional[int] = None
+        self._msg_service = False
+        self._msg_id: Optional[int] = None
+        self._sender: Optional[List[str]] = None
+        self._text: Optional[List[str]] = None
+        self._capture: Optional[List[str]] = None
+
+    def handle_starttag(self, tag, attrs):
+        if tag in VOID_TAGS:
+            return
+
+        classes = []
+        element_id = None
+        for name, value in attrs:
+            if name == 'class' and value:
+                classes = value.split()
+            elif name == 'id':
+                element_id = value
+
+        role = None
+        depth = len(self._stack)
+
+        if tag == 'div' and 'page_header' in classes and self.your_name is None and self._header_depth is None:
+            self._header_depth = depth
+        elif tag == 'div' and 'text' in classes and self._header_depth is not None and self._header_text is None:
+            self._header_text = []
+            role = 'header_text'
+            self._capture = self._header_text
+        elif 'message' in classes and self._msg_depth is None:
+            self._msg_depth = depth
+            self._msg_service = 'service' in classes
+            self._msg_id = message_id(element_id)
+            self._sender = None
+            self._text = None
+        elif self._msg_depth is not None and self._capture is None:
+            if 'from_name' in classes and self._sender is None:
+                self._sender = []
+                role = 'sender'
+                self._capture = self._sender
+            elif 'text' in classes and self._text is None:
+                self._text = []
+                role = 'text'
+                self._capture = self._text
+
+        self._stack.append((tag, role))
+
+    def handle_startendtag(self, tag, attrs):
+        # <br/>, <img/> и т.п. — содержимого нет, стек не трогаем
+        pass
+
+    def handle_endtag(self, tag):
+        if tag in VOID_TAGS:
+            return
+        # закрываем до ближайшего совпадающего тега, как это делает браузер
+        for i in range(len(self._stack) - 1, -1, -1):
+            if self._stack[i][0] == tag:
+                while len(self._stack) > i:
+                    self._close_top()
+                return
+
+    def handle_data(self, data):
+        if self._capture is not None:
+            self._capture.append(data)
+
+    def _close_top(self):
+        _, role = self._stack.pop()
+        depth = len(self._stack)
+
+        if role is not None:
+            self._capture = None
+            if role == 'header_text':
+                self.your_name = ''.join(self._header_text).strip()
+
+        if self._header_depth is not None and depth == self._header_depth:
+            self._header_depth = None
+        elif self._msg_depth is not None and depth == self._msg_depth:
+            self._msg_depth = None
+            self._finish_message()
+
+    def _finish_message(self):
+        if self._msg_id is not None:
+            if self.last_message_id is None or self._msg_id > self.last_message_id:
+                self.last_message_id = self._msg_id
+            if self.min_message_id is not None and self._msg_id <= self.min_message_id:
+                return
+        if self._msg_service or self._text is None:
+            return
+
+        clean_text = html.unescape(''.join(self._text).strip())
+        if not clean_text:
+            return
+
+        sender_name = ''.join(self._sender).strip() if self._sender is not None else "Unknown"
+        self._records.append((sender_name, clean_text, NO_MESSAGE_ID if self._msg_id is None else self._msg_id))
 
-        for msg in soup.find_all(class_='message'):
-            if 'service' in msg.get('class', []):
-                continue
+    def pop_records(self) -> Iterator[Tuple[str, str, int]]:
+        while self._records:
+            yield self._records.popleft()
 
-            sender = msg.find(class_='from_name')
-            sender_name = sender.text.strip() if sender else "Unknown"
 
-            text = msg.find(class_='text')
-            if not text:
-                continue
+def _feed_stream(parser: ExportStreamParser, stream: TextIO, chunk_size: int = CHUNK_SIZE) -> Iterator[Tuple[str, str, int]]:
+    while True:
+        chunk = stream.read(chunk_size)
+        if not chunk:
+            break
+        parser.feed(chunk)
+        yield from parser.pop_records()
+    parser.close()
+    yield from parser.pop_records()
 
-            clean_text = html.unescape(text.get_text().strip())
-            if not clean_text:
-                continue
 
+def open_export(source: ExportSource) -> TextIO:
+    # BytesIO не копирует bytes, пока в него не пишут
+    if isinstance(source, bytes):
+        return io.TextIOWrapper(io.BytesIO(source), encoding='utf-8')
+    return open(source, 'r', encoding='utf-8')
+
+
+def _feed_file(parser: ExportStreamParser, source: ExportSource, chunk_size: int = CHUNK_SIZE) -> Iterator[Tuple[str, str, int]]:
+    with open_export(source) as f:
+        yield from _feed_stream(parser, f, chunk_size)
+
+
+def iter_html_messages(file_path: ExportSource, chunk_size: int = CHUNK_SIZE) -> Iterator[Tuple[str, str]]:
+    for sender_name, clean_text, _ in _feed_file(ExportStreamParser(), file_path, chunk_size):
+        yield sender_name, clean_text
+
+
+def parse_html(file_path: ExportSource) -> Tuple[List[str], List[Tuple[str, str]]]:
+    try:
+        parser = ExportStreamParser()
+        your_messages = []
+        all_messages = []
+
+        for sender_name, clean_text, _ in _feed_file(parser, file_path):
             if sender_name != "Unknown":
-                participants.add(sender_name)
                 all_messages.append((sender_name, clean_text))
 
-            if sender_name == your_name:
+            if sender_name == parser.your_name:
                 your_messages.append(clean_text)
 
         return your_messages, all_messages
@@ -44,9 +202,94 @@ def parse_html(file_path: str) -> Tuple[List[str], List[Tuple[str, str]]]:
         logger.error(f"Ошибка парсинга HTML: {e}")
         return [], []
 
+def group_by_author(records: Iterator[Tuple[str, str, int]]) -> Dict[str, Corpus]:
+    vocabulary = Vocabulary()
+    by_author: Dict[str, Corpus] = {}
+    for sender_name, clean_text, message_id in records:
+        messages = by_author.get(sender_name)
+        if messages is None:
+            messages = by_author[sender_name] = Corpus(vocabulary=vocabulary)
+        messages.append(clean_text, message_id)
+    return by_author
+
+
+def group_export(records: Iterator[Tuple[str, str, int]], source) -> Tuple[Corpus, Dict[str, Corpus]]:
+    # сообщения по авторам за один проход, компактными корпусами с общим словарем;
+    # source — парсер, у которого после прохода известен your_name
+    by_author = group_by_author(records)
+    vocabulary = next(iter(by_author.values())).vocabulary if by_author else Vocabulary()
+
+    # свои сообщения — тот же корпус, что и у автора из заголовка, без копии
+    your_messages = by_author.get(source.your_name) or Corpus(vocabulary=vocabulary)
+    by_author.pop("Unknown", None)
+    by_author.pop("", None)
+    return your_messages, by_author
+
+def parse_html_grouped(file_path: ExportSource) -> Tuple[Corpus, Dict[str, Corpus]]:
+    # то же, что parse_html, но сообщения сразу разложены по авторам
+    try:
+        parser = ExportStreamParser()
+        return group_export(_feed_file(parser, file_path), parser)
+    except Exception as e:
+        logger.error(f"Ошибка парсинга HTML: {e}")
+        return Corpus(), {}
+
+def _open_archive(source: ExportSource) -> zipfile.ZipFile:
+    return zipfile.ZipFile(io.BytesIO(source) if isinstance(source, bytes) else source)
+
+class ArchiveTooLarge(Exception):
+    pass
+
+def _check_unpacked(member: str, size: int, total: int, max_member_size: Optional[int], max_total_size: Optional[int]):
+    if max_member_size is not None and size > max_member_size:
+        raise ArchiveTooLarge(f"{member} больше {max_member_size // 2**20} МБ после распаковки")
+    if max_total_size is not None and total > max_total_size:
+        raise ArchiveTooLarge(f"файлы переписки больше {max_total_size // 2**20} МБ после распаковки")
+
+def list_export_members(source: ExportSource, max_member_size: Optional[int] = None,
+                        max_total_size: Optional[int] = None) -> List[str]:
+    # файлы переписки из архива экспорта в хронологическом порядке; слишком большие
+    # по заголовкам архива отклоняются до распаковки
+    with _open_archive(source) as archive:
+        members = []
+        total = 0
+        for info in archive.infolist():
+            match = EXPORT_MEMBER_RE.search(info.filename)
+            if match:
+                total += info.file_size
+                _check_unpacked(info.filename, info.file_size, total, max_member_size, max_total_size)
+                members.append((posixpath.dirname(info.filename), int(match.group(1) or 1), info.filename))
+    return [name for _, _, name in sorted(members)]
+
+def iter_export_members(source: ExportSource, members: List[str], max_member_size: Optional[int] = None,
+                        max_total_size: Optional[int] = None) -> Iterator[Tuple[bytes, str]]:
+    # распакованное содержимое файлов по одному, по мере запроса, а не все сразу;
+    # читается не больше лимита, даже если размер в заголовке архива занижен
+    with _open_archive(source) as archive:
+        total = 0
+        for member in members:
+            with archive.open(member) as f:
+                data = f.read() if max_member_size is None else f.read(max_member_size + 1)
+            total += len(data)
+            _check_unpacked(member, len(data), total, max_member_size, max_total_size)
+            yield data, member
+
+def parse_export_part(source: ExportSource, min_message_id: Optional[int] = None) -> Tuple[Optional[str], Dict[str, Corpus]]:
+    # один файл многофайлового экспорта или дописанный хвост файла:
+    # авторы отдельно, имя владельца из заголовка (у хвоста его нет);
+    # ошибки разбора не глотаются — часть с ошибкой нельзя считать импортированной
+    parser = ExportStreamParser(min_message_id)
+    by_author = group_by_author(_feed_file(parser, source))
+    by_author.pop("Unknown", None)
+    by_author.pop("", None)
+    return parser.your_name, by_author
+
 def load_style_from_html(html_path: str, target_name: str) -> List[str]:
-    _, all_messages = parse_html(html_path)
-    return [
-        text for author, text in all_messages
-        if author == target_name and len(text.split()) >= 3
-    ]
\ No newline at end of file
+    try:
+        return [
+            text for author, text in iter_html_messages(html_path)
+            if author == target_name and len(text.split()) >= 3
+        ]
+    except Exception as e:
+        logger.error(f"Ошибка парсинга HTML: {e}")
+        return []
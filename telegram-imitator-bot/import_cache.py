@@ -0,0 +1,82 @@
+import hashlib
+import re
+from typing import Any, Dict, List, Optional, Tuple
+
+# начало сообщения в экспорте; у разделителей дат в HTML id отрицательные и сюда не попадают
+_MESSAGE_START_RE = {
+    "html": re.compile(rb'<div class="message[^"]*" id="message(\d+)"'),
+    "json": re.compile(rb'\{\s*"id": (\d+),\s*"type"'),
+}
+SEARCH_WINDOW = 64 * 1024
+
+
+def export_format(file_name: str) -> str:
+    return file_name.lower().rsplit('.', 1)[-1]
+
+
+def content_hash(data: bytes) -> str:
+    return hashlib.sha256(data).hexdigest()
+
+
+def last_message(data: bytes, fmt: str) -> Optional[Tuple[int, int]]:
+    """id последнего сообщения файла и смещение, с которого оно начинается.
+
+    Ищется с конца файла окном, растущим в 4 раза, так что на большом
+    экспорте просматриваются только последние килобайты.
+    """
+    pattern = _MESSAGE_START_RE.get(fmt)
+    if pattern is None:
+        return None
+    window = SEARCH_WINDOW
+    while True:
+        start = max(0, len(data) - window)
+        match = None
+        for match in pattern.finditer(data, start):
+            pass
+        if match is not None:
+            return int(match.group(1)), match.start()
+        if start == 0:
+            return None
+        window *= 4
+
+
+def fingerprint(data: bytes, fmt: str) -> Dict[str, Any]:
+    """Ключи файла для кэша импортов.
+
+    Префикс — все байты до начала последнего сообщения. Если следующий
+    экспорт того же чата начинается с тех же байтов, он только дописан в
+    конец, и разбирать нужно лишь хвост с этого места.
+    """
+    result = {
+        "format": fmt,
+        "size": len(data),
+        "prefix_size": None,
+        "prefix_hash": None,
+        "last_message_id": None,
+    }
+    last = last_message(data, fmt)
+    if last is None:
+        result["content_hash"] = content_hash(data)
+        return result
+
+    # хэш всего файла продолжает хэш префикса: данные читаются один раз
+    view = memoryview(data)
+    result["last_message_id"], prefix_size = last
+    digest = hashlib.sha256(view[:prefix_size])
+    result["prefix_size"] = prefix_size
+    result["prefix_hash"] = digest.hexdigest()
+    digest.update(view[prefix_size:])
+    result["content_hash"] = digest.hexdigest()
+    return result
+
+
+def match_prefix(data: bytes, candidates: List[Dict[str, Any]]) -> Optional[Dict[str, Any]]:
+    # прежний импорт, чей префикс совпадает с началом data; кандидаты от длинного префикса к короткому
+    view = memoryview(data)
+    for candidate in candidates:
+        prefix_size = candidate["prefix_size"]
+        if prefix_size is None or prefix_size >= len(data):
+            continue
+        if hashlib.sha256(view[:prefix_size]).hexdigest() == candidate["prefix_hash"]:
+            return candidate
+    return None
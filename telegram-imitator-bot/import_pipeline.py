@@ -0,0 +1,363 @@
+import asyncio
+import logging
+import zipfile
+from concurrent.futures import Executor, ProcessPoolExecutor, ThreadPoolExecutor
+from typing import Any, Awaitable, Callable, Dict, Iterable, List, Optional
+
+from corpus import Corpus, Vocabulary
+from heavy_hitters import TopKCounter
+from html_parser import ArchiveTooLarge, ExportSource, iter_export_members, list_export_members, parse_export_part, parse_html_grouped
+from json_parser import parse_json_grouped, parse_json_part
+from style_analysis import StyleStats, analyze_authors, count_report_words
+
+logger = logging.getLogger(__name__)
+
+PositionCallback = Callable[[int], Awaitable[None]]
+
+
+class ImportQueueFull(Exception):
+    pass
+
+
+class ExportArchiveError(Exception):
+    pass
+
+
+def _analyze_authors(by_author: Dict[str, Corpus], min_samples: int) -> Dict[str, Dict[str, Any]]:
+    try:
+        authors = analyze_authors(by_author, min_samples)
+    except Exception as e:
+        return {name: {"style": None, "stats": None, "error": str(e)} for name in by_author}
+
+    entries = {}
+    for name, messages in by_author.items():
+        stats = authors.get(name)
+        entries[name] = {
+            "style": stats.finalize() if stats else None,
+            "stats": stats.to_dict() if stats else None,
+            "error": None,
+            "report": count_report_words(messages).to_dict(),
+        }
+    return entries
+
+
+def analyze_export(source: ExportSource, min_samples: int, file_name: Optional[str] = None) -> Dict[str, Any]:
+    # выполняется в воркере, поэтому результат должен быть picklable;
+    # source — путь или уже скачанное содержимое, формат определяется по имени файла
+    file_name = file_name or (source if isinstance(source, str) else "")
+    parse = parse_json_grouped if file_name.lower().endswith('.json') else parse_html_grouped
+    your_messages, by_author = parse(source)
+
+    # свои сообщения — тот же список, что у одного из авторов, второй раз его не считаем
+    your_name = next((name for name, messages in by_author.items() if messages is your_messages), None)
+    return _export_result(your_messages, your_name, by_author, _analyze_authors(by_author, min_samples), min_samples)
+
+
+def _export_result(your_messages: Corpus, your_name: Optional[str], by_author: Dict[str, Corpus],
+                   entries: Dict[str, Dict[str, Any]], min_samples: int,
+                   parse_errors: Optional[List[str]] = None) -> Dict[str, Any]:
+    your = entries[your_name] if your_name is not None else _analyze_authors({"": your_messages}, min_samples)[""]
+
+    others = [
+        {"name": name, "messages": by_author[name], **entries[name]}
+        for name in sorted(by_author)
+    ]
+
+    return {
+        # автор из заголовка экспорта, по нему узнаются свои сообщения в дописанном хвосте
+        "your_name": your_name,
+        "your_messages": your_messages,
+        "your": your,
+        "total_messages": sum(len(messages) for messages in by_author.values()),
+        "participants": others,
+        # файлы архива, которые не удалось разобрать
+        "parse_errors": parse_errors or [],
+    }
+
+
+def analyze_export_member(data: bytes, member: str) -> Dict[str, Any]:
+    # выполняется в воркере: один файл архива и частичная статистика его авторов;
+    # порог min_samples применяется только после склейки всех файлов
+    try:
+        your_name, by_author = parse_export_part(data)
+    except Exception as e:
+        logger.error(f"Ошибка парсинга {member}: {e}")
+        return _export_part(None, {}, f"{member}: {e}")
+    return _export_part(your_name, by_author)
+
+
+def analyze_export_tail(tail: bytes, fmt: str, min_message_id: int) -> Dict[str, Any]:
+    # выполняется в воркере: дописанный конец файла, начиная с последнего уже
+    # импортированного сообщения; порог min_samples применяется при дописывании в базу
+    try:
+        if fmt == "json":
+            your_name, by_author = parse_json_part(tail, min_message_id, tail=True)
+        else:
+            your_name, by_author = parse_export_part(tail, min_message_id)
+    except Exception as e:
+        logger.error(f"Ошибка парсинга дописанной части {fmt.upper()}: {e}")
+        return _export_part(None, {}, str(e))
+    return _export_part(your_name, by_author)
+
+
+def _export_part(your_name: Optional[str], by_author: Dict[str, Corpus],
+                 parse_error: Optional[str] = None) -> Dict[str, Any]:
+    # error — ошибка анализа стиля, parse_error — файл не разобран
+    try:
+        stats, error = analyze_authors(by_author), None
+    except Exception as e:
+        stats, error = {}, str(e)
+    return {
+        "your_name": your_name,
+        "authors": by_author,
+        "stats": stats,
+        "reports": {name: count_report_words(messages) for name, messages in by_author.items()},
+        "error": error,
+        "parse_error": parse_error,
+    }
+
+
+def merge_export_parts(parts: List[Dict[str, Any]], min_samples: int) -> Dict[str, Any]:
+    # части идут в порядке файлов, так что сообщения авторов остаются хронологическими
+    vocabulary = Vocabulary()
+    by_author: Dict[str, Corpus] = {}
+    stats: Dict[str, List[StyleStats]] = {}
+    reports: Dict[str, List[TopKCounter]] = {}
+    errors: Dict[str, str] = {}
+    your_name = None
+
+    for part in parts:
+        if your_name is None:
+            your_name = part["your_name"]
+        authors = part["authors"]
+        # у авторов одного файла общий словарь: таблица перевода id одна на файл
+        mapping = vocabulary.translate(next(iter(authors.values())).vocabulary) if authors else None
+        for name, messages in authors.items():
+            merged = by_author.get(name)
+            if merged is None:
+                merged = by_author[name] = Corpus(vocabulary=vocabulary)
+            merged.extend_corpus(messages, mapping)
+            if part["error"]:
+                errors[name] = part["error"]
+            else:
+                stats.setdefault(name, []).append(part["stats"][name])
+            reports.setdefault(name, []).append(part["reports"][name])
+
+    # сводки частот складываются разом: одно сжатие на автора вместо одного на файл
+    entries = {}
+    for name, messages in by_author.items():
+        author_stats = None
+        if name not in errors and len(messages) >= min_samples:
+            first, *rest = stats[name]
+            author_stats = first.merge(*rest)
+        first, *rest = reports[name]
+        entries[name] = {
+            "style": author_stats.finalize() if author_stats else None,
+            "stats": author_stats.to_dict() if author_stats else None,
+            "error": errors.get(name),
+            "report": first.merge(*rest).to_dict(),
+        }
+
+    your_messages = by_author.get(your_name) if your_name else None
+    if your_messages is None:
+        your_messages, your_name = Corpus(vocabulary=vocabulary), None
+    parse_errors = [part["parse_error"] for part in parts if part["parse_error"]]
+    return _export_result(your_messages, your_name, by_author, entries, min_samples, parse_errors)
+
+
+async def analyze_export_archive(pipeline: 'ImportPipeline', source: ExportSource, min_samples: int,
+                                 on_position: Optional[PositionCallback] = None,
+                                 max_member_size: Optional[int] = None,
+                                 max_total_size: Optional[int] = None) -> Dict[str, Any]:
+    # файлы архива разбираются параллельно во всех воркерах пула, склейка — в потоке;
+    # в воркеры уходит содержимое отдельных файлов, распакованное по мере надобности
+    # и не больше лимитов: маленький ZIP может распаковываться в гигабайты
+    loop = asyncio.get_running_loop()
+    try:
+        members = await loop.run_in_executor(None, list_export_members, source, max_member_size, max_total_size)
+    except zipfile.BadZipFile as e:
+        raise ExportArchiveError(f"Архив поврежден: {e}") from e
+    except ArchiveTooLarge as e:
+        raise ExportArchiveError(f"Архив слишком большой: {e}") from e
+    if not members:
+        raise ExportArchiveError("В архиве нет файлов переписки messages*.html")
+    logger.info(f"Архив экспорта: {len(members)} файлов переписки.")
+    try:
+        parts = await pipeline.submit_map(
+            analyze_export_member, iter_export_members(source, members, max_member_size, max_total_size),
+            on_position=on_position
+        )
+    except zipfile.BadZipFile as e:
+        raise ExportArchiveError(f"Архив поврежден: {e}") from e
+    except ArchiveTooLarge as e:
+        raise ExportArchiveError(f"Архив слишком большой: {e}") from e
+    return await loop.run_in_executor(None, merge_export_parts, parts, min_samples)
+
+
+def make_executor(kind: str, workers: int) -> Executor:
+    if kind == "process":
+        return ProcessPoolExecutor(max_workers=workers)
+    if kind == "thread":
+        return ThreadPoolExecutor(max_workers=workers, thread_name_prefix="import")
+    raise ValueError(f"Неизвестный тип исполнителя импорта: {kind}")
+
+
+class _Job:
+    def __init__(self, func: Callable, args: tuple, on_position: Optional[PositionCallback],
+                 items: Optional[Iterable[tuple]] = None):
+        self.func = func
+        self.args = args
+        # для submit_map: аргументы каждого вызова func
+        self.items = items
+        self.on_position = on_position
+        self.position: Optional[int] = None
+        self.future: asyncio.Future = asyncio.get_running_loop().create_future()
+
+
+class ImportPipeline:
+    """Очередь импортов с ограниченной длиной поверх пула воркеров.
+
+    Тяжелые функции выполняются в executor'е, event loop только ждет результат.
+    Ожидающим задачам сообщается их позиция в очереди через on_position.
+    """
+
+    def __init__(self, workers: int, max_pending: int, executor_kind: str = "process",
+                 executor_factory: Callable[[str, int], Executor] = make_executor):
+        self.workers = max(1, workers)
+        self.max_pending = max_pending
+        self.executor_kind = executor_kind
+        self._executor_factory = executor_factory
+        self._executor: Optional[Executor] = None
+        self._queue: Optional[asyncio.Queue] = None
+        self._waiting: List[_Job] = []
+        self._tasks: List[asyncio.Task] = []
+        self._idle = 0
+
+    async def start(self):
+        if self._executor is not None:
+            return
+        self._executor = self._executor_factory(self.executor_kind, self.workers)
+        self._queue = asyncio.Queue()
+        self._tasks = [asyncio.create_task(self._worker(i)) for i in range(self.workers)]
+        logger.info(f"Пул импорта запущен: {self.workers} воркеров ({self.executor_kind}), очередь до {self.max_pending}.")
+
+    async def stop(self):
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+        for job in self._waiting:
+            if not job.future.done():
+                job.future.cancel()
+        self._waiting.clear()
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
+        logger.info("Пул импорта остановлен.")
+
+    @property
+    def pending(self) -> int:
+        return max(0, len(self._waiting) - self._idle)
+
+    async def submit(self, func: Callable, *args, on_position: Optional[PositionCallback] = None) -> Any:
+        return await self._enqueue(_Job(func, args, on_position))
+
+    async def submit_map(self, func: Callable, items: Iterable[tuple],
+                         on_position: Optional[PositionCallback] = None) -> List[Any]:
+        # одна задача в очереди, но ее вызовы расходятся по всем воркерам executor'а;
+        # items читается лениво, в полете не больше 2 * workers вызовов
+        return await self._enqueue(_Job(func, (), on_position, items))
+
+    async def _enqueue(self, job: _Job) -> Any:
+        if self._executor is None:
+            raise RuntimeError("ImportPipeline не запущен")
+        if self.pending >= self.max_pending:
+            raise ImportQueueFull()
+
+        self._waiting.append(job)
+        self._queue.put_nowait(job)
+        position = self._position(job)
+        if position > 0:
+            await self._report(job, position)
+        return await job.future
+
+    def _position(self, job: _Job) -> int:
+        # свободные воркеры заберут первые задачи сразу, их в очереди не считаем
+        if job not in self._waiting:
+            return 0
+        return max(0, self._waiting.index(job) + 1 - self._idle)
+
+    async def _report(self, job: _Job, position: int):
+        # 0 — задача взята в работу, сообщаем только тем, кто успел постоять в очереди
+        if job.on_position is None or job.position == position:
+            return
+        if position == 0 and job.position is None:
+            return
+        job.position = position
+        try:
+            await job.on_position(position)
+        except Exception as e:
+            logger.warning(f"Не удалось сообщить позицию в очереди импорта: {e}")
+
+    async def _map(self, func: Callable, items: Iterable[tuple]) -> List[Any]:
+        loop = asyncio.get_running_loop()
+        iterator = iter(items)
+        slots = asyncio.Semaphore(2 * self.workers)
+        tasks: List[asyncio.Future] = []
+
+        async def run(args: tuple) -> Any:
+            try:
+                return await loop.run_in_executor(self._executor, func, *args)
+            finally:
+                slots.release()
+
+        try:
+            while True:
+                await slots.acquire()
+                # следующий элемент может читаться с диска или распаковываться — не в event loop
+                args = await loop.run_in_executor(None, next, iterator, None)
+                if args is None:
+                    break
+                tasks.append(asyncio.ensure_future(run(args)))
+            return await asyncio.gather(*tasks)
+        finally:
+            for task in tasks:
+                task.cancel()
+            # генератор мог держать открытым архив
+            if hasattr(iterator, "close"):
+                iterator.close()
+
+    async def _worker(self, index: int):
+        loop = asyncio.get_running_loop()
+        while True:
+            self._idle += 1
+            try:
+                job: _Job = await self._queue.get()
+            finally:
+                self._idle -= 1
+            try:
+                if job in self._waiting:
+                    self._waiting.remove(job)
+                if job.future.done():
+                    continue
+
+                if job.items is None:
+                    execution = loop.run_in_executor(self._executor, job.func, *job.args)
+                else:
+                    execution = asyncio.ensure_future(self._map(job.func, job.items))
+                await self._report(job, 0)
+                for waiting_job in list(self._waiting):
+                    position = self._position(waiting_job)
+                    if position > 0:
+                        await self._report(waiting_job, position)
+
+                try:
+                    result = await execution
+                except Exception as e:
+                    if not job.future.done():
+                        job.future.set_exception(e)
+                else:
+                    if not job.future.done():
+                        job.future.set_result(result)
+            finally:
+                self._queue.task_done()
@@ -0,0 +1,97 @@
+import logging
+from typing import Any, Dict, Optional, Tuple
+
+import repository
+from response_cache import response_cache
+from retrieval import retrieval_indexes
+
+logger = logging.getLogger(__name__)
+
+
+async def _merge_profile(user_id: int, target: str, messages, stats: Optional[Dict[str, Any]],
+                         report: Optional[Dict[str, Any]], min_samples: int) -> int:
+    # новые сообщения профиля; кэши ответов и примеров сбрасываются, только если что-то добавилось
+    added = await repository.merge_messages(user_id, target, messages, stats, report, min_samples)
+    if added > 0:
+        response_cache.invalidate(user_id, target)
+        retrieval_indexes.invalidate(user_id, target)
+    if added >= 0:
+        logger.info(f"Добавлено {added} из {len(messages)} сообщений для target '{target}' (user_id {user_id}).")
+    return added
+
+
+async def save_export(user_id: int, your_name: str, export: Dict[str, Any], file_unique_id: Optional[str],
+                      fingerprint: Dict[str, Any], min_samples: int) -> Dict[str, Any]:
+    """Сохраняет профили полного импорта экспорта.
+
+    Файл запоминается в кэше импортов, только если все его части разобраны
+    и сохранены: иначе повторная загрузка того же файла должна догрузить
+    недостающее, а не ответить, что экспорт уже загружен.
+    """
+    complete = not export["parse_errors"]
+    for parse_error in export["parse_errors"]:
+        logger.error(f"Файл архива от user_id {user_id} не разобран: {parse_error}")
+
+    your_messages = export["your_messages"]
+    your_added = 0
+    if your_messages:
+        your_added = await _merge_profile(
+            user_id, your_name, your_messages, export["your"]["stats"], export["your"]["report"], min_samples
+        )
+        if export["your"]["error"] or your_added < 0:
+            complete = False
+
+    saved_others = 0
+    for participant in export["participants"]:
+        if not participant["messages"]:
+            continue
+        added = await _merge_profile(
+            user_id, participant["name"], participant["messages"],
+            participant["stats"], participant["report"], min_samples
+        )
+        if participant["error"]:
+            complete = False
+        if added < 0:
+            complete = False
+            continue
+        saved_others += 1
+
+    if complete:
+        await repository.save_import(user_id, file_unique_id, fingerprint, export["your_name"], {
+            "your_count": len(your_messages),
+            "participants": [participant["name"] for participant in export["participants"]],
+        })
+    else:
+        logger.warning(f"Файл от user_id {user_id} обработан не полностью, импорт не записан.")
+    return {"your_added": your_added, "saved_others": saved_others, "complete": complete}
+
+
+async def save_export_tail(user_id: int, your_name: str, base: Dict[str, Any], part: Dict[str, Any],
+                           file_unique_id: Optional[str], fingerprint: Dict[str, Any],
+                           min_samples: int) -> Tuple[Dict[str, Any], bool]:
+    # дописанный хвост экспорта: новые сообщения добавляются к профилям, прежние не трогаются;
+    # второй результат — удалось ли сохранить все (только тогда файл запоминается как загруженный)
+    complete = not part["parse_error"] and not part["error"]
+    summary = dict(base["summary"])
+    participants = set(summary.get("participants", []))
+    for name, messages in part["authors"].items():
+        targets = [name]
+        if name == base["chat_name"]:
+            # свои сообщения хранятся еще и под именем из Telegram, как при полном импорте
+            targets.append(your_name)
+            summary["your_count"] = summary.get("your_count", 0) + len(messages)
+        participants.add(name)
+
+        stats = None if part["error"] or name not in part["stats"] else part["stats"][name].to_dict()
+        for target in targets:
+            added = await _merge_profile(user_id, target, messages, stats, part["reports"][name].to_dict(), min_samples)
+            if added < 0:
+                complete = False
+
+    summary["participants"] = sorted(participants)
+    if complete:
+        await repository.save_import(user_id, file_unique_id, fingerprint, base["chat_name"], summary)
+    else:
+        # файл не запоминаем: повторная загрузка разберет его заново
+        logger.warning(f"Дописанная часть файла user_id {user_id} сохранена не полностью, импорт не записан.")
+    return summary, complete
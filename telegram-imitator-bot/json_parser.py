@@ -0,0 +1,214 @@
+import json
+import logging
+import re
+from typing import Any, Dict, Iterator, List, Optional, TextIO, Tuple
+
+from corpus import NO_MESSAGE_ID, Corpus
+from html_parser import CHUNK_SIZE, ExportSource, group_by_author, group_export, open_export
+
+logger = logging.getLogger(__name__)
+
+_WHITESPACE_RE = re.compile(r'[ \t\n\r]*')
+_NUMBER_END = frozenset(' \t\n\r,]}')
+
+
+class JsonStreamReader:
+    """Потоковое чтение JSON без загрузки файла в память.
+
+    Структура (объекты и массивы верхних уровней) разбирается по событиям:
+    iter_object() отдает ключи, iter_array() — элементы. Каждый элемент или
+    значение целиком декодирует C-реализация json через raw_decode(), так
+    что в памяти держится только текущий кусок файла и одно значение.
+    """
+
+    def __init__(self, stream: TextIO, chunk_size: int = CHUNK_SIZE, prefix: str = ""):
+        self._stream = stream
+        self._chunk_size = chunk_size
+        self._decoder = json.JSONDecoder()
+        # prefix дописывается перед потоком, например "[" для хвоста массива
+        self._buffer = prefix
+        self._pos = 0
+        self._eof = False
+
+    def _fill(self) -> bool:
+        if self._eof:
+            return False
+        chunk = self._stream.read(self._chunk_size)
+        if not chunk:
+            self._eof = True
+            return False
+        self._buffer = self._buffer[self._pos:] + chunk
+        self._pos = 0
+        return True
+
+    def _peek(self) -> str:
+        while True:
+            self._pos = _WHITESPACE_RE.match(self._buffer, self._pos).end()
+            if self._pos < len(self._buffer):
+                return self._buffer[self._pos]
+            if not self._fill():
+                return ""
+
+    def _expect(self, char: str):
+        found = self._peek()
+        if found != char:
+            raise ValueError(f"Ожидался '{char}', найдено '{found or 'конец файла'}' (позиция {self._pos})")
+        self._pos += 1
+
+    def value(self) -> Any:
+        self._peek()
+        while True:
+            try:
+                value, end = self._decoder.raw_decode(self._buffer, self._pos)
+            except json.JSONDecodeError:
+                # значение обрезано концом куска — дочитываем и пробуем снова
+                if self._fill():
+                    continue
+                raise
+            # число в конце куска могло быть обрезано: "12" из "123", "1.5" из "1.5e-3"
+            if (isinstance(value, (int, float)) and not isinstance(value, bool) and not self._eof
+                    and self._buffer[end:end + 1] not in _NUMBER_END):
+                if self._fill():
+                    continue
+            self._pos = end
+            return value
+
+    def _separator(self, closing: str) -> bool:
+        char = self._peek()
+        if char == ",":
+            self._pos += 1
+            return True
+        self._expect(closing)
+        return False
+
+    def iter_array(self) -> Iterator[Any]:
+        self._expect("[")
+        if self._peek() == "]":
+            self._pos += 1
+            return
+        while True:
+            yield self.value()
+            if not self._separator("]"):
+                return
+
+    def iter_object(self) -> Iterator[str]:
+        # значение каждого ключа вызывающий обязан прочитать сам: value() или iter_array()
+        self._expect("{")
+        if self._peek() == "}":
+            self._pos += 1
+            return
+        while True:
+            key = self.value()
+            self._expect(":")
+            yield key
+            if not self._separator("}"):
+                return
+
+
+def message_text(text: Any) -> str:
+    # text — строка или массив из строк и сущностей {"type": "bold", "text": "..."}
+    if isinstance(text, str):
+        return text
+    return "".join(part if isinstance(part, str) else part.get("text", "") for part in text)
+
+
+class ExportJsonReader:
+    """Потоковый разбор result.json из экспорта Telegram Desktop.
+
+    Отдает те же записи (sender, text, id), что ExportStreamParser для HTML.
+    your_name — название чата, как заголовок страницы в HTML-экспорте.
+    Сообщения с id не больше min_message_id пропускаются.
+    """
+
+    def __init__(self, min_message_id: Optional[int] = None):
+        self.your_name: Optional[str] = None
+        self.chat: Dict[str, Any] = {}
+        self.min_message_id = min_message_id
+        self.last_message_id: Optional[int] = None
+
+    def records(self, stream: TextIO, chunk_size: int = CHUNK_SIZE) -> Iterator[Tuple[str, str, int]]:
+        reader = JsonStreamReader(stream, chunk_size)
+        for key in reader.iter_object():
+            if key != "messages":
+                # name, type, id — короткие поля перед списком сообщений
+                self.chat[key] = reader.value()
+                if key == "name" and isinstance(self.chat[key], str):
+                    self.your_name = self.chat[key].strip()
+                continue
+            yield from self._messages(reader)
+
+    def tail_records(self, stream: TextIO, chunk_size: int = CHUNK_SIZE) -> Iterator[Tuple[str, str, int]]:
+        # поток начинается с объекта сообщения внутри messages[]: дописываем "["
+        yield from self._messages(JsonStreamReader(stream, chunk_size, prefix="["))
+
+    def _messages(self, reader: JsonStreamReader) -> Iterator[Tuple[str, str, int]]:
+        for message in reader.iter_array():
+            if not isinstance(message, dict):
+                continue
+            msg_id = message.get("id")
+            if isinstance(msg_id, int):
+                if self.last_message_id is None or msg_id > self.last_message_id:
+                    self.last_message_id = msg_id
+                if self.min_message_id is not None and msg_id <= self.min_message_id:
+                    continue
+            else:
+                msg_id = NO_MESSAGE_ID
+            if message.get("type") != "message":
+                continue
+            clean_text = message_text(message.get("text", "")).strip()
+            if not clean_text:
+                continue
+            sender_name = (message.get("from") or "Unknown").strip()
+            yield sender_name, clean_text, msg_id
+
+
+def _read_file(reader: ExportJsonReader, source: ExportSource) -> Iterator[Tuple[str, str, int]]:
+    with open_export(source) as f:
+        yield from reader.records(f)
+
+
+def iter_json_messages(file_path: ExportSource) -> Iterator[Tuple[str, str]]:
+    for sender_name, clean_text, _ in _read_file(ExportJsonReader(), file_path):
+        yield sender_name, clean_text
+
+
+def parse_json(file_path: ExportSource) -> Tuple[List[str], List[Tuple[str, str]]]:
+    # то же, что parse_html, для JSON-экспорта
+    try:
+        reader = ExportJsonReader()
+        your_messages = []
+        all_messages = []
+
+        for sender_name, clean_text, _ in _read_file(reader, file_path):
+            if sender_name != "Unknown":
+                all_messages.append((sender_name, clean_text))
+
+            if sender_name == reader.your_name:
+                your_messages.append(clean_text)
+
+        return your_messages, all_messages
+    except Exception as e:
+        logger.error(f"Ошибка парсинга JSON: {e}")
+        return [], []
+
+
+def parse_json_grouped(file_path: ExportSource) -> Tuple[Corpus, Dict[str, Corpus]]:
+    try:
+        reader = ExportJsonReader()
+        return group_export(_read_file(reader, file_path), reader)
+    except Exception as e:
+        logger.error(f"Ошибка парсинга JSON: {e}")
+        return Corpus(), {}
+
+
+def parse_json_part(source: ExportSource, min_message_id: Optional[int] = None,
+                    tail: bool = False) -> Tuple[Optional[str], Dict[str, Corpus]]:
+    # как parse_export_part для HTML, ошибки разбора тоже не глотаются; tail — source
+    # начинается с сообщения внутри messages[] (дописанный хвост файла), имени чата в нем нет
+    reader = ExportJsonReader(min_message_id)
+    with open_export(source) as f:
+        records = reader.tail_records(f) if tail else reader.records(f)
+        by_author = group_by_author(records)
+    by_author.pop("Unknown", None)
+    by_author.pop("", None)
+    return reader.your_name, by_author
@@ -0,0 +1,150 @@
+import json
+import logging
+import time
+from collections import deque
+from typing import Any, AsyncIterator, Deque, Dict, List, Optional
+
+import aiohttp
+
+from config import (
+    LLM_CONNECT_TIMEOUT, LLM_READ_TIMEOUT, LLM_TOTAL_TIMEOUT,
+    LLM_CONNECTIONS_PER_HOST, LLM_KEEPALIVE_TIMEOUT
+)
+
+logger = logging.getLogger(__name__)
+
+
+async def iter_sse_data(content: aiohttp.StreamReader) -> AsyncIterator[str]:
+    # поля data одного события склеиваются через перевод строки, события
+    # разделены пустой строкой, строки с ":" в начале — комментарии (keep-alive)
+    data: List[str] = []
+    async for raw_line in content:
+        line = raw_line.decode("utf-8").rstrip("\r\n")
+        if not line:
+            if data:
+                yield "\n".join(data)
+                data = []
+            continue
+        if line.startswith(":"):
+            continue
+        field, _, value = line.partition(":")
+        if field == "data":
+            data.append(value[1:] if value.startswith(" ") else value)
+    if data:
+        yield "\n".join(data)
+
+
+class LLMClient:
+    """Долгоживущая aiohttp-сессия к LLM-провайдеру с пулом соединений.
+
+    Запускается и закрывается вместе с ботом, считает переиспользование
+    соединений и задержку запросов.
+    """
+
+    def __init__(self, connect_timeout: float = LLM_CONNECT_TIMEOUT, read_timeout: float = LLM_READ_TIMEOUT,
+                 total_timeout: float = LLM_TOTAL_TIMEOUT, limit_per_host: int = LLM_CONNECTIONS_PER_HOST,
+                 keepalive_timeout: float = LLM_KEEPALIVE_TIMEOUT):
+        self.connect_timeout = connect_timeout
+        self.read_timeout = read_timeout
+        self.total_timeout = total_timeout
+        self.limit_per_host = limit_per_host
+        self.keepalive_timeout = keepalive_timeout
+        self._session: Optional[aiohttp.ClientSession] = None
+
+        self.requests = 0
+        self.errors = 0
+        self.connections_created = 0
+        self.connections_reused = 0
+        self._latencies: Deque[float] = deque(maxlen=1000)
+
+    async def start(self):
+        if self._session is not None and not self._session.closed:
+            return
+
+        trace_config = aiohttp.TraceConfig()
+        trace_config.on_connection_create_end.append(self._on_connection_created)
+        trace_config.on_connection_reuseconn.append(self._on_connection_reused)
+
+        connector = aiohttp.TCPConnector(
+            limit_per_host=self.limit_per_host,
+            keepalive_timeout=self.keepalive_timeout,
+            ttl_dns_cache=300,
+            use_dns_cache=True,
+        )
+        timeout = aiohttp.ClientTimeout(
+            total=self.total_timeout,
+            sock_connect=self.connect_timeout,
+            sock_read=self.read_timeout,
+        )
+        self._session = aiohttp.ClientSession(connector=connector, timeout=timeout, trace_configs=[trace_config])
+        logger.info(f"HTTP-клиент LLM запущен (до {self.limit_per_host} соединений на хост).")
+
+    async def close(self):
+        if self._session is not None:
+            await self._session.close()
+            self._session = None
+            logger.info(f"HTTP-клиент LLM закрыт. Метрики: {self.metrics()}")
+
+    @property
+    def session(self) -> aiohttp.ClientSession:
+        if self._session is None or self._session.closed:
+            raise RuntimeError("LLMClient не запущен")
+        return self._session
+
+    async def _on_connection_created(self, session, context, params):
+        self.connections_created += 1
+
+    async def _on_connection_reused(self, session, context, params):
+        self.connections_reused += 1
+
+    async def post_json(self, url: str, headers: Dict[str, str], payload: Dict[str, Any]) -> Dict[str, Any]:
+        started = time.perf_counter()
+        self.requests += 1
+        try:
+            async with self.session.post(url, headers=headers, json=payload) as response:
+                response.raise_for_status()
+                return await response.json()
+        except Exception:
+            self.errors += 1
+            raise
+        finally:
+            self._latencies.append(time.perf_counter() - started)
+
+    async def stream_json(self, url: str, headers: Dict[str, str], payload: Dict[str, Any]) -> AsyncIterator[Dict[str, Any]]:
+        # потоковый ответ (SSE): по объекту на событие до "data: [DONE]"
+        started = time.perf_counter()
+        self.requests += 1
+        try:
+            async with self.session.post(url, headers=headers, json=payload) as response:
+                response.raise_for_status()
+                async for data in iter_sse_data(response.content):
+                    if data == "[DONE]":
+                        break
+                    yield json.loads(data)
+        except Exception:
+            self.errors += 1
+            raise
+        finally:
+            self._latencies.append(time.perf_counter() - started)
+
+    def metrics(self) -> Dict[str, Any]:
+        connections = self.connections_created + self.connections_reused
+        latencies = sorted(self._latencies)
+
+        def percentile(p: float) -> float:
+            if not latencies:
+                return 0.0
+            return round(latencies[min(len(latencies) - 1, int(p * len(latencies)))] * 1000, 1)
+
+        return {
+            "requests": self.requests,
+            "errors": self.errors,
+            "connections_created": self.connections_created,
+            "connections_reused": self.connections_reused,
+            "reuse_rate": round(self.connections_reused / connections, 3) if connections else 0.0,
+            "latency_p50_ms": percentile(0.5),
+            "latency_p95_ms": percentile(0.95),
+        }
+
+
+llm_client = LLMClient()
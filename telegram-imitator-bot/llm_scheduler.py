@@ -0,0 +1,207 @@
+import asyncio
+import logging
+import random
+import time
+from collections import deque
+from typing import Any, Awaitable, Callable, Deque, Dict, Optional, Set
+
+import aiohttp
+
+from config import (
+    LLM_MAX_IN_FLIGHT, LLM_RATE_PER_SEC, LLM_RATE_BURST,
+    LLM_MAX_RETRIES, LLM_RETRY_BASE_DELAY, LLM_RETRY_MAX_DELAY
+)
+
+logger = logging.getLogger(__name__)
+
+RequestFactory = Callable[[], Awaitable[Any]]
+
+
+class TokenBucket:
+    def __init__(self, rate: float, capacity: float):
+        self.rate = rate
+        self.capacity = capacity
+        self._tokens = capacity
+        self._updated = time.monotonic()
+
+    def _refill(self):
+        now = time.monotonic()
+        self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    async def acquire(self):
+        while True:
+            self._refill()
+            if self._tokens >= 1:
+                self._tokens -= 1
+                return
+            await asyncio.sleep((1 - self._tokens) / self.rate)
+
+
+class _Request:
+    def __init__(self, user_id: int, factory: RequestFactory):
+        self.user_id = user_id
+        self.factory = factory
+        self.future: asyncio.Future = asyncio.get_running_loop().create_future()
+
+
+def _retry_after(error: Exception) -> Optional[float]:
+    headers = getattr(error, "headers", None)
+    if not headers:
+        return None
+    try:
+        return float(headers.get("Retry-After"))
+    except (TypeError, ValueError):
+        return None
+
+
+def is_retryable(error: Exception) -> bool:
+    if isinstance(error, aiohttp.ClientResponseError):
+        return error.status == 429 or error.status >= 500
+    return isinstance(error, (asyncio.TimeoutError, aiohttp.ClientConnectionError))
+
+
+class LLMScheduler:
+    """Планировщик запросов к LLM.
+
+    Ограничивает число одновременных запросов и их частоту (token bucket),
+    обслуживает пользователей по кругу, чтобы один активный пользователь не
+    занимал все слоты, и повторяет запросы при 429/5xx с экспоненциальной
+    задержкой и джиттером.
+    """
+
+    def __init__(self, max_in_flight: int = LLM_MAX_IN_FLIGHT, rate_per_sec: float = LLM_RATE_PER_SEC,
+                 burst: float = LLM_RATE_BURST, max_retries: int = LLM_MAX_RETRIES,
+                 base_delay: float = LLM_RETRY_BASE_DELAY, max_delay: float = LLM_RETRY_MAX_DELAY):
+        self.max_in_flight = max_in_flight
+        self.max_retries = max_retries
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self._bucket = TokenBucket(rate_per_sec, burst)
+        self._queues: Dict[int, Deque[_Request]] = {}
+        self._order: Deque[int] = deque()
+        self._slots: Optional[asyncio.Semaphore] = None
+        self._has_work: Optional[asyncio.Event] = None
+        self._dispatcher: Optional[asyncio.Task] = None
+        self._running: Set[asyncio.Task] = set()
+
+        self.completed = 0
+        self.failed = 0
+        self.retries = 0
+
+    async def start(self):
+        if self._dispatcher is not None:
+            return
+        self._slots = asyncio.Semaphore(self.max_in_flight)
+        self._has_work = asyncio.Event()
+        self._dispatcher = asyncio.create_task(self._dispatch())
+        logger.info(f"Планировщик LLM запущен: до {self.max_in_flight} запросов одновременно, {self._bucket.rate}/с.")
+
+    async def stop(self):
+        if self._dispatcher is None:
+            return
+        self._dispatcher.cancel()
+        for task in list(self._running):
+            task.cancel()
+        await asyncio.gather(self._dispatcher, *self._running, return_exceptions=True)
+        for queue in self._queues.values():
+            for request in queue:
+                request.future.cancel()
+        self._queues.clear()
+        self._order.clear()
+        self._dispatcher = None
+        logger.info(f"Планировщик LLM остановлен. Метрики: {self.metrics()}")
+
+    def pending(self, user_id: Optional[int] = None) -> int:
+        if user_id is not None:
+            return len(self._queues.get(user_id, ()))
+        return sum(len(queue) for queue in self._queues.values())
+
+    async def submit(self, user_id: int, factory: RequestFactory) -> Any:
+        if self._dispatcher is None:
+            raise RuntimeError("LLMScheduler не запущен")
+
+        request = _Request(user_id, factory)
+        queue = self._queues.get(user_id)
+        if queue is None:
+            queue = self._queues[user_id] = deque()
+            self._order.append(user_id)
+        queue.append(request)
+        self._has_work.set()
+        return await request.future
+
+    def _next_request(self) -> Optional[_Request]:
+        while self._order:
+            user_id = self._order.popleft()
+            queue = self._queues[user_id]
+            request = queue.popleft()
+            if queue:
+                self._order.append(user_id)
+            else:
+                del self._queues[user_id]
+            if not request.future.done():
+                return request
+        return None
+
+    async def _dispatch(self):
+        while True:
+            await self._has_work.wait()
+            await self._slots.acquire()
+            request = self._next_request()
+            if not self._queues:
+                self._has_work.clear()
+            if request is None:
+                self._slots.release()
+                continue
+
+            task = asyncio.create_task(self._execute(request))
+            self._running.add(task)
+            task.add_done_callback(self._running.discard)
+            # ответ больше не нужен (ожидающий отменен) — прерываем и сам запрос
+            request.future.add_done_callback(lambda future, task=task: future.cancelled() and task.cancel())
+
+    async def _execute(self, request: _Request):
+        try:
+            attempt = 0
+            while True:
+                await self._bucket.acquire()
+                if request.future.done():
+                    return
+                try:
+                    result = await request.factory()
+                except Exception as e:
+                    if attempt >= self.max_retries or not is_retryable(e):
+                        self.failed += 1
+                        if not request.future.done():
+                            request.future.set_exception(e)
+                        return
+
+                    delay = random.uniform(0, min(self.max_delay, self.base_delay * 2 ** attempt))
+                    retry_after = _retry_after(e)
+                    if retry_after is not None:
+                        delay = max(delay, min(retry_after, self.max_delay))
+                    attempt += 1
+                    self.retries += 1
+                    logger.warning(f"Запрос к LLM для user_id {request.user_id} не удался ({e}), повтор #{attempt} через {delay:.2f} с.")
+                    await asyncio.sleep(delay)
+                else:
+                    self.completed += 1
+                    if not request.future.done():
+                        request.future.set_result(result)
+                    return
+        finally:
+            if not request.future.done():
+                request.future.cancel()
+            self._slots.release()
+
+    def metrics(self) -> Dict[str, Any]:
+        return {
+            "completed": self.completed,
+            "failed": self.failed,
+            "retries": self.retries,
+            "pending": self.pending(),
+            "in_flight": len(self._running),
+        }
+
+
+llm_scheduler = LLMScheduler()
@@ -2,7 +2,10 @@ import logging
 from aiogram import Router, F, types
 from aiogram.types import InlineKeyboardMarkup, InlineKeyboardButton
 from aiogram.exceptions import TelegramBadRequest
-import database
+import repository
+from response_cache import response_cache
+from retrieval import retrieval_indexes
+from sessions import chat_memory, reply_coalescer, user_states
 from keyboards import get_main_kb
 from typing import List
 
@@ -11,45 +14,12 @@ logger = logging.getLogger(__name__)
 profile_router = Router()
 
 async def get_saved_targets(user_id: int) -> List[str]:
-    targets = []
-    try:
-        database.cursor.execute("""
-            SELECT DISTINCT target FROM imitation_data WHERE user_id = ? ORDER BY target
-        """, (user_id,))
-        rows = database.cursor.fetchall()
-        targets = sorted([row[0] for row in rows if row and row[0]])
-        logger.debug(f"Найдены сохраненные профили для user_id {user_id}: {targets}")
-    except database.sqlite3.Error as e:
-        logger.error(f"Ошибка БД при получении сохраненных профилей для user_id {user_id}: {e}")
+    targets = await repository.get_saved_targets(user_id)
+    logger.debug(f"Найдены сохраненные профили для user_id {user_id}: {targets}")
     return targets
 
 async def delete_target_profile(user_id: int, target: str) -> bool:
-    success = False
-    try:
-        database.cursor.execute("SELECT 1")
-    except (database.sqlite3.ProgrammingError, database.sqlite3.InterfaceError) as conn_err:
-         logger.error(f"Соединение с БД потеряно перед удалением профиля '{target}' user_id {user_id}: {conn_err}")
-         return False
-
-    try:
-        database.cursor.execute("""
-            DELETE FROM imitation_data WHERE user_id = ? AND target = ?
-        """, (user_id, target))
-        database.conn.commit()
-        deleted_rows = database.cursor.rowcount
-        if deleted_rows > 0:
-            logger.info(f"Удалено {deleted_rows} записей для user_id {user_id}, target '{target}'.")
-            success = True
-        else:
-            logger.warning(f"Не найдены записи для удаления (user_id {user_id}, target '{target}').")
-            success = True
-    except database.sqlite3.Error as e:
-        logger.error(f"Ошибка БД при удалении профиля '{target}' для user_id {user_id}: {e}")
-        try:
-            database.conn.rollback()
-        except database.sqlite3.Error as rb_err:
-             logger.error(f"Ошибка при откате транзакции после ошибки удаления: {rb_err}")
-    return success
+    return await repository.delete_target(user_id, target)
 
 def get_profile_management_kb(targets: List[str]) -> InlineKeyboardMarkup:
     buttons = []
@@ -153,12 +123,15 @@ async def confirm_delete_target(callback: types.CallbackQuery):
     if deleted:
         await callback.answer(f"Профиль '{target_to_delete}' удален.")
 
-        from bot import user_states, chat_memory
+        response_cache.invalidate(user_id, target_to_delete)
+        retrieval_indexes.invalidate(user_id, target_to_delete)
+        await user_states.load(user_id)
         if user_id in user_states and user_states[user_id].get("target") == target_to_delete:
             if user_states[user_id].get("imitating"):
                  logger.info(f"Пользователь {user_id} был в режиме имитации удаленного профиля '{target_to_delete}'. Выключаю режим.")
             user_states[user_id] = {"imitating": False}
-            if user_id in chat_memory: del chat_memory[user_id]
+            chat_memory.discard(user_id)
+            reply_coalescer.discard(user_id)
             logger.info(f"Сброшено user_state и chat_memory для удаленного профиля '{target_to_delete}' user_id {user_id}")
 
         targets = await get_saved_targets(user_id)
@@ -0,0 +1,83 @@
+from collections import Counter
+from typing import Any, Dict, List, Optional, Sequence
+
+from config import PROMPT_EXAMPLE_CHARS, PROMPT_HISTORY_MESSAGES, PROMPT_TOKEN_BUDGET
+from corpus import Corpus
+
+
+def estimate_tokens(text: str) -> int:
+    # локальная оценка без токенизатора модели: ~4 байта UTF-8 на токен,
+    # для кириллицы это около двух символов на токен
+    return (len(text.encode("utf-8")) + 3) // 4
+
+
+def _shorten(text: str, limit: int) -> str:
+    text = " ".join(text.split())
+    return text if len(text) <= limit else text[:limit - 1] + "…"
+
+
+def fallback_style(style_samples: Optional[Corpus]) -> Dict[str, Any]:
+    # профиль без проанализированного стиля: хоть какие-то ключевые слова и длина
+    if not style_samples or len(style_samples) < 5:
+        return {}
+    keywords = Counter(w.lower() for w in style_samples.iter_words() if len(w) > 3)
+    return {
+        "keywords": [word for word, _ in keywords.most_common(5)],
+        "avg_len": sum(style_samples.lengths) // len(style_samples)
+    }
+
+
+class PromptTemplate:
+    """Системный промпт профиля.
+
+    Правила и стиль собираются один раз при выборе профиля, на каждый запрос
+    добавляются только примеры и последние реплики — столько, сколько
+    помещается в бюджет токенов.
+    """
+
+    def __init__(self, target: str, style_data: Optional[Dict[str, Any]],
+                 style_samples: Optional[Corpus] = None, budget: int = PROMPT_TOKEN_BUDGET):
+        self.target = target
+        self.style_data = style_data or fallback_style(style_samples)
+        self.budget = budget
+
+        keywords = ", ".join(self.style_data.get("keywords", []))[:50]
+        self.header = (
+            f"Ты точно имитируешь {target}. Правила:\n"
+            f"1. Отвечай КОРОТКО ({self.style_data.get('avg_len', 50)} символов максимум)\n"
+            f"2. Используй характерные слова: {keywords}\n"
+            "3. Избегай общих фраз (\"Что ты хотел?\", \"Повторяю\")\n"
+            "4. Если не понял вопрос — скажи \"Че?\" или \"Не понял\"\n"
+            "5. Никогда не повторяй фразы дословно из примеров"
+        )
+        self.task = f"Задача: ответь на последнее сообщение как {target}. Только 1 предложение!"
+        self.fixed_tokens = estimate_tokens(self.header) + estimate_tokens(self.task)
+
+    def render(self, examples: Sequence[str], history: List[Dict[str, str]]) -> str:
+        left = self.budget - self.fixed_tokens
+
+        # примеры важнее истории: сначала они, потом самые свежие реплики
+        example_lines = []
+        for example in examples:
+            line = "- " + _shorten(example, PROMPT_EXAMPLE_CHARS)
+            cost = estimate_tokens(line) + 1
+            if cost > left:
+                continue
+            example_lines.append(line)
+            left -= cost
+
+        history_lines: List[str] = []
+        for item in reversed(history[-PROMPT_HISTORY_MESSAGES:]):
+            speaker = self.target if item.get("role") == "assistant" else "Собеседник"
+            line = f"{speaker}: {_shorten(item.get('content', ''), PROMPT_EXAMPLE_CHARS)}"
+            cost = estimate_tokens(line) + 1
+            if cost > left:
+                break
+            history_lines.insert(0, line)
+            left -= cost
+
+        parts = [self.header, "Примеры стиля:\n" + ("\n".join(example_lines) or "Нет данных")]
+        if history_lines:
+            parts.append("Текущий диалог:\n" + "\n".join(history_lines))
+        parts.append(self.task)
+        return "\n\n".join(parts)
@@ -0,0 +1,97 @@
+import asyncio
+import functools
+import logging
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict, List, Optional
+
+import database
+from corpus import Corpus
+
+logger = logging.getLogger(__name__)
+
+# один поток владеет соединением SQLite: запросы не блокируют event loop
+# и не перемешиваются между собой
+_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="sqlite")
+
+
+async def _run(func: Callable, *args, **kwargs) -> Any:
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(_executor, functools.partial(func, *args, **kwargs))
+
+
+async def init() -> None:
+    await _run(database.init_db)
+
+
+def shutdown() -> None:
+    _executor.shutdown(wait=True)
+    if database.conn is not None:
+        database.conn.close()
+        database.conn = None
+    logger.info("Соединение с базой данных закрыто.")
+
+
+async def merge_messages(user_id: int, target: str, messages: Corpus, style_stats: Optional[Dict[str, Any]] = None,
+                         report_stats: Optional[Dict[str, Any]] = None, min_samples: int = 0) -> int:
+    # id сообщений из экспорта — часть ключа, по которому отсеиваются уже сохраненные
+    return await _run(database.merge_messages, user_id, target, messages, messages.message_ids,
+                      style_stats, report_stats, min_samples)
+
+
+async def find_import(user_id: int, file_unique_id: Optional[str] = None,
+                      content_hash: Optional[str] = None) -> Optional[Dict[str, Any]]:
+    return await _run(database.find_import, user_id, file_unique_id, content_hash)
+
+
+async def get_prefix_candidates(user_id: int, fmt: str, size: int, limit: int) -> List[Dict[str, Any]]:
+    return await _run(database.get_prefix_candidates, user_id, fmt, size, limit)
+
+
+async def save_import(user_id: int, file_unique_id: Optional[str], fingerprint: Dict[str, Any],
+                      chat_name: Optional[str], summary: Dict[str, Any]) -> None:
+    await _run(database.save_import, user_id, file_unique_id, fingerprint, chat_name, summary)
+
+
+def _load_corpus(user_id: int, target: str, limit: int) -> Corpus:
+    return Corpus(database.get_messages(user_id, target, limit))
+
+
+async def get_messages(user_id: int, target: str, limit: int = 50) -> Corpus:
+    return await _run(_load_corpus, user_id, target, limit)
+
+
+async def search_messages(user_id: int, target: str, query: str, limit: int = 10) -> List[str]:
+    return await _run(database.get_messages, user_id, target, limit, query)
+
+
+async def get_style_data(user_id: int, target: str) -> Optional[Dict[str, Any]]:
+    return await _run(database.get_style_data_from_db, user_id, target)
+
+
+async def get_profile_stats(user_id: int) -> List[Dict[str, Any]]:
+    return await _run(database.get_profile_stats, user_id)
+
+
+async def clear_data(user_id: int) -> bool:
+    return await _run(database.clear_data, user_id)
+
+
+async def get_saved_targets(user_id: int) -> List[str]:
+    return await _run(database.get_saved_targets, user_id)
+
+
+async def delete_target(user_id: int, target: str) -> bool:
+    return await _run(database.delete_target, user_id, target)
+
+
+async def load_session(kind: str, user_id: int) -> Optional[str]:
+    return await _run(database.load_session, kind, user_id)
+
+
+# вызываются из синхронного кода (вытеснение сессий), результат не ждем
+def save_session_nowait(kind: str, user_id: int, data: str) -> None:
+    _executor.submit(database.save_session, kind, user_id, data)
+
+
+def delete_session_nowait(kind: str, user_id: int) -> None:
+    _executor.submit(database.delete_session, kind, user_id)
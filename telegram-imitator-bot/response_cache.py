@@ -0,0 +1,104 @@
+import hashlib
+import random
+import re
+import time
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional, Tuple
+
+from config import RESPONSE_CACHE_SIZE, RESPONSE_CACHE_TTL, RESPONSE_CACHE_VARIANTS
+
+CacheKey = Tuple[int, str, str, str]
+
+_non_word_re = re.compile(r"[^\w\s]+")
+_spaces_re = re.compile(r"\s+")
+
+
+def normalize_prompt(prompt: str) -> str:
+    text = prompt.lower().replace("ё", "е")
+    text = _non_word_re.sub(" ", text)
+    return _spaces_re.sub(" ", text).strip()
+
+
+def history_fingerprint(history: List[Dict[str, str]]) -> str:
+    digest = hashlib.blake2b(digest_size=8)
+    for item in history:
+        digest.update(item.get("role", "").encode())
+        digest.update(b"\0")
+        digest.update(normalize_prompt(item.get("content", "")).encode())
+        digest.update(b"\0")
+    return digest.hexdigest()
+
+
+def make_key(user_id: int, target: str, prompt: str, history: List[Dict[str, str]]) -> CacheKey:
+    return user_id, target, normalize_prompt(prompt), history_fingerprint(history)
+
+
+class ResponseCache:
+    """LRU-кэш ответов с TTL.
+
+    На каждый ключ хранится несколько вариантов ответа: пока их меньше
+    variants, запрос считается промахом и идет в LLM, затем отдается
+    случайный из накопленных, чтобы ответы не становились одинаковыми.
+    """
+
+    def __init__(self, max_entries: int = RESPONSE_CACHE_SIZE, ttl: float = RESPONSE_CACHE_TTL,
+                 variants: int = RESPONSE_CACHE_VARIANTS):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.variants = max(1, variants)
+        self._entries: "OrderedDict[CacheKey, Tuple[float, List[str]]]" = OrderedDict()
+
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def get(self, key: CacheKey) -> Optional[str]:
+        entry = self._entries.get(key)
+        if entry is not None and time.monotonic() - entry[0] > self.ttl:
+            del self._entries[key]
+            entry = None
+
+        if entry is None or len(entry[1]) < self.variants:
+            self.misses += 1
+            return None
+
+        self._entries.move_to_end(key)
+        self.hits += 1
+        return random.choice(entry[1])
+
+    def put(self, key: CacheKey, reply: str):
+        entry = self._entries.get(key)
+        if entry is None:
+            entry = (time.monotonic(), [])
+            self._entries[key] = entry
+        else:
+            self._entries.move_to_end(key)
+
+        # повторы тоже считаются: если модель всегда отвечает одинаково, кэш все равно заполнится
+        if len(entry[1]) < self.variants:
+            entry[1].append(reply)
+
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+            self.evictions += 1
+
+    def invalidate(self, user_id: int, target: Optional[str] = None):
+        stale = [key for key in self._entries if key[0] == user_id and (target is None or key[1] == target)]
+        for key in stale:
+            del self._entries[key]
+
+    def metrics(self) -> Dict[str, Any]:
+        lookups = self.hits + self.misses
+        return {
+            "entries": len(self._entries),
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "hit_rate": round(self.hits / lookups, 3) if lookups else 0.0,
+        }
+
+
+response_cache = ResponseCache()
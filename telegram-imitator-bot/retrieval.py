@@ -0,0 +1,178 @@
+import asyncio
+import heapq
+import logging
+import math
+import operator
+import time
+from array import array
+from collections import Counter, OrderedDict
+from itertools import chain, compress, islice, repeat
+from operator import itemgetter
+from typing import Any, Dict, List, Optional, Tuple
+
+import repository
+from config import (
+    RETRIEVAL_CACHE_SIZE, RETRIEVAL_MAX_MESSAGES, RETRIEVAL_MAX_POSTINGS, RETRIEVAL_MAX_QUERY_TERMS
+)
+from corpus import Corpus
+from style_analysis import REPORT_STOP_WORDS, REPORT_TRANSLATOR
+
+logger = logging.getLogger(__name__)
+
+IndexKey = Tuple[int, str]
+
+
+def normalize_term(token: str) -> Optional[str]:
+    term = token.lower().replace('ё', 'е').translate(REPORT_TRANSLATOR)
+    if len(term) < 2 or term in REPORT_STOP_WORDS:
+        return None
+    return term
+
+
+class BM25Index:
+    """Инвертированный индекс BM25 по сообщениям профиля.
+
+    Для каждого терма хранятся max_postings сообщений с наибольшим весом
+    BM25 (без idf) и полная документная частота. Запрос берет
+    max_query_terms самых редких термов, поэтому длинные запросы и частые
+    слова не замедляют поиск.
+    """
+
+    def __init__(self, corpus: Corpus, k1: float = 1.2, b: float = 0.75,
+                 max_postings: int = RETRIEVAL_MAX_POSTINGS,
+                 max_query_terms: int = RETRIEVAL_MAX_QUERY_TERMS):
+        self.corpus = corpus
+        self.max_query_terms = max_query_terms
+        self.term_ids: Dict[str, int] = {}
+        self.docs: List[array] = []
+        self.weights: List[array] = []
+
+        # термы считаем один раз на слово словаря, а не на каждое вхождение
+        token_terms = []
+        for token in corpus.vocabulary.tokens:
+            term = normalize_term(token)
+            if term is None:
+                token_terms.append(-1)
+                continue
+            term_id = self.term_ids.get(term)
+            if term_id is None:
+                term_id = self.term_ids[term] = len(self.term_ids)
+            token_terms.append(term_id)
+
+        # номер сообщения для каждой позиции массива токенов; частоты (терм, сообщение)
+        # и длины сообщений считает Counter, без цикла по словам в Python
+        offsets = corpus.offsets
+        sizes = list(map(operator.sub, islice(offsets, 1, None), offsets))
+        token_docs = array('I', chain.from_iterable(map(repeat, range(len(corpus)), sizes)))
+        token_term_ids = array('i', map(token_terms.__getitem__, corpus.tokens))
+        is_term = list(map((0).__le__, token_term_ids))
+        doc_lengths = Counter(compress(token_docs, is_term))
+        pair_counts = Counter(compress(zip(token_term_ids, token_docs), is_term))
+
+        self.doc_count = len(corpus)
+        avg_length = sum(doc_lengths.values()) / self.doc_count if self.doc_count else 0.0
+        norms = {doc: k1 * (1 - b + b * length / avg_length) for doc, length in doc_lengths.items()}
+
+        postings: List[List[Tuple[float, int]]] = [[] for _ in self.term_ids]
+        for (term_id, doc), count in pair_counts.items():
+            postings[term_id].append((count * (k1 + 1) / (count + norms[doc]), doc))
+
+        # храним только max_postings лучших сообщений на терм, df — полный
+        self.df = array('I', map(len, postings))
+        for term_postings in postings:
+            best = heapq.nlargest(max_postings, term_postings)
+            self.docs.append(array('I', map(itemgetter(1), best)))
+            self.weights.append(array('f', map(itemgetter(0), best)))
+
+    def __len__(self) -> int:
+        return self.doc_count
+
+    def search(self, query: str, k: int) -> List[str]:
+        scores: Dict[int, float] = {}
+        term_ids = {self.term_ids.get(normalize_term(token)) for token in query.split()}
+        term_ids.discard(None)
+        for term_id in heapq.nsmallest(self.max_query_terms, term_ids, key=self.df.__getitem__):
+            df = self.df[term_id]
+            idf = math.log(1 + (self.doc_count - df + 0.5) / (df + 0.5))
+            for doc, weight in zip(self.docs[term_id], self.weights[term_id]):
+                scores[doc] = scores.get(doc, 0.0) + idf * weight
+
+        results: List[str] = []
+        # одинаковые сообщения в примерах не нужны, берем с запасом
+        for doc, _ in heapq.nlargest(k * 3, scores.items(), key=itemgetter(1)):
+            text = self.corpus[doc]
+            if text not in results:
+                results.append(text)
+                if len(results) == k:
+                    break
+        return results
+
+
+class RetrievalIndexes:
+    """LRU индексов по профилям.
+
+    Индекс строится в фоне при первом запросе; до его готовности примеры
+    ищутся полнотекстовым индексом базы, без загрузки профиля в память.
+    """
+
+    def __init__(self, max_profiles: int = RETRIEVAL_CACHE_SIZE, max_messages: int = RETRIEVAL_MAX_MESSAGES):
+        self.max_profiles = max_profiles
+        self.max_messages = max_messages
+        self._indexes: "OrderedDict[IndexKey, BM25Index]" = OrderedDict()
+        self._building: Dict[IndexKey, asyncio.Task] = {}
+        # растет при invalidate(): индекс, начатый до сброса, в кэш не попадет
+        self._epochs: Dict[int, int] = {}
+        self.builds = 0
+        self.fts_queries = 0
+
+    def _start_build(self, key: IndexKey):
+        if key not in self._building:
+            task = self._building[key] = asyncio.create_task(self._build(key))
+            task.add_done_callback(lambda done: self._forget(key, done))
+
+    def _forget(self, key: IndexKey, task: asyncio.Task):
+        if self._building.get(key) is task:
+            del self._building[key]
+        if not task.cancelled() and task.exception() is not None:
+            logger.error(f"Не удалось построить индекс примеров для '{key[1]}' (user_id {key[0]}): {task.exception()}")
+
+    async def _build(self, key: IndexKey) -> BM25Index:
+        epoch = self._epochs.get(key[0], 0)
+        started = time.perf_counter()
+        corpus = await repository.get_messages(key[0], key[1], self.max_messages)
+        loop = asyncio.get_running_loop()
+        index = await loop.run_in_executor(None, BM25Index, corpus)
+        self.builds += 1
+        logger.info(f"Индекс примеров для '{key[1]}' (user_id {key[0]}): {len(index)} сообщений за {time.perf_counter() - started:.2f} с.")
+
+        # профиль могли удалить или перезагрузить, пока индекс строился
+        if self._epochs.get(key[0], 0) == epoch:
+            self._indexes[key] = index
+            while len(self._indexes) > self.max_profiles:
+                self._indexes.popitem(last=False)
+        return index
+
+    async def search(self, user_id: int, target: str, query: str, k: int) -> List[str]:
+        key = (user_id, target)
+        index = self._indexes.get(key)
+        if index is not None:
+            self._indexes.move_to_end(key)
+            return index.search(query, k)
+
+        # пока индекс строится в фоне, отвечаем из FTS5 в базе
+        self._start_build(key)
+        self.fts_queries += 1
+        return await repository.search_messages(user_id, target, query, k)
+
+    def invalidate(self, user_id: int, target: Optional[str] = None):
+        # незавершенные построения не отменяем: эпоха не даст им попасть в кэш
+        self._epochs[user_id] = self._epochs.get(user_id, 0) + 1
+        stale = [key for key in self._indexes if key[0] == user_id and (target is None or key[1] == target)]
+        for key in stale:
+            del self._indexes[key]
+
+    def metrics(self) -> Dict[str, Any]:
+        return {"indexes": len(self._indexes), "builds": self.builds, "fts_queries": self.fts_queries}
+
+
+retrieval_indexes = RetrievalIndexes()
@@ -0,0 +1,212 @@
+import asyncio
+import json
+import logging
+import sys
+import time
+from collections import OrderedDict
+from typing import Any, Awaitable, Callable, Dict, Iterator, MutableMapping, Optional
+
+import repository
+
+logger = logging.getLogger(__name__)
+
+Snapshot = Dict[str, Any]
+SnapshotFunc = Callable[[Dict[str, Any]], Optional[Snapshot]]
+RehydrateFunc = Callable[[int, Snapshot], Awaitable[Optional[Dict[str, Any]]]]
+
+
+def estimate_size(value: Any) -> int:
+    # грубая оценка: строки, списки и словари, из которых состоят сессии
+    if isinstance(value, dict):
+        return sys.getsizeof(value) + sum(estimate_size(k) + estimate_size(v) for k, v in value.items())
+    if isinstance(value, (list, tuple, set)):
+        return sys.getsizeof(value) + sum(estimate_size(item) for item in value)
+    return sys.getsizeof(value)
+
+
+class MemorySessionBackend:
+    def __init__(self):
+        self._snapshots: Dict[int, Snapshot] = {}
+
+    def save(self, user_id: int, snapshot: Snapshot):
+        self._snapshots[user_id] = snapshot
+
+    def delete(self, user_id: int):
+        self._snapshots.pop(user_id, None)
+
+    async def load(self, user_id: int) -> Optional[Snapshot]:
+        return self._snapshots.get(user_id)
+
+    def release(self, user_id: int):
+        # снимок нужен только до возврата сессии в память
+        self._snapshots.pop(user_id, None)
+
+
+class SqliteSessionBackend:
+    """Снимки сессий в таблице sessions, переживают перезапуск бота."""
+
+    def __init__(self, kind: str):
+        self.kind = kind
+
+    def save(self, user_id: int, snapshot: Snapshot):
+        repository.save_session_nowait(self.kind, user_id, json.dumps(snapshot, ensure_ascii=False))
+
+    def delete(self, user_id: int):
+        repository.delete_session_nowait(self.kind, user_id)
+
+    async def load(self, user_id: int) -> Optional[Snapshot]:
+        data = await repository.load_session(self.kind, user_id)
+        return json.loads(data) if data else None
+
+    def release(self, user_id: int):
+        # снимок остается в базе: после падения бота это последнее сохраненное состояние
+        pass
+
+
+def make_backend(kind: str, name: str):
+    if name == "memory":
+        return MemorySessionBackend()
+    if name == "sqlite":
+        return SqliteSessionBackend(kind)
+    raise ValueError(f"Неизвестный backend сессий: {name}")
+
+
+class SessionStore(MutableMapping):
+    """Словарь сессий с вытеснением по простою, LRU и бюджету памяти.
+
+    Ведет себя как обычный dict для существующего кода. Вытесненная сессия
+    сохраняется компактным снимком в backend, а load() восстанавливает ее,
+    когда пользователь пишет снова.
+    """
+
+    def __init__(self, name: str, idle_ttl: float, max_sessions: int, memory_budget: int,
+                 backend=None, snapshot: Optional[SnapshotFunc] = None,
+                 rehydrate: Optional[RehydrateFunc] = None):
+        self.name = name
+        self.idle_ttl = idle_ttl
+        self.max_sessions = max_sessions
+        self.memory_budget = memory_budget
+        self.backend = backend if backend is not None else MemorySessionBackend()
+        self._snapshot = snapshot or (lambda state: state)
+        self._rehydrate = rehydrate
+        self._data: "OrderedDict[int, Dict[str, Any]]" = OrderedDict()
+        self._touched: Dict[int, float] = {}
+        self._restoring: Dict[int, asyncio.Future] = {}
+        self._sweeper: Optional[asyncio.Task] = None
+
+        self.evictions = 0
+        self.rehydrations = 0
+
+    def __getitem__(self, user_id: int) -> Dict[str, Any]:
+        value = self._data[user_id]
+        self._data.move_to_end(user_id)
+        self._touched[user_id] = time.monotonic()
+        return value
+
+    def __setitem__(self, user_id: int, value: Dict[str, Any]):
+        self._data[user_id] = value
+        self._data.move_to_end(user_id)
+        self._touched[user_id] = time.monotonic()
+        while len(self._data) > self.max_sessions:
+            self._evict(next(iter(self._data)))
+
+    def __delitem__(self, user_id: int):
+        del self._data[user_id]
+        del self._touched[user_id]
+        self.backend.delete(user_id)
+
+    def __contains__(self, user_id: object) -> bool:
+        return user_id in self._data
+
+    def __iter__(self) -> Iterator[int]:
+        return iter(self._data)
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+    def discard(self, user_id: int):
+        # удаляет и сессию в памяти, и ее снимок
+        self._data.pop(user_id, None)
+        self._touched.pop(user_id, None)
+        self.backend.delete(user_id)
+
+    async def load(self, user_id: int) -> Optional[Dict[str, Any]]:
+        if user_id in self._data:
+            return self[user_id]
+
+        # параллельные load одного пользователя ждут одно восстановление:
+        # иначе второй не увидит снимок, пока первый его восстанавливает
+        restoring = self._restoring.get(user_id)
+        if restoring is None:
+            restoring = asyncio.ensure_future(self._restore(user_id))
+            self._restoring[user_id] = restoring
+            restoring.add_done_callback(lambda _: self._restoring.pop(user_id, None))
+        await asyncio.shield(restoring)
+        return self._data.get(user_id)
+
+    async def _restore(self, user_id: int):
+        snapshot = await self.backend.load(user_id)
+        if snapshot is None or user_id in self._data:
+            return
+
+        state = await self._rehydrate(user_id, snapshot) if self._rehydrate else snapshot
+        if user_id not in self._data and state is not None:
+            self.rehydrations += 1
+            self[user_id] = state
+            logger.debug(f"Сессия {self.name} для user_id {user_id} восстановлена из снимка.")
+        self.backend.release(user_id)
+
+    def _evict(self, user_id: int):
+        state = self._data.pop(user_id)
+        self._touched.pop(user_id, None)
+        snapshot = self._snapshot(state)
+        if snapshot:
+            self.backend.save(user_id, snapshot)
+        self.evictions += 1
+
+    def sweep(self):
+        evictions_before = self.evictions
+        now = time.monotonic()
+        idle = [user_id for user_id, touched in self._touched.items() if now - touched > self.idle_ttl]
+        for user_id in idle:
+            self._evict(user_id)
+
+        total = sum(estimate_size(state) for state in self._data.values())
+        while self._data and total > self.memory_budget:
+            user_id = next(iter(self._data))
+            total -= estimate_size(self._data[user_id])
+            self._evict(user_id)
+
+        if self.evictions != evictions_before:
+            logger.info(f"Сессии {self.name}: {len(self._data)} в памяти, ~{total // 1024} КБ, вытеснено всего {self.evictions}.")
+
+    def flush(self):
+        # при остановке сохраняем все живые сессии, чтобы sqlite-backend пережил перезапуск
+        for user_id in list(self._data):
+            self._evict(user_id)
+
+    async def _sweep_loop(self, interval: float):
+        while True:
+            await asyncio.sleep(interval)
+            try:
+                self.sweep()
+            except Exception as e:
+                logger.error(f"Ошибка очистки сессий {self.name}: {e}", exc_info=True)
+
+    def start(self, interval: float):
+        if self._sweeper is None:
+            self._sweeper = asyncio.create_task(self._sweep_loop(interval))
+
+    async def stop(self):
+        if self._sweeper is not None:
+            self._sweeper.cancel()
+            await asyncio.gather(self._sweeper, return_exceptions=True)
+            self._sweeper = None
+        self.flush()
+
+    def metrics(self) -> Dict[str, Any]:
+        return {
+            "sessions": len(self._data),
+            "evictions": self.evictions,
+            "rehydrations": self.rehydrations,
+        }
@@ -0,0 +1,57 @@
+import logging
+from typing import Any, Dict, Optional
+
+import repository
+from coalescer import MessageCoalescer
+from config import SESSION_BACKEND, SESSION_IDLE_TTL, SESSION_MAX_COUNT, SESSION_MEMORY_BUDGET
+from prompt_builder import PromptTemplate
+from session_store import SessionStore, make_backend
+
+logger = logging.getLogger(__name__)
+
+MIN_SAMPLES_FOR_IMITATION = 5
+
+
+def snapshot_user_state(state: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+    # style_samples и style_data не сохраняем, они восстанавливаются из БД
+    if not state.get("imitating") or not state.get("target"):
+        return None
+    return {"imitating": True, "target": state["target"]}
+
+
+async def rehydrate_user_state(user_id: int, snapshot: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+    target = snapshot["target"]
+    style_samples = await repository.get_messages(user_id, target)
+    if len(style_samples) < MIN_SAMPLES_FOR_IMITATION:
+        logger.info(f"Профиль '{target}' для user_id {user_id} больше недоступен, сессия не восстановлена.")
+        return None
+    style_data = await repository.get_style_data(user_id, target)
+    return {
+        "imitating": True,
+        "target": target,
+        "style_samples": style_samples,
+        "style_data": style_data,
+        "prompt_template": PromptTemplate(target, style_data, style_samples)
+    }
+
+
+def snapshot_chat_memory(state: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+    # в memory-backend снимок лежал бы в том же процессе и ничего не освобождал:
+    # историю диалога при вытеснении просто забываем
+    return state if SESSION_BACKEND != "memory" else None
+
+
+# общие для bot и profile_management объекты: при запуске `python bot.py` модуль бота —
+# __main__, и `from bot import ...` создал бы вторые, пустые экземпляры
+user_states: SessionStore = SessionStore(
+    "user_states", SESSION_IDLE_TTL, SESSION_MAX_COUNT, SESSION_MEMORY_BUDGET,
+    backend=make_backend("user_states", SESSION_BACKEND),
+    snapshot=snapshot_user_state, rehydrate=rehydrate_user_state
+)
+chat_memory: SessionStore = SessionStore(
+    "chat_memory", SESSION_IDLE_TTL, SESSION_MAX_COUNT, SESSION_MEMORY_BUDGET // 10,
+    backend=make_backend("chat_memory", SESSION_BACKEND),
+    snapshot=snapshot_chat_memory
+)
+# генерация и отправка ответов привязываются в bot через reply_coalescer.bind()
+reply_coalescer = MessageCoalescer()
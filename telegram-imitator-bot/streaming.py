@@ -0,0 +1,50 @@
+import logging
+import time
+from typing import Any, Awaitable, Callable
+
+from config import STREAM_EDIT_INTERVAL
+
+logger = logging.getLogger(__name__)
+
+EditFunc = Callable[[str], Awaitable[Any]]
+
+
+class ThrottledEditor:
+    """Показывает ответ в одном сообщении по мере генерации.
+
+    update() правит сообщение не чаще interval секунд, промежуточный текст
+    просто запоминается; finish() всегда показывает окончательный ответ.
+    """
+
+    def __init__(self, edit: EditFunc, interval: float = STREAM_EDIT_INTERVAL):
+        self._edit = edit
+        self.interval = interval
+        self._shown = ""
+        self._last_edit = 0.0
+        self.edits = 0
+        self.first_edit_at: float = 0.0
+
+    async def _apply(self, text: str):
+        try:
+            await self._edit(text)
+        except Exception as e:
+            # правка не должна ломать генерацию: например, "message is not modified"
+            logger.debug(f"Не удалось обновить сообщение с ответом: {e}")
+            return
+        self._shown = text
+        self._last_edit = time.monotonic()
+        self.edits += 1
+        if not self.first_edit_at:
+            self.first_edit_at = self._last_edit
+
+    async def update(self, text: str):
+        text = text.strip()
+        if not text or text == self._shown:
+            return
+        if time.monotonic() - self._last_edit >= self.interval:
+            await self._apply(text)
+
+    async def finish(self, text: str) -> bool:
+        if text.strip() and text != self._shown:
+            await self._apply(text)
+        return text == self._shown
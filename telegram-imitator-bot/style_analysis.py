@@ -1,57 +1,293 @@
-from typing import List, Dict, Any
+from typing import List, Dict, Any, Iterable, Iterator, Optional
 from collections import Counter
+from itertools import chain, islice
 import random
+import re
+import string
 
-def analyze_style(messages: List[str]) -> Dict[str, Any]:
-    style_data = {
-        'common_words': [],
-        'common_phrases': [],
-        'message_lengths': [],
-        'punctuation': {},
-        'emojis': [],
-    }
+from corpus import Corpus
+from heavy_hitters import TopKCounter
+
+STOP_WORDS = frozenset([
+    "я", "ты", "он", "она", "мы", "вы", "они", "и", "в", "на", "а", "но", "что", "как", "не", "да", "ну"
+])
+PUNCTUATION = '!?.,;:'
+EMOJIS = ['😀', '😂', '😊', '😎', '😢', '😡', '😉', '❤']
+EMOJI_RE = re.compile('[' + ''.join(EMOJIS) + ']')
+EMOJI_SAMPLES_LIMIT = 20
+# сколько сообщений считать за раз в update(): частоты копятся в Counter пачкой
+STYLE_BATCH_SIZE = 5000
+# сколько частых слов/фраз держать точно; None — считать все (как Counter)
+TOPK_CAPACITY: Optional[int] = 2000
+STATS_VERSION = 2
 
-    for msg in messages:
-        if len(msg.split()) < 3:
-            continue  # отбрасываем короткие фразы
 
-        style_data['message_lengths'].append(len(msg))
+class StyleStats:
+    """Накопитель статистики стиля.
 
-        for char in msg:
-            if char in '!?.,;:':
-                style_data['punctuation'][char] = style_data['punctuation'].get(char, 0) + 1
+    add() учитывает одно сообщение, merge() добавляет другие накопители,
+    finalize() выдает тот же словарь, что и analyze_style(). Сериализуется
+    в компактный dict через to_dict()/from_dict() для хранения в профиле.
+    """
 
-        if any(c in msg for c in ['😀', '😂', '😊', '😎', '😢', '😡', '😉', '❤']):
-            style_data['emojis'].append(msg)
+    def __init__(self, capacity: Optional[int] = TOPK_CAPACITY):
+        self.word_counts = TopKCounter(capacity)
+        self.phrase_counts = TopKCounter(capacity)
+        self.punctuation: Counter = Counter()
+        self.message_count = 0
+        self.total_length = 0
+        self.emoji_message_count = 0
+        self.emoji_samples: List[str] = []
 
+    def add(self, msg: str) -> bool:
         words = msg.split()
-        style_data['common_words'].extend(words)
+        if len(words) < 3:
+            return False  # отбрасываем короткие фразы
+
+        self.message_count += 1
+        self.total_length += len(msg)
+
+        for char in PUNCTUATION:
+            count = msg.count(char)
+            if count:
+                self.punctuation[char] += count
+
+        if any(c in msg for c in EMOJIS):
+            self.emoji_message_count += 1
+            if len(self.emoji_samples) < EMOJI_SAMPLES_LIMIT:
+                self.emoji_samples.append(msg)
+
+        self.word_counts.update(words)
+        self.phrase_counts.update(' '.join(pair) for pair in zip(words, words[1:]))
+        return True
+
+    def update(self, messages: Iterable[str]) -> 'StyleStats':
+        if isinstance(messages, Corpus):
+            self._add_corpus(messages)
+            return self
+        for batch in _batches(messages, STYLE_BATCH_SIZE):
+            self._add_batch(batch)
+        return self
+
+    def _add_corpus(self, corpus: Corpus):
+        # корпус уже разбит на слова: считаем по id, строки собираем
+        # только для того, что осталось после сжатия TopKCounter
+        offsets, tokens = corpus.offsets, corpus.tokens
+        vocabulary = corpus.vocabulary.tokens
+        kept = [i for i, (start, end) in enumerate(zip(offsets, offsets[1:])) if end - start >= 3]
+        if not kept:
+            return
+
+        self.message_count += len(kept)
+        self.total_length += sum(corpus.lengths[i] for i in kept)
+
+        if len(kept) == len(corpus):
+            word_ids = Counter(tokens)
+        else:
+            word_ids = Counter(chain.from_iterable(corpus.word_ids(i) for i in kept))
+
+        for token_id, count in word_ids.items():
+            token = vocabulary[token_id]
+            if token.isalnum():
+                continue
+            for char in PUNCTUATION:
+                if char in token:
+                    self.punctuation[char] += token.count(char) * count
+
+        emoji_ids = {token_id for token_id in word_ids if EMOJI_RE.search(vocabulary[token_id])}
+        if emoji_ids:
+            for i in kept:
+                if not emoji_ids.isdisjoint(corpus.word_ids(i)):
+                    self.emoji_message_count += 1
+                    if len(self.emoji_samples) < EMOJI_SAMPLES_LIMIT:
+                        self.emoji_samples.append(corpus[i])
+
+        # пары соседних id по всему массиву, минус пары через границу сообщений
+        # и пары внутри отброшенных коротких сообщений
+        pair_ids = Counter(zip(tokens, tokens[1:]))
+        invalid = Counter()
+        for start, end in zip(offsets, offsets[1:]):
+            if start == end:
+                continue
+            if start:
+                invalid[tokens[start - 1], tokens[start]] += 1
+            if end - start == 2:
+                invalid[tokens[start], tokens[start + 1]] += 1
+        for pair, count in invalid.items():
+            left = pair_ids[pair] - count
+            if left > 0:
+                pair_ids[pair] = left
+            else:
+                del pair_ids[pair]
+
+        words = TopKCounter(self.word_counts.capacity)
+        words.update(word_ids)
+        phrases = TopKCounter(self.phrase_counts.capacity)
+        phrases.update(pair_ids)
+        words.counts = {vocabulary[token_id]: count for token_id, count in words.counts.items()}
+        phrases.counts = {f'{vocabulary[a]} {vocabulary[b]}': count for (a, b), count in phrases.counts.items()}
+        self.word_counts.merge(words)
+        self.phrase_counts.merge(phrases)
+
+    def _add_batch(self, batch: List[str]):
+        # то же, что add() для каждого сообщения, но счет идет в C-коде
+        # (Counter, str.count, re) по всей пачке, а не по одному сообщению
+        kept: List[str] = []
+        splits: List[List[str]] = []
+        for msg in batch:
+            words = msg.split()
+            if len(words) >= 3:
+                kept.append(msg)
+                splits.append(words)
+        if not kept:
+            return
 
-        if len(words) >= 2:
-            for i in range(len(words)-1):
-                phrase = ' '.join(words[i:i+2])
-                style_data['common_phrases'].append(phrase)
+        self.message_count += len(kept)
+        self.total_length += sum(map(len, kept))
 
-    # фильтрация слов
-    stop_words = set([
-        "я", "ты", "он", "она", "мы", "вы", "они", "и", "в", "на", "а", "но", "что", "как", "не", "да", "ну"
-    ])
+        text = '\n'.join(kept)
+        for char in PUNCTUATION:
+            count = text.count(char)
+            if count:
+                self.punctuation[char] += count
 
-    word_counts = Counter(style_data['common_words'])
-    phrase_counts = Counter(style_data['common_phrases'])
+        if EMOJI_RE.search(text):
+            emoji_messages = [msg for msg in kept if EMOJI_RE.search(msg)]
+            self.emoji_message_count += len(emoji_messages)
+            free = EMOJI_SAMPLES_LIMIT - len(self.emoji_samples)
+            if free > 0:
+                self.emoji_samples.extend(emoji_messages[:free])
 
-    filtered_keywords = [word for word, _ in word_counts.most_common(50) if word.lower() not in stop_words and len(word) > 3]
-    filtered_phrases = [phrase for phrase, _ in phrase_counts.most_common(10)]
+        self.word_counts.update(Counter(chain.from_iterable(splits)))
+        pairs = chain.from_iterable(zip(words, words[1:]) for words in splits)
+        self.phrase_counts.update(Counter(map(' '.join, pairs)))
 
-    avg_len = sum(style_data['message_lengths']) // len(style_data['message_lengths']) if style_data['message_lengths'] else 50
+    def merge(self, *others: 'StyleStats') -> 'StyleStats':
+        self.word_counts.merge(*(other.word_counts for other in others))
+        self.phrase_counts.merge(*(other.phrase_counts for other in others))
+        for other in others:
+            self.punctuation.update(other.punctuation)
+            self.message_count += other.message_count
+            self.total_length += other.total_length
+            self.emoji_message_count += other.emoji_message_count
+            free = EMOJI_SAMPLES_LIMIT - len(self.emoji_samples)
+            if free > 0:
+                self.emoji_samples.extend(other.emoji_samples[:free])
+        return self
 
+    def finalize(self) -> Dict[str, Any]:
+        filtered_keywords = [word for word, _ in self.word_counts.most_common(50) if word.lower() not in STOP_WORDS and len(word) > 3]
+        filtered_phrases = [phrase for phrase, _ in self.phrase_counts.most_common(10)]
+
+        avg_len = self.total_length // self.message_count if self.message_count else 50
+
+        return {
+            'keywords': filtered_keywords[:5],
+            'avg_len': avg_len,
+            'common_phrases': filtered_phrases,
+            'emojis': list(self.emoji_samples)
+        }
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            'v': STATS_VERSION,
+            'n': self.message_count,
+            'len': self.total_length,
+            'emoji_n': self.emoji_message_count,
+            'emoji': self.emoji_samples,
+            'punct': dict(self.punctuation),
+            'words': self.word_counts.to_dict(),
+            'phrases': self.phrase_counts.to_dict(),
+        }
+
+    @classmethod
+    def from_dict(cls, data: Dict[str, Any]) -> 'StyleStats':
+        stats = cls()
+        if not data or data.get('v') not in (1, STATS_VERSION):
+            return stats
+        stats.message_count = data.get('n', 0)
+        stats.total_length = data.get('len', 0)
+        stats.emoji_message_count = data.get('emoji_n', 0)
+        stats.emoji_samples = list(data.get('emoji', []))
+        stats.punctuation = Counter(data.get('punct', {}))
+        if data['v'] == 1:
+            # в первой версии частоты хранились целиком, обычным словарем
+            stats.word_counts.update(data.get('words', {}))
+            stats.phrase_counts.update(data.get('phrases', {}))
+        else:
+            stats.word_counts = TopKCounter.from_dict(data.get('words', {}))
+            stats.phrase_counts = TopKCounter.from_dict(data.get('phrases', {}))
+        return stats
+
+
+def _batches(messages: Iterable[str], size: int) -> Iterator[List[str]]:
+    iterator = iter(messages)
+    batch = list(islice(iterator, size))
+    while batch:
+        yield batch
+        batch = list(islice(iterator, size))
+
+
+def analyze_style(messages: List[str], capacity: Optional[int] = TOPK_CAPACITY) -> Dict[str, Any]:
+    return StyleStats(capacity).update(messages).finalize()
+
+
+def analyze_authors(by_author: Dict[str, List[str]], min_samples: int = 0,
+                    capacity: Optional[int] = TOPK_CAPACITY) -> Dict[str, StyleStats]:
+    """Статистика стиля сразу для всех авторов выгрузки.
+
+    Авторы, у которых меньше min_samples сообщений, пропускаются.
+    """
     return {
-        'keywords': filtered_keywords[:5],
-        'avg_len': avg_len,
-        'common_phrases': filtered_phrases,
-        'emojis': style_data['emojis']
+        name: StyleStats(capacity).update(messages)
+        for name, messages in by_author.items()
+        if len(messages) >= min_samples
     }
 
+# слова для отчета статистики: нижний регистр, без пунктуации и стоп-слов
+REPORT_STOP_WORDS = frozenset({
+    'в', 'на', 'с', 'и', 'не', 'я', 'ты', 'он', 'она', 'оно', 'мы', 'вы', 'они',
+    'что', 'как', 'а', 'ну', 'же', 'то', 'это', 'вот', 'бы', 'но', 'или', 'да',
+    'блять', 'сука', 'пиздец', 'хуй', 'ебать', 'бля', 'хули', 'мда', 'пон', 'окей', 'ок', 'нахуй', 'нихуя', 'ебаный', 'епта',
+    'че', 'мне', 'тебе', 'его', 'ее', 'нас', 'вас', 'их', 'мой', 'твой', 'свой', 'себе', 'меня', 'тебя',
+    'за', 'по', 'у', 'из', 'до', 'от', 'к', 'про', 'для', 'со', 'под', 'над', 'без',
+    'если', 'когда', 'тоже', 'так', 'нет', 'да', 'еще', 'уже', 'там', 'тут', 'все', 'всё', 'вообще', 'просто', 'типо',
+    'этот', 'эта', 'эти', 'тот', 'та', 'те', 'где', 'кто', 'какой', 'какая', 'какое', 'какие', 'который', 'которая',
+    'о', 'ж', 'бы', 'ль', 'ли', 'же', 'разве', 'спс', 'пж', 'хз', 'лол'
+})
+REPORT_TRANSLATOR = str.maketrans('', '', string.punctuation + '—«»”“`‘’')
+REPORT_TOPK_CAPACITY = 500
+
+
+def report_words(msg: str) -> List[str]:
+    return [
+        word for word in str(msg).lower().translate(REPORT_TRANSLATOR).split()
+        if len(word) > 1 and word not in REPORT_STOP_WORDS
+    ]
+
+
+def count_report_words(messages: Iterable[str], capacity: Optional[int] = REPORT_TOPK_CAPACITY) -> TopKCounter:
+    counter = TopKCounter(capacity)
+    if isinstance(messages, Corpus):
+        vocabulary = messages.vocabulary.tokens
+        corpus_counts: Dict[str, int] = {}
+        for token_id, count in messages.token_counts().items():
+            word = vocabulary[token_id].lower().translate(REPORT_TRANSLATOR)
+            if len(word) > 1 and word not in REPORT_STOP_WORDS:
+                corpus_counts[word] = corpus_counts.get(word, 0) + count
+        counter.update(corpus_counts)
+        return counter
+    for batch in _batches(messages, STYLE_BATCH_SIZE):
+        # нормализуем только уникальные токены пачки, а не весь текст
+        batch_counts: Dict[str, int] = {}
+        for token, count in Counter('\n'.join(map(str, batch)).split()).items():
+            word = token.lower().translate(REPORT_TRANSLATOR)
+            if len(word) > 1 and word not in REPORT_STOP_WORDS:
+                batch_counts[word] = batch_counts.get(word, 0) + count
+        counter.update(batch_counts)
+    return counter
+
+
 def inject_error(text, error_rate=0.1):
     words = text.split()
     errored_words = []
@@ -0,0 +1,67 @@
+# ZIP-архив экспорта: файлы переписки распаковываются не больше лимитов.
+
+import asyncio
+import io
+import zipfile
+
+import pytest
+
+from html_parser import ArchiveTooLarge, iter_export_members, list_export_members
+from import_pipeline import ExportArchiveError, ImportPipeline, analyze_export_archive
+
+
+def message_file(start: int, count: int) -> bytes:
+    return "".join(
+        f'<div class="message default clearfix" id="message{i}"><div class="body">'
+        f'<div class="from_name">Аня</div><div class="text">сообщение {i} {"ы" * 200}</div></div></div>'
+        for i in range(start, start + count)
+    ).encode("utf-8")
+
+
+def archive(*files: bytes) -> bytes:
+    buffer = io.BytesIO()
+    with zipfile.ZipFile(buffer, "w", zipfile.ZIP_DEFLATED) as zf:
+        for number, data in enumerate(files, start=1):
+            zf.writestr(f"ChatExport/messages{number if number > 1 else ''}.html", data)
+        zf.writestr("ChatExport/photos/photo_1.jpg", b"\0" * 10_000)
+    return buffer.getvalue()
+
+
+def analyze(source: bytes, **limits):
+    async def run():
+        pipeline = ImportPipeline(2, 10, "thread")
+        await pipeline.start()
+        try:
+            return await analyze_export_archive(pipeline, source, 3, **limits)
+        finally:
+            await pipeline.stop()
+    return asyncio.run(run())
+
+
+def test_archive_within_limits():
+    source = archive(message_file(1, 50), message_file(51, 50))
+    export = analyze(source, max_member_size=2**20, max_total_size=2**20)
+    assert export["total_messages"] == 100 and not export["parse_errors"]
+
+
+def test_member_over_limit_is_rejected_by_header():
+    source = archive(message_file(1, 10), message_file(11, 500))
+    with pytest.raises(ArchiveTooLarge, match="messages2.html"):
+        list_export_members(source, max_member_size=64 * 1024)
+    with pytest.raises(ExportArchiveError, match="слишком большой"):
+        analyze(source, max_member_size=64 * 1024)
+
+
+def test_total_over_limit_is_rejected():
+    files = [message_file(i * 100 + 1, 100) for i in range(4)]
+    size = len(files[0])
+    with pytest.raises(ExportArchiveError, match="слишком большой"):
+        analyze(archive(*files), max_total_size=3 * size)
+
+
+def test_member_read_stops_at_limit():
+    # заголовки не проверялись: чтение все равно обрывается на лимите
+    source = archive(message_file(1, 500))
+    members = list_export_members(source)
+    with pytest.raises(ArchiveTooLarge):
+        list(iter_export_members(source, members, max_member_size=64 * 1024))
@@ -0,0 +1,62 @@
+# Сохранение импорта: файл запоминается в кэше импортов, только если
+# все профили действительно записаны в базу.
+
+import asyncio
+
+import pytest
+
+import database
+from import_cache import fingerprint
+from import_pipeline import analyze_export
+from import_saving import save_export
+
+EXPORT = ('<div class="page_header"><div class="content"><div class="text bold">Аня</div></div></div>' + "".join(
+    f'<div class="message default clearfix" id="message{i}"><div class="body">'
+    f'<div class="from_name">{"Аня" if i % 2 else "Боря"}</div>'
+    f'<div class="text">сообщение номер {i}</div></div></div>'
+    for i in range(1, 21)
+)).encode("utf-8")
+
+
+@pytest.fixture
+def db(tmp_path, monkeypatch):
+    monkeypatch.setattr(database, "DB_PATH", str(tmp_path / "test.db"))
+    monkeypatch.setattr(database, "conn", None)
+    conn = database.init_db()
+    yield conn
+    conn.close()
+
+
+def fail_inserts(conn):
+    conn.execute(
+        """CREATE TEMP TRIGGER fail_insert BEFORE INSERT ON imitation_data
+        BEGIN SELECT RAISE(ABORT, 'disk I/O error'); END"""
+    )
+
+
+def import_export(user_id: int):
+    export = analyze_export(EXPORT, 3, "messages.html")
+    return asyncio.run(save_export(user_id, "Аня", export, "file-1", fingerprint(EXPORT, "html"), 3))
+
+
+def test_first_merge_reports_failed_save(db):
+    fail_inserts(db)
+    assert database.merge_messages(1, "Аня", ["привет", "как дела"], min_samples=1) == -1
+    assert database.get_saved_targets(1) == []
+
+
+def test_failed_first_import_is_not_recorded(db):
+    fail_inserts(db)
+    saved = import_export(1)
+    assert saved["complete"] is False
+    assert saved["your_added"] == -1 and saved["saved_others"] == 0
+    assert database.find_import(1, file_unique_id="file-1") is None
+    assert database.find_import(1, content_hash=fingerprint(EXPORT, "html")["content_hash"]) is None
+
+
+def test_saved_import_is_recorded(db):
+    saved = import_export(1)
+    assert saved["complete"] is True
+    assert saved["your_added"] == 10
+    assert database.find_import(1, file_unique_id="file-1") is not None
+    assert sorted(database.get_saved_targets(1)) == ["Аня", "Боря"]
@@ -0,0 +1,56 @@
+# Восстановление вытесненных сессий из снимков.
+
+import asyncio
+
+import pytest
+
+from session_store import MemorySessionBackend, SessionStore
+
+
+def make_store(rehydrate):
+    return SessionStore("test", idle_ttl=60, max_sessions=1, memory_budget=2**20,
+                        backend=MemorySessionBackend(), rehydrate=rehydrate)
+
+
+def test_concurrent_loads_share_one_restore():
+    calls = []
+
+    async def rehydrate(user_id, snapshot):
+        calls.append(user_id)
+        await asyncio.sleep(0.01)
+        return dict(snapshot, restored=True)
+
+    async def test():
+        store = make_store(rehydrate)
+        store[1] = {"target": "Аня"}
+        store[2] = {"target": "Боря"}  # max_sessions=1: сессия 1 вытеснена в снимок
+        assert 1 not in store
+        first, second = await asyncio.gather(store.load(1), store.load(1))
+        # снимок в памяти больше не нужен
+        assert await store.backend.load(1) is None
+        return store, first, second
+
+    store, first, second = asyncio.run(test())
+    assert first is second
+    assert first == {"target": "Аня", "restored": True}
+    assert calls == [1] and store.rehydrations == 1
+
+
+def test_failed_restore_keeps_snapshot():
+    attempts = []
+
+    async def rehydrate(user_id, snapshot):
+        attempts.append(user_id)
+        if len(attempts) == 1:
+            raise RuntimeError("database is locked")
+        return snapshot
+
+    async def test():
+        store = make_store(rehydrate)
+        store[1] = {"target": "Аня"}
+        store[2] = {"target": "Боря"}
+        with pytest.raises(RuntimeError):
+            await store.load(1)
+        return await store.load(1)
+
+    assert asyncio.run(test()) == {"target": "Аня"}
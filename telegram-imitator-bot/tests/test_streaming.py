@@ -0,0 +1,127 @@
+# Потоковые ответы: разбор SSE от локального aiohttp-сервера и
+# окончательная правка сообщения в ThrottledEditor.
+
+import asyncio
+import json
+from typing import List
+
+from aiohttp import web
+from aiohttp.test_utils import TestServer
+
+from llm_client import LLMClient, iter_sse_data
+from streaming import ThrottledEditor
+
+
+def chunk(content: str) -> str:
+    return json.dumps({"choices": [{"delta": {"content": content}}]}, ensure_ascii=False)
+
+
+# события разделены пустыми строками; keep-alive комментарии, CRLF,
+# событие из нескольких полей data и все, что после [DONE], не должно попасть в текст
+SSE_BODY = (
+    ": OPENROUTER PROCESSING\n\n"
+    f"data: {chunk('При')}\n\n"
+    f"data: {chunk('вет')}\r\n\r\n"
+    ": keep-alive\r\n"
+    'data: {"choices": [{"delta":\n'
+    'data: {"content": ", как дела?"}}]}\n'
+    "\n"
+    "event: ping\n"
+    "id: 7\n\n"
+    "data: [DONE]\n\n"
+    f"data: {chunk(' лишнее')}\n\n"
+)
+
+
+async def sse_handler(request: web.Request) -> web.StreamResponse:
+    response = web.StreamResponse(headers={"Content-Type": "text/event-stream"})
+    await response.prepare(request)
+    # по байтам кусками, разрезающими строки и UTF-8 последовательности событий
+    body = SSE_BODY.encode("utf-8")
+    for start in range(0, len(body), 7):
+        await response.write(body[start:start + 7])
+    await response.write_eof()
+    return response
+
+
+async def with_server(test):
+    app = web.Application()
+    app.router.add_post("/chat", sse_handler)
+    server = TestServer(app)
+    await server.start_server()
+    try:
+        return await test(str(server.make_url("/chat")))
+    finally:
+        await server.close()
+
+
+def test_iter_sse_data_joins_events():
+    async def test(url: str) -> List[str]:
+        client = LLMClient()
+        await client.start()
+        try:
+            async with client.session.post(url) as response:
+                return [data async for data in iter_sse_data(response.content)]
+        finally:
+            await client.close()
+
+    events = asyncio.run(with_server(test))
+    assert events == [
+        chunk("При"),
+        chunk("вет"),
+        '{"choices": [{"delta":\n{"content": ", как дела?"}}]}',
+        "[DONE]",
+        chunk(" лишнее"),
+    ]
+
+
+def test_stream_json_assembles_text_until_done():
+    async def test(url: str) -> str:
+        client = LLMClient()
+        await client.start()
+        try:
+            parts = []
+            async for event in client.stream_json(url, headers={}, payload={"stream": True}):
+                parts.append(event["choices"][0]["delta"]["content"])
+            assert client.requests == 1 and client.errors == 0
+            return "".join(parts)
+        finally:
+            await client.close()
+
+    assert asyncio.run(with_server(test)) == "Привет, как дела?"
+
+
+def test_throttled_editor_finish_reports_failed_edit():
+    edits: List[str] = []
+
+    async def edit(text: str):
+        if text == "Привет, как дела?":
+            raise RuntimeError("Bad Request: message to edit not found")
+        edits.append(text)
+
+    async def test() -> bool:
+        editor = ThrottledEditor(edit, interval=0)
+        await editor.update("При")
+        await editor.update("Привет")
+        return await editor.finish("Привет, как дела?")
+
+    # окончательный текст не показан — вызывающий отправляет его новым сообщением
+    assert asyncio.run(test()) is False
+    assert edits == ["При", "Привет"]
+
+
+def test_throttled_editor_finish_after_shown_text():
+    edits: List[str] = []
+
+    async def edit(text: str):
+        edits.append(text)
+
+    async def test() -> bool:
+        editor = ThrottledEditor(edit, interval=60)
+        await editor.update("При")
+        await editor.update("Привет")
+        return await editor.finish("Привет")
+
+    # промежуточная правка пропущена из-за интервала, finish показывает итог
+    assert asyncio.run(test()) is True
+    assert edits == ["При", "Привет"]